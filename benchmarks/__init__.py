@@ -0,0 +1,5 @@
+""" Benchmarks for the Sean GPT API and its file processing pipeline.
+
+Unlike the tests, which run against a deployed cluster, the benchmarks run in-process against
+stand-ins for the external services, so that they measure the application code alone.
+"""
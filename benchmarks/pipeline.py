@@ -0,0 +1,255 @@
+""" Benchmarks the file processing pipeline end to end.
+
+Synthetic text files are queued for stage 1 (txtfile2chunk), and both stages run concurrently in
+this process until every file is announced complete.  RabbitMQ, MinIO, milvus, postgres and the
+OpenAI embeddings endpoint are replaced by the in-process stand-ins in `tests.util.standins`, with
+optional fixed latencies, so the numbers reflect the pipeline code and its batching.  With
+`--vector-store local`, the chunks are stored in a real `LocalVectorStore` instead of the milvus
+stand-in.
+
+Each corpus size runs in its own subprocess, so that peak RSS is measured per size.
+
+Reported per corpus size:
+    - chunks/second, from the first file queued to the last file complete
+    - stage 1 latency per file, from dequeueing the file ID to publishing its last chunk
+    - stage 2 latency per batch, from receiving the batch to storing and counting it
+    - end-to-end latency per file, from queueing the file ID to its completion announcement
+    - peak RSS of the process
+
+Usage:
+    python -m benchmarks.pipeline [--size 1MB --size 1GB ...] [--files N] [--consumers N]
+        [--embedding-latency-ms MS] [--milvus-latency-ms MS] [--rate-limited]
+        [--vector-store standin|local]
+"""
+from contextlib import redirect_stdout
+from unittest.mock import patch
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlmodel import Session, select
+from sqlalchemy import func
+
+from sean_gpt.config import settings
+from sean_gpt.model.file import (File, FILE_STATUS_AWAITING_PROCESSING, FILE_STATUS_COMPLETE,
+                                 TextFileChunkingStatus)
+from sean_gpt.util.embedding import EmbeddingScheduler
+from sean_gpt.util.vector_store import LocalVectorStore
+import sean_gpt.util.database
+from sean_gpt.file_processing import util
+
+from tests.util.standins import (StandInBroker, StandInCollection, StandInMinio,
+                                 make_sqlite_engine, make_standin_embeddings_create,
+                                 standin_connect)
+
+from .util import percentiles
+
+DEFAULT_SIZES = ("1MB", "16MB", "128MB", "1GB")
+_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+def parse_size(size: str) -> int:
+    """ Parses a size such as '512KB', '16MB' or '1GB' into a number of bytes. """
+    size = size.strip().upper()
+    for unit, multiplier in _UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * multiplier)
+    return int(size)
+
+def import_stages(embedding_latency_sec: float, rate_limited: bool):
+    """ Imports the pipeline stages with the milvus and OpenAI stand-ins in place.
+
+    The stages connect to milvus and build their embedding scheduler at import time, so the
+    stand-ins must be patched in first.
+    """
+    patch('pymilvus.connections.connect', new=standin_connect).start()
+    patch('pymilvus.Collection', new=StandInCollection).start()
+    patch('sean_gpt.util.vector_store.Collection', new=StandInCollection).start()
+    patch('sean_gpt.routers.mock.openai.startup').start()
+    patch('openai.resources.AsyncEmbeddings.create',
+          new=make_standin_embeddings_create(embedding_latency_sec)).start()
+    # pylint: disable=import-outside-toplevel
+    from sean_gpt.file_processing import stage_txtfile2chunk, stage_chunk2embedding
+    if rate_limited:
+        stage_chunk2embedding.embedding_scheduler = EmbeddingScheduler()
+    else:
+        unlimited = 10 ** 12
+        stage_chunk2embedding.embedding_scheduler = EmbeddingScheduler(
+            tokens_per_minute=unlimited, requests_per_minute=unlimited)
+    return stage_txtfile2chunk, stage_chunk2embedding
+
+def timed(coroutine_function, latencies: list):
+    """ Wraps a coroutine function, appending the duration of each call to `latencies`. """
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await coroutine_function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+async def run_pipeline( # pylint: disable=too-many-locals
+    args, stage_txtfile2chunk, stage_chunk2embedding) -> dict:
+    """ Runs both stages over a synthetic corpus and returns the measurements. """
+    corpus_size = parse_size(args.size)
+    broker = StandInBroker(latency_sec=args.broker_latency_ms / 1000)
+    minio = StandInMinio(latency_sec=args.minio_latency_ms / 1000)
+    StandInCollection.latency_sec = args.milvus_latency_ms / 1000
+    database_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+    engine = make_sqlite_engine(os.path.join(database_dir.name, "benchmark.db"))
+    vector_store = stage_chunk2embedding.vector_store
+    if args.vector_store == "local":
+        vector_store = LocalVectorStore(path=os.path.join(database_dir.name, "vector_store"),
+                                        dim=settings.app_text_embedding_model_dim)
+
+    # Create the file records and objects
+    file_ids = []
+    with Session(engine) as session:
+        for index in range(args.files):
+            file_size = corpus_size // args.files + (index < corpus_size % args.files)
+            file_record = File(owner_id=uuid.uuid4(), default_share_set_id=uuid.uuid4(),
+                               status=FILE_STATUS_AWAITING_PROCESSING, name=f"file {index}.txt",
+                               type="txt", hash=uuid.uuid4().hex, size=file_size)
+            session.add(file_record)
+            file_ids.append(str(file_record.id))
+            minio.put_synthetic_object(str(file_record.id), file_size)
+        session.commit()
+
+    stage1_latencies, stage2_latencies = [], []
+    queued_at, completed_at = {}, {}
+    all_complete = asyncio.Event()
+
+    async def record_file_status(file_id, status):
+        if status == FILE_STATUS_COMPLETE:
+            completed_at[file_id] = time.perf_counter()
+            if len(completed_at) == len(file_ids):
+                all_complete.set()
+
+    async def stop_when_complete():
+        await all_complete.wait()
+        util.shutdown_requested.set()
+
+    with patch.object(util, 'get_rabbitmq_channel', new=broker.channel), \
+         patch.object(util, 'announce_file_status', new=record_file_status), \
+         patch.object(sean_gpt.util.database, '_DB_ENGINE', new=engine), \
+         patch.object(stage_txtfile2chunk, 'get_minio_client', new=lambda: minio), \
+         patch.object(stage_txtfile2chunk, 'vector_store', new=vector_store), \
+         patch.object(stage_chunk2embedding, 'vector_store', new=vector_store), \
+         patch.object(stage_txtfile2chunk, 'chunk_file',
+                      new=timed(stage_txtfile2chunk.chunk_file, stage1_latencies)), \
+         patch.object(stage_chunk2embedding, 'process_batch',
+                      new=timed(stage_chunk2embedding.process_batch, stage2_latencies)), \
+         redirect_stdout(io.StringIO() if not args.verbose else sys.stdout):
+        start = time.perf_counter()
+        for file_id in file_ids:
+            queued_at[file_id] = time.perf_counter()
+            await broker.publish(settings.app_file_processing_stage_txtfile2chunk_topic_name,
+                                 json.dumps({'file_id': file_id}).encode('utf-8'))
+        await asyncio.gather(
+            stage_txtfile2chunk.main(idle_timeout_sec=None),
+            stage_chunk2embedding.main(idle_timeout_sec=None, num_consumers=args.consumers),
+            stop_when_complete())
+        elapsed = time.perf_counter() - start
+    with Session(engine) as session:
+        num_chunks = session.exec(select(func.sum(TextFileChunkingStatus.total_chunks))).one()
+    engine.dispose()
+    database_dir.cleanup()
+
+    return {
+        'size': args.size,
+        'files': args.files,
+        'chunks': num_chunks,
+        'seconds': elapsed,
+        'chunks_per_second': num_chunks / elapsed,
+        'milvus_inserts': StandInCollection.num_inserts,
+        'milvus_flushes': StandInCollection.num_flushes,
+        'stage1_file_latency_sec': percentiles(stage1_latencies),
+        'stage2_batch_latency_sec': percentiles(stage2_latencies),
+        'end_to_end_file_latency_sec': percentiles(
+            [completed - queued_at[file_id] for file_id, completed in completed_at.items()]),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def run_size(args) -> dict:
+    """ Runs the benchmark for one corpus size in this process. """
+    stages = import_stages(args.embedding_latency_ms / 1000, args.rate_limited)
+    return asyncio.run(run_pipeline(args, *stages))
+
+def run_sizes_in_subprocesses(args, argv) -> list:
+    """ Runs the benchmark for each corpus size in its own subprocess. """
+    results = []
+    for size in args.sizes or DEFAULT_SIZES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.pipeline", *argv, "--single", size],
+            check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return results
+
+def print_report(results: list):
+    """ Prints a table of the results. """
+    def milliseconds(seconds_list):
+        return "/".join(f"{seconds * 1000:.0f}" for seconds in seconds_list)
+    header = (f"{'corpus':>8} {'chunks':>9} {'seconds':>8} {'chunks/s':>9} "
+              f"{'stage 1 p50/95/99 ms':>22} {'stage 2 p50/95/99 ms':>22} "
+              f"{'e2e p50/95/99 ms':>22} {'peak RSS MB':>12}")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(f"{result['size']:>8} {result['chunks']:>9} {result['seconds']:>8.2f} "
+              f"{result['chunks_per_second']:>9.0f} "
+              f"{milliseconds(result['stage1_file_latency_sec']):>22} "
+              f"{milliseconds(result['stage2_batch_latency_sec']):>22} "
+              f"{milliseconds(result['end_to_end_file_latency_sec']):>22} "
+              f"{result['peak_rss_mb']:>12.0f}")
+
+def main(argv=None):
+    """ Parses the arguments and runs the benchmark. """
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description="Benchmark the file processing pipeline.")
+    parser.add_argument("--size", dest="sizes", action="append",
+                        help="A corpus size, e.g. 1MB or 1GB.  May be repeated.  Defaults to "
+                             f"{', '.join(DEFAULT_SIZES)}.")
+    parser.add_argument("--files", type=int, default=8,
+                        help="The number of files the corpus is split into.")
+    parser.add_argument("--consumers", type=int,
+                        default=settings.app_chunk2embedding_num_consumers,
+                        help="The number of stage 2 consumers.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0,
+                        help="The latency of each embedding request.")
+    parser.add_argument("--milvus-latency-ms", type=float, default=0,
+                        help="The latency of each milvus insert and flush.")
+    parser.add_argument("--minio-latency-ms", type=float, default=0,
+                        help="The latency of each minio block read.")
+    parser.add_argument("--broker-latency-ms", type=float, default=0,
+                        help="The latency of each message publish.")
+    parser.add_argument("--vector-store", choices=("standin", "local"), default="standin",
+                        help="Store the chunks in the milvus stand-in, or in a local vector store "
+                             "on disk.")
+    parser.add_argument("--rate-limited", action="store_true",
+                        help="Apply the configured OpenAI rate limits to the embedding requests.")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON instead of a table.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the pipeline's own output.")
+    parser.add_argument("--single", dest="size", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.size:
+        print(json.dumps(run_size(args)))
+        return
+    results = run_sizes_in_subprocesses(args, argv)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+if __name__ == "__main__":
+    main()
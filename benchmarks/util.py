@@ -0,0 +1,11 @@
+""" Helpers shared by the benchmarks.
+"""
+from typing import List
+
+import numpy as np
+
+def percentiles(values: List[float], quantiles=(50, 95, 99)) -> List[float]:
+    """ Returns the given percentiles of the values, or NaNs if there are none. """
+    if not values:
+        return [float('nan')] * len(quantiles)
+    return np.percentile(values, quantiles).tolist()
@@ -0,0 +1,245 @@
+""" Benchmarks the recall and latency of the milvus embedding index against FLAT ground truth.
+
+A temporary collection is filled with embeddings, either synthetic (clustered, like text
+embeddings) or sampled from an existing collection, and indexed with FLAT to find the exact nearest
+neighbours of a set of query embeddings.  The index is then rebuilt as HNSW or IVF and searched once
+for each ef or nprobe, so these can be tuned for a corpus of a given size.  The temporary collection
+is dropped afterwards.
+
+The same embeddings are also searched in a `LocalVectorStore`, an exact in-process baseline for the
+milvus numbers.  This benchmark needs a milvus server, unlike `benchmarks.pipeline`, unless it is
+run with `--local-only`.
+
+Reported per index and search parameter:
+    - recall@k, the fraction of the exact k nearest neighbours found
+    - search latency p50/95/99, one query per request
+    - index build time
+
+Usage:
+    python -m benchmarks.vector_index [--host HOST] [--rows N] [--index-type HNSW]
+        [--ef 16 --ef 64 ...] [--nprobe 8 ...] [--source-collection NAME] [--local-only]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+import uuid
+
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, connections, utility
+import numpy as np
+
+from sean_gpt.config import settings
+from sean_gpt.util.vector_store import (IVF_INDEX_TYPES, LocalVectorStore, index_params,
+                                        search_params)
+
+from .util import percentiles
+
+DEFAULT_EF = (16, 32, 64, 128, 256)
+DEFAULT_NPROBE = (1, 4, 16, 64)
+INSERT_BATCH_SIZE = 5000
+
+def synthetic_embeddings(rows: int, dim: int, seed: int, num_clusters: int = 256) -> np.ndarray:
+    """ Returns unit-length embeddings drawn around random cluster centres.
+
+    Text embeddings are far from uniform; clustering them makes the index behave more like it does
+    on a real corpus.
+    """
+    generator = np.random.default_rng(seed)
+    centres = generator.standard_normal((num_clusters, dim), dtype=np.float32)
+    embeddings = (centres[generator.integers(num_clusters, size=rows)] +
+                  0.5 * generator.standard_normal((rows, dim), dtype=np.float32))
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def sample_embeddings(collection_name: str, rows: int) -> np.ndarray:
+    """ Returns up to `rows` embeddings from an existing collection. """
+    collection = Collection(name=collection_name)
+    collection.load()
+    iterator = collection.query_iterator(batch_size=1000, limit=rows, expr='chunk_id >= 0',
+                                         output_fields=['chunk_embedding'])
+    embeddings = []
+    try:
+        while page := iterator.next():
+            embeddings.extend(row['chunk_embedding'] for row in page)
+    finally:
+        iterator.close()
+    return np.asarray(embeddings, dtype=np.float32)
+
+def create_collection(name: str, embeddings: np.ndarray) -> Collection:
+    """ Creates a collection holding the embeddings, with their row numbers as IDs. """
+    schema = CollectionSchema(fields=[
+        FieldSchema(name="row", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="chunk_embedding", dtype=DataType.FLOAT_VECTOR,
+                    dim=embeddings.shape[1]),
+    ], description="Vector index benchmark")
+    collection = Collection(name=name, schema=schema)
+    for start in range(0, len(embeddings), INSERT_BATCH_SIZE):
+        batch = embeddings[start:start + INSERT_BATCH_SIZE]
+        collection.insert([list(range(start, start + len(batch))), batch.tolist()])
+    collection.flush()
+    return collection
+
+def build_index(collection: Collection, index_type: str) -> float:
+    """ Replaces the index of the collection and loads it.  Returns the build time in seconds. """
+    collection.release()
+    if collection.has_index():
+        collection.drop_index()
+    start = time.perf_counter()
+    collection.create_index(field_name="chunk_embedding", index_params=index_params(index_type))
+    utility.wait_for_index_building_complete(collection.name)
+    elapsed = time.perf_counter() - start
+    collection.load()
+    return elapsed
+
+def search_all(collection: Collection, queries: np.ndarray, limit: int, param: dict):
+    """ Searches for each query in its own request.
+
+    Returns:
+        Tuple[List[List[int]], List[float]]: The IDs found for each query, and the latencies.
+    """
+    found, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = collection.search(data=[query.tolist()], anns_field="chunk_embedding",
+                                    limit=limit, param=param)
+        latencies.append(time.perf_counter() - start)
+        found.append(list(results[0].ids))
+    return found, latencies
+
+def benchmark_local_store(embeddings: np.ndarray, queries: np.ndarray, limit: int):
+    """ Stores the embeddings in a local vector store and searches it for each query.
+
+    Returns:
+        Tuple[List[List[int]], List[float], float]: The rows found for each query, the latencies,
+            and the time taken to insert the embeddings.
+    """
+    async def search_all_local(store: LocalVectorStore):
+        found, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = await store.search(query.tolist(), limit, output_fields=['chunk_location'])
+            latencies.append(time.perf_counter() - start)
+            found.append([hit['chunk_location'] for hit in hits])
+        return found, latencies
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(path=path, dim=embeddings.shape[1])
+        start = time.perf_counter()
+        for start_row in range(0, len(embeddings), INSERT_BATCH_SIZE):
+            batch = embeddings[start_row:start_row + INSERT_BATCH_SIZE]
+            # The row number is stored as the chunk location, to compare with the ground truth
+            store.insert([''] * len(batch), list(range(start_row, start_row + len(batch))), batch,
+                         [''] * len(batch))
+        build_seconds = time.perf_counter() - start
+        found, latencies = asyncio.run(search_all_local(store))
+    return found, latencies, build_seconds
+
+def recall(found: list, ground_truth: list) -> float:
+    """ Returns the mean fraction of the true nearest neighbours that were found. """
+    return float(np.mean([len(set(ids) & set(true_ids)) / len(true_ids)
+                          for ids, true_ids in zip(found, ground_truth) if true_ids]))
+
+def run_benchmark(args) -> list: # pylint: disable=too-many-locals
+    """ Builds the indexes, runs the searches and returns the measurements. """
+    index_type = (args.index_type or settings.milvus_index_type).upper()
+    if not args.local_only:
+        connections.connect(host=args.host, port=args.port)
+    if args.source_collection:
+        embeddings = sample_embeddings(args.source_collection, args.rows + args.queries)
+    else:
+        embeddings = synthetic_embeddings(args.rows + args.queries,
+                                          args.dim or settings.app_text_embedding_model_dim,
+                                          args.seed)
+    # Hold some embeddings out as queries, so they are not in the collection
+    queries, embeddings = embeddings[:args.queries], embeddings[args.queries:]
+    local_found, latencies, build_seconds = benchmark_local_store(embeddings, queries, args.limit)
+    local_result = {'index_type': "local", 'param': {}, 'recall': 1.0,
+                    'latency_sec': percentiles(latencies), 'build_seconds': build_seconds}
+    if args.local_only:
+        return [local_result]
+    collection = create_collection(f"vector_index_benchmark_{uuid.uuid4().hex}", embeddings)
+    results = [local_result]
+    try:
+        build_seconds = build_index(collection, "FLAT")
+        ground_truth, latencies = search_all(collection, queries, args.limit,
+                                             search_params(args.limit, "FLAT"))
+        local_result['recall'] = recall(local_found, ground_truth)
+        results.append({'index_type': "FLAT", 'param': {}, 'recall': 1.0,
+                        'latency_sec': percentiles(latencies), 'build_seconds': build_seconds})
+        if index_type == "FLAT":
+            return results
+        build_seconds = build_index(collection, index_type)
+        if index_type == "HNSW":
+            sweep = [{'ef': ef} for ef in args.ef or DEFAULT_EF]
+        elif index_type in IVF_INDEX_TYPES:
+            sweep = [{'nprobe': nprobe} for nprobe in args.nprobe or DEFAULT_NPROBE]
+        else:
+            raise ValueError(f"Unsupported milvus index type '{index_type}'.")
+        for param in sweep:
+            found, latencies = search_all(collection, queries, args.limit,
+                                          search_params(args.limit, index_type, **param))
+            results.append({'index_type': index_type, 'param': param,
+                            'recall': recall(found, ground_truth),
+                            'latency_sec': percentiles(latencies),
+                            'build_seconds': build_seconds})
+    finally:
+        collection.release()
+        utility.drop_collection(collection.name)
+    return results
+
+def print_report(results: list, args):
+    """ Prints a table of the results. """
+    header = (f"{'index':>9} {'param':>12} {f'recall@{args.limit}':>10} "
+              f"{'p50/95/99 ms':>20} {'build s':>8}")
+    print(f"{args.rows} rows, {args.queries} queries")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        param = ", ".join(f"{key}={value}" for key, value in result['param'].items()) or "-"
+        latency = "/".join(f"{seconds * 1000:.1f}" for seconds in result['latency_sec'])
+        print(f"{result['index_type']:>9} {param:>12} {result['recall']:>10.3f} "
+              f"{latency:>20} {result['build_seconds']:>8.1f}")
+
+def main(argv=None):
+    """ Parses the arguments and runs the benchmark. """
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recall and latency of the milvus embedding index.")
+    parser.add_argument("--host", default=settings.milvus_host, help="The milvus host.")
+    parser.add_argument("--port", default=settings.milvus_port, help="The milvus port.")
+    parser.add_argument("--rows", type=int, default=50000,
+                        help="The number of embeddings in the collection.")
+    parser.add_argument("--queries", type=int, default=200, help="The number of queries.")
+    parser.add_argument("--limit", type=int, default=10, help="The k of recall@k.")
+    parser.add_argument("--dim", type=int,
+                        help="The dimension of synthetic embeddings.  Defaults to the dimension "
+                             "of the embedding model.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of synthetic embeddings.")
+    parser.add_argument("--source-collection",
+                        help="Sample the embeddings from this collection instead of generating "
+                             "them.")
+    parser.add_argument("--index-type", type=str.upper,
+                        choices=("FLAT", "HNSW", *IVF_INDEX_TYPES),
+                        help="The index to compare with FLAT.  Defaults to the configured index "
+                             "type.")
+    parser.add_argument("--ef", type=int, action="append",
+                        help="An HNSW ef to search with.  May be repeated.  Defaults to "
+                             f"{', '.join(map(str, DEFAULT_EF))}.")
+    parser.add_argument("--nprobe", type=int, action="append",
+                        help="An IVF nprobe to search with.  May be repeated.  Defaults to "
+                             f"{', '.join(map(str, DEFAULT_NPROBE))}.")
+    parser.add_argument("--local-only", action="store_true",
+                        help="Only benchmark the local vector store, without milvus.")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON instead of a table.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results, args)
+
+if __name__ == "__main__":
+    main()
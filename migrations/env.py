@@ -54,7 +54,8 @@ if generate_or_migrate == 'generate':
     from sean_gpt.model.chat import Chat
     from sean_gpt.model.message import Message
     from sean_gpt.model.verification_token import VerificationToken
-    from sean_gpt.model.file import File, ShareSet, FileShareSetLink, TextFileChunkingStatus
+    from sean_gpt.model.file import (File, ShareSet, FileShareSetLink, TextFileChunkingStatus,
+                                     ProcessedChunk)
 elif generate_or_migrate == 'migrate':
     # setup for migrations
     if migrate_outside_kubernetes:
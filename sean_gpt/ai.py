@@ -1,20 +1,32 @@
 """ AI model functions. """
+from typing import List, Tuple
+import asyncio
 import json
+import time
 
 from sqlmodel import Session, select
 from openai.types.chat import ChatCompletionToolParam
 from openai.types.shared_params import FunctionDefinition
-from pymilvus import connections, Collection
-import openai
+from prometheus_client import Histogram
 
 from .config import settings
 from .model.ai import AI
 from .util.database import get_db_engine
+from .util.embedding import embed_query
+from .util.ttl_cache import TTLCache
+from .util.vector_store import vector_store
 
-openai_client = openai.OpenAI(api_key = settings.openai_api_key)
+TOOL_LATENCY_SECONDS = Histogram(
+    'sean_gpt_tool_latency_seconds',
+    "Time taken by tool calls, by tool and outcome (ok, error or timeout).",
+    ['tool', 'outcome'])
+
+# AI rows by name.  The rows are only ever created, so a cached row is never stale; the TTL bounds
+# how long a row deleted directly in the database is still served.
+_AI_CACHE = TTLCache(max_entries=64, ttl_seconds=settings.app_ai_cache_ttl_seconds)
 
 def get_ai(name: str) -> AI | None:
-    """ Gets an AI from the database.
+    """ Gets an AI from the cache, or else from the database.
     
     Args:
         session (Session): The database session.
@@ -23,9 +35,15 @@ def get_ai(name: str) -> AI | None:
     Returns:
         AI: The AI with the specified name or None.
     """
+    ai = _AI_CACHE.get(name)
+    if ai is not None:
+        return ai
     db_engine = get_db_engine()
     with Session(db_engine) as session:
-        return session.exec(select(AI).where(AI.name == name)).first()
+        ai = session.exec(select(AI).where(AI.name == name)).first()
+    if ai is not None:
+        _AI_CACHE.set(name, ai)
+    return ai
 
 def create_ai(name: str) -> AI:
     """ Creates an AI in the database.
@@ -43,8 +61,18 @@ def create_ai(name: str) -> AI:
         session.add(ai)
         session.commit()
         session.refresh(ai)
+    # Replace anything cached under this name
+    invalidate_ai(name)
     return ai
 
+def invalidate_ai(name: str):
+    """ Removes an AI from the cache, so that the next lookup reads it from the database.
+
+    Args:
+        name (str): The name of the AI.
+    """
+    _AI_CACHE.invalidate(name)
+
 def default_ai() -> AI:
     """ Retrieve the default AI model.
     
@@ -54,22 +82,14 @@ def default_ai() -> AI:
     return get_ai(settings.app_default_ai_model) or create_ai(settings.app_default_ai_model)
 
 # TODO: This is a hack.  Fix it.
-def get_molten_salt_documents(query:str): # pylint: disable=missing-function-docstring
-    embedding = openai_client.embeddings.create(input=query,
-                                                model=settings.app_text_embedding_model)
-    connections.connect(host=settings.milvus_host, port=settings.milvus_port)
-    milvus_collection = Collection(name=settings.milvus_collection_name)
-    milvus_collection.load()
-    results = milvus_collection.search(
-        data=[embedding],
-        anns_field='chunk_embedding',
-        limit=10, # TODO: Remove this magic number
-        param={},
-        output_fields=['file_id', 'chunk_txt']
-    )
+async def get_molten_salt_documents(query:str): # pylint: disable=missing-function-docstring
+    embedding = await embed_query(query)
+    hits = await vector_store.search(embedding,
+                                     limit=10, # TODO: Remove this magic number
+                                     output_fields=['file_id', 'chunk_txt'])
     # Finally, retrieve the files that match the results
-    file_ids = [hit.entity.get('file_id') for hit in results[0]]
-    chunks = [hit.entity.get('chunk_txt') for hit in results[0]]
+    file_ids = [hit['file_id'] for hit in hits]
+    chunks = [hit['chunk_txt'] for hit in hits]
     result = ('I, the assistant, chose to use a function to retrieve relevant documents for '
               'research about molten salt nuclear reactors. This tool returned the following:\n')
     for index, (file_id, chunk) in enumerate(zip(file_ids, chunks)):
@@ -78,13 +98,54 @@ def get_molten_salt_documents(query:str): # pylint: disable=missing-function-doc
     return result
 
 # TODO: This is a hack.  Fix it.
-def run_tool(name: str, arguments: str): # pylint: disable=missing-function-docstring
+async def run_tool(name: str, arguments: str): # pylint: disable=missing-function-docstring
     args = json.loads(arguments)
     if name == "get_molten_salt_documents":
         query = args["prompt"]
-        return get_molten_salt_documents(query)
+        return await get_molten_salt_documents(query)
     raise ValueError(f"Tool '{name}' not found.")
 
+async def run_tool_with_timeout(name: str, arguments: str) -> str:
+    """ Runs a tool call, giving up after the tool timeout.
+
+    A tool that fails or times out does not end the conversation; its error is returned as the
+    result instead, so the model can tell the user.
+
+    Args:
+        name (str): The name of the tool.
+        arguments (str): The JSON arguments of the tool call.
+
+    Returns:
+        str: The result of the tool call, or a description of its error.
+    """
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(run_tool(name, arguments),
+                                        timeout=settings.app_tool_timeout_seconds)
+        outcome = 'ok'
+    except asyncio.TimeoutError:
+        print(f"Tool '{name}' timed out", flush=True)
+        result = f"The tool '{name}' did not respond in time."
+        outcome = 'timeout'
+    except Exception as exc: # pylint: disable=broad-except
+        print(f"Tool '{name}' failed: {exc!r}", flush=True)
+        result = f"The tool '{name}' failed."
+        outcome = 'error'
+    TOOL_LATENCY_SECONDS.labels(name, outcome).observe(time.perf_counter() - start)
+    return result
+
+async def run_tools(tool_calls: List[Tuple[str, str]]) -> List[str]:
+    """ Runs the tool calls of an assistant turn concurrently.
+
+    Args:
+        tool_calls (List[Tuple[str, str]]): The name and JSON arguments of each tool call.
+
+    Returns:
+        List[str]: The result of each tool call, in order.
+    """
+    return await asyncio.gather(*(run_tool_with_timeout(name, arguments)
+                                  for name, arguments in tool_calls))
+
 nuclear_tools = [ChatCompletionToolParam(
     type="function",
     function=FunctionDefinition(
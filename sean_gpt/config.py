@@ -39,6 +39,12 @@ class Settings(BaseSettings):
 
     database_dialect: str = Field(alias='sean_gpt_database_dialect')
     database_driver: str = Field(alias='sean_gpt_database_driver')
+    database_async_driver: str = Field(alias='sean_gpt_database_async_driver')
+    database_pool_size: int = Field(alias='sean_gpt_database_pool_size')
+    database_max_overflow: int = Field(alias='sean_gpt_database_max_overflow')
+    database_pool_timeout_seconds: float = Field(alias='sean_gpt_database_pool_timeout_seconds')
+    database_pool_recycle_seconds: int = Field(alias='sean_gpt_database_pool_recycle_seconds')
+    database_pool_pre_ping: bool = Field(alias='sean_gpt_database_pool_pre_ping')
     database_host: str = Field(alias='sean_gpt_database_host')
     database_port: str = Field(alias='sean_gpt_database_port')
     database_name: str = Field(alias='sean_gpt_database_name')
@@ -51,9 +57,20 @@ class Settings(BaseSettings):
     kafka_brokers: str = Field(alias='sean_gpt_kafka_brokers')
     rabbitmq_host: str = Field(alias='sean_gpt_rabbitmq_host')
 
+    vector_store_backend: str = Field(alias='sean_gpt_vector_store_backend')
+    vector_store_local_path: str = Field(alias='sean_gpt_vector_store_local_path')
+
     milvus_host: str = Field(alias='sean_gpt_milvus_host')
     milvus_port: str = Field(alias='sean_gpt_milvus_port')
     milvus_collection_name: str = Field(alias='sean_gpt_milvus_collection_name')
+    milvus_index_type: str = Field(alias='sean_gpt_milvus_index_type')
+    milvus_index_metric_type: str = Field(alias='sean_gpt_milvus_index_metric_type')
+    milvus_index_hnsw_m: int = Field(alias='sean_gpt_milvus_index_hnsw_m')
+    milvus_index_hnsw_ef_construction: int = (
+        Field(alias='sean_gpt_milvus_index_hnsw_ef_construction'))
+    milvus_index_hnsw_ef: int = Field(alias='sean_gpt_milvus_index_hnsw_ef')
+    milvus_index_ivf_nlist: int = Field(alias='sean_gpt_milvus_index_ivf_nlist')
+    milvus_index_ivf_nprobe: int = Field(alias='sean_gpt_milvus_index_ivf_nprobe')
 
     app_phone_number: str = Field(alias='sean_gpt_app_phone_number')
     app_welcome_message: str = Field(alias='sean_gpt_app_welcome_message')
@@ -65,18 +82,51 @@ class Settings(BaseSettings):
     app_max_sms_characters: int = Field(alias='sean_gpt_app_max_sms_characters')
     app_chat_history_length: int = Field(alias='sean_gpt_app_chat_history_length')
     app_default_ai_model: str = Field(alias='sean_gpt_app_default_ai_model')
+    app_ai_cache_ttl_seconds: float = Field(alias='sean_gpt_app_ai_cache_ttl_seconds')
+    app_user_cache_ttl_seconds: float = Field(alias='sean_gpt_app_user_cache_ttl_seconds')
+    app_user_cache_max_entries: int = Field(alias='sean_gpt_app_user_cache_max_entries')
     app_text_embedding_model: str = Field(alias='sean_gpt_app_text_embedding_model')
     app_text_embedding_model_dim: int = Field(alias='sean_gpt_app_text_embedding_model_dim')
+    app_embedding_max_concurrent_requests: int = (
+        Field(alias='sean_gpt_app_embedding_max_concurrent_requests'))
+    app_embedding_max_batch_tokens: int = Field(alias='sean_gpt_app_embedding_max_batch_tokens')
+    app_embedding_max_batch_inputs: int = Field(alias='sean_gpt_app_embedding_max_batch_inputs')
+    app_embedding_tokens_per_minute: int = Field(alias='sean_gpt_app_embedding_tokens_per_minute')
+    app_embedding_requests_per_minute: int = (
+        Field(alias='sean_gpt_app_embedding_requests_per_minute'))
+    app_embedding_max_retries: int = Field(alias='sean_gpt_app_embedding_max_retries')
+    app_embedding_cache_max_entries: int = Field(alias='sean_gpt_app_embedding_cache_max_entries')
+    app_query_embedding_cache_max_entries: int = (
+        Field(alias='sean_gpt_app_query_embedding_cache_max_entries'))
+    app_query_embedding_cache_ttl_seconds: float = (
+        Field(alias='sean_gpt_app_query_embedding_cache_ttl_seconds'))
+    app_tool_timeout_seconds: float = Field(alias='sean_gpt_app_tool_timeout_seconds')
     app_phone_verification_message: str = Field(alias='sean_gpt_app_phone_verification_message')
     app_ws_token_timeout_seconds: int = Field(alias='sean_gpt_app_ws_token_timeout_seconds')
+    app_rabbitmq_channel_pool_size: int = Field(alias='sean_gpt_app_rabbitmq_channel_pool_size')
+    app_password_hash_max_workers: int = Field(alias='sean_gpt_app_password_hash_max_workers')
+    app_file_upload_max_size_bytes: int = Field(alias='sean_gpt_app_file_upload_max_size_bytes')
+    app_file_upload_part_size_bytes: int = Field(alias='sean_gpt_app_file_upload_part_size_bytes')
     app_file_status_consumer_timeout_seconds: int = (
         Field(alias='sean_gpt_app_file_status_consumer_timeout_seconds'))
     app_file_processing_stage_chunk2embedding_topic_name: str = (
         Field(alias='sean_gpt_app_file_processing_stage_chunk2embedding_topic_name'))
     app_file_processing_stage_txtfile2chunk_topic_name: str = (
         Field(alias='sean_gpt_app_file_processing_stage_txtfile2chunk_topic_name'))
-    app_chunk2embedding_batch_size: int = (
-        Field(alias='sean_gpt_app_chunk2embedding_batch_size'))
+    app_chunk2embedding_max_batch_size: int = (
+        Field(alias='sean_gpt_app_chunk2embedding_max_batch_size'))
+    app_chunk2embedding_max_batch_delay_ms: int = (
+        Field(alias='sean_gpt_app_chunk2embedding_max_batch_delay_ms'))
+    app_chunk2embedding_num_consumers: int = (
+        Field(alias='sean_gpt_app_chunk2embedding_num_consumers'))
+    app_file_processing_idle_timeout_seconds: float = (
+        Field(alias='sean_gpt_app_file_processing_idle_timeout_seconds'))
+    app_file_processing_publish_window_size: int = (
+        Field(alias='sean_gpt_app_file_processing_publish_window_size'))
+    app_milvus_flush_row_count: int = Field(alias='sean_gpt_app_milvus_flush_row_count')
+    app_milvus_flush_interval_seconds: float = (
+        Field(alias='sean_gpt_app_milvus_flush_interval_seconds'))
     api_domain: str = Field(alias='sean_gpt_api_domain')
+    api_metrics_port: int = Field(alias='sean_gpt_api_metrics_port')
 
 settings = Settings()
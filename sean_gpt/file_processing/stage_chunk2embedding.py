@@ -1,130 +1,312 @@
 """ Performs the second stage of file processing: calculate vector embedding for chunk
 
-This file is used as a kubernetes job that retrieves a text chunk from a kafka topic, calculates
-the vector embedding, and posts the result to milvus.
+This file is used as a kubernetes job that retrieves text chunks from a queue, calculates their
+vector embeddings, and posts the results to the vector store (milvus by default).  Several
+consumers run concurrently, each with its own channel and prefetch window, and share the embedding
+request scheduler.
+
+Chunks are acknowledged only after they are stored in the vector store and counted in postgres, so
+a worker that dies mid-batch loses nothing: its unacknowledged chunks are redelivered to another
+consumer.  Redelivery is made idempotent per chunk.  Each stored chunk is recorded in postgres, in
+the same transaction that counts it, so a chunk is counted once however often it is delivered.  A
+redelivered chunk that was already recorded is skipped, and one that was not has any rows of the
+earlier attempt deleted from the vector store before it is stored again.
 """
-from typing import Tuple, List, Generator
+from typing import Dict, List, Set, Tuple
+from collections import defaultdict
 import json
 import asyncio
+import threading
+import time
 
-from openai import OpenAI
-from pymilvus import connections, Collection
-from sqlalchemy import create_engine, text
+import numpy as np
+import aioredis
+from sqlalchemy import bindparam, text
 
 from . import util
 from ..util.describe import describe
+from ..util.embedding import EmbeddingScheduler, EmbeddingCache
 from ..config import settings
-from ..model.file import FILE_STATUS_COMPLETE, TextFileChunkingStatus
-from ..util.database import _DATABASE_URL
+from ..model.file import FILE_STATUS_COMPLETE, ProcessedChunk, TextFileChunkingStatus
+from ..util.database import get_db_engine
+from ..util.rabbitmq import close_rabbitmq_connection
+from ..util.vector_store import vector_store
 
 if settings.debug:
     from ..routers.mock.openai import startup
     startup()
 
-openai_client = OpenAI(api_key = settings.openai_api_key)
-connections.connect(host=settings.milvus_host, port=settings.milvus_port)
-milvus_collection = Collection(name=settings.milvus_collection_name)
-
-engine = create_engine(_DATABASE_URL, echo=settings.debug)
+embedding_scheduler = EmbeddingScheduler(
+    cache=(EmbeddingCache(aioredis.from_url(f"redis://{settings.redis_host}"))
+           if settings.app_embedding_cache_max_entries > 0 else None))
 
-CHUNK_BATCH_SIZE = settings.app_chunk2embedding_batch_size
+CHUNK_MAX_BATCH_SIZE = settings.app_chunk2embedding_max_batch_size
 
-async def get_chunk_from_queue(name: str) -> Generator[str, None, None]:
-    """Retrieves chunks from the queue.
+CHUNK_MAX_BATCH_DELAY_SEC = settings.app_chunk2embedding_max_batch_delay_ms / 1000
 
-    This function connects to a RabbitMQ queue and retrieves chunks. If no message
-    is received within 5 seconds, the loop breaks and stops listening for new messages.
-
-    Args:
-        name (str): The name of the queue to connect to.
-
-    Yields:
-        Generator[str, None, None]: A generator yielding chunks.
-    """
-    async with util.get_rabbitmq_channel() as channel:
-        await channel.set_qos(prefetch_count=CHUNK_BATCH_SIZE)
-
-        async for message in util.iterate_queue(name, channel):
-            async with message.process():
-                payload = json.loads(message.body.decode('utf-8'))
-                yield payload
-        yield None
+# Rows inserted into milvus since the last flush, and when that flush happened.  Inserts run in
+# worker threads, so the counters are guarded by a lock.
+_unflushed_row_count = 0 # pylint: disable=invalid-name
+_last_flush_time = time.monotonic() # pylint: disable=invalid-name
+_flush_lock = threading.Lock()
 
 @describe(
 """ Calculates the vector embedding for chunks of text
 """)
-def calculate_vector_embedding(chunks: List[str]) -> List[List[float]]:
+async def calculate_vector_embedding(chunks: List[str]) -> List[List[float]]:
     """ Calculates the vector embedding for a chunk of text
     """
-    response = openai_client.embeddings.create(
-        model=settings.app_text_embedding_model,
-        input=chunks,
-        encoding_format="float"
-    )
-    embeddings = [embedding['embedding'] for embedding in response['data']]
-    return embeddings
+    return await embedding_scheduler.embed(chunks)
 
 @describe(
 """ Posts the vector embeddings to milvus
+
+The batch is inserted column-wise in a single call.  The columns are in schema order, without the
+auto-generated chunk_id primary key.
 """)
 def post_vector_embeddings_to_milvus(chunk_embeddings: List[List[float]], chunk_dicts: List[dict]):
     """ Posts the vector embedding to milvus
     """
-    for embedding, chunk_dict in zip(chunk_embeddings, chunk_dicts):
-        milvus_record = {**chunk_dict, 'chunk_embedding':embedding}
-        milvus_collection.insert(milvus_record)
-    milvus_collection.flush()
+    global _unflushed_row_count # pylint: disable=global-statement
+    if not chunk_dicts:
+        return
+    vector_store.insert(
+        [chunk['file_id'] for chunk in chunk_dicts],
+        [chunk['chunk_location'] for chunk in chunk_dicts],
+        np.asarray(chunk_embeddings, dtype=np.float32),
+        [chunk['chunk_txt'] for chunk in chunk_dicts],
+    )
+    with _flush_lock:
+        _unflushed_row_count += len(chunk_dicts)
+    flush_milvus_if_necessary()
+
+@describe(
+""" Flushes the milvus collection once enough rows or enough time have accumulated.
+
+Flushing seals the growing segments, so flushing after every small batch creates many tiny
+segments.  Inserted rows are searchable before they are flushed.
+
+Args:
+    force (bool): Flush any unflushed rows regardless of the thresholds.
+""")
+def flush_milvus_if_necessary(force: bool = False): # pylint: disable=missing-function-docstring
+    global _unflushed_row_count, _last_flush_time # pylint: disable=global-statement
+    with _flush_lock:
+        if _unflushed_row_count == 0:
+            return
+        if not (force or
+                _unflushed_row_count >= settings.app_milvus_flush_row_count or
+                time.monotonic() - _last_flush_time >= settings.app_milvus_flush_interval_seconds):
+            return
+        _unflushed_row_count = 0
+        _last_flush_time = time.monotonic()
+    vector_store.flush()
 
 @describe(
-""" Increments the count of chunks processed in postgres
+""" Groups the locations of chunks by their file.
+
+Returns:
+    Dict[str, List[int]]: The sorted chunk locations, by file_id.
 """)
-def increment_chunks_processed_count(file_id: str) -> Tuple[int, int]:
-    """ Increments the count of chunks processed in postgres
-    """
+def group_chunk_locations( # pylint: disable=missing-function-docstring
+    chunks: List[dict]) -> Dict[str, List[int]]:
+    chunk_locations = defaultdict(set)
+    for chunk in chunks:
+        chunk_locations[chunk['file_id']].add(int(chunk['chunk_location']))
+    return {file_id: sorted(locations) for file_id, locations in chunk_locations.items()}
+
+@describe(
+""" Finds which of a batch of chunks were already stored and recorded by an earlier delivery.
+
+Args:
+    chunks (List[dict]): The chunks.
+
+Returns:
+    Set[Tuple[str, int]]: The file_id and chunk_location of each recorded chunk.
+""")
+def get_processed_chunks( # pylint: disable=missing-function-docstring
+    chunks: List[dict]) -> Set[Tuple[str, int]]:
+    table_name = ProcessedChunk.__tablename__
+    query = text(
+        f"SELECT chunk_location FROM {table_name} "
+        f"WHERE file_id = :file_id AND chunk_location IN :chunk_locations"
+    ).bindparams(bindparam("chunk_locations", expanding=True))
+    processed_chunks = set()
+    with get_db_engine().connect() as conn:
+        for file_id, chunk_locations in group_chunk_locations(chunks).items():
+            rows = conn.execute(query, {"file_id": file_id, "chunk_locations": chunk_locations})
+            processed_chunks.update((file_id, row[0]) for row in rows)
+    return processed_chunks
+
+@describe(
+""" Deletes the stored rows of chunks from the vector store, so they can be stored again.
+
+A delivery that died between storing its chunks and recording them leaves rows behind; deleting
+them first keeps the redelivered chunks from being stored twice.
+""")
+def delete_stored_chunks(chunks: List[dict]): # pylint: disable=missing-function-docstring
+    for file_id, chunk_locations in group_chunk_locations(chunks).items():
+        vector_store.delete_chunks(file_id, chunk_locations)
+
+@describe(
+""" Records chunks as processed and increments the counts of chunks processed in postgres.
+
+Each file's status record is locked, its chunks are recorded with one INSERT, and only those that
+were not recorded already are added to its count, with one UPDATE.  The files are handled in file_id
+order inside one transaction, so concurrent workers always lock their rows in the same order.
+
+Args:
+    chunk_locations (Dict[str, List[int]]): The locations of the chunks processed in this batch, by
+        file_id.
+
+Returns:
+    List[str]: The IDs of the files that this batch completed.
+""")
+def increment_chunks_processed_counts( # pylint: disable=missing-function-docstring
+    chunk_locations: Dict[str, List[int]]) -> List[str]:
     table_name = TextFileChunkingStatus.__tablename__
-    with engine.begin() as conn:
-        # Atomically increment the chunks_processed count and return the updated record
-        result = conn.execute(
-            text(
-                f"UPDATE {table_name} SET chunks_processed = chunks_processed + 1 "
-                f"WHERE file_id = :file_id RETURNING chunks_processed, total_chunks"
-            ),
-            {"file_id": file_id}
-        ).first()
-
-        if not result:
-            print(f"File with ID {file_id} not found in database.")
-            return None, None
-
-        return result[0], result[1]
-
-async def main():
-    """ Main function
+    processed_table_name = ProcessedChunk.__tablename__
+    completed_file_ids = []
+    with get_db_engine().begin() as conn:
+        for file_id in sorted(chunk_locations):
+            # Lock the status record first, and skip files that were deleted in the meantime
+            if not conn.execute(
+                text(
+                    f"UPDATE {table_name} SET chunks_processed = chunks_processed "
+                    f"WHERE file_id = :file_id RETURNING file_id"
+                ),
+                {"file_id": file_id}
+            ).first():
+                print(f"File with ID {file_id} not found in database.")
+                continue
+            locations = chunk_locations[file_id]
+            values = ", ".join(f"(:file_id, :chunk_location_{index})"
+                               for index in range(len(locations)))
+            # Only the chunks recorded now are returned, so redelivered chunks are not recounted
+            num_chunks = len(conn.execute(
+                text(
+                    f"INSERT INTO {processed_table_name} (file_id, chunk_location) "
+                    f"VALUES {values} ON CONFLICT DO NOTHING RETURNING chunk_location"
+                ),
+                {"file_id": file_id,
+                 **{f"chunk_location_{index}": location
+                    for index, location in enumerate(locations)}}
+            ).all())
+            if not num_chunks:
+                continue
+            # Atomically increment the chunks_processed count and return the updated record
+            chunks_processed, total_chunks = conn.execute(
+                text(
+                    f"UPDATE {table_name} SET chunks_processed = chunks_processed + :num_chunks "
+                    f"WHERE file_id = :file_id RETURNING chunks_processed, total_chunks"
+                ),
+                {"file_id": file_id, "num_chunks": num_chunks}
+            ).one()
+            # Only the batch that crosses the total completes the file.  While stage 1 is still
+            # publishing, total_chunks is 0 and it is stage 1 that detects completion.
+            if chunks_processed - num_chunks < total_chunks <= chunks_processed:
+                completed_file_ids.append(file_id)
+    return completed_file_ids
+
+@describe(
+""" Embeds a batch of chunks, stores them in milvus, and records the progress of their files.
+
+The blocking milvus and postgres calls run in worker threads so that other consumers can keep
+receiving and embedding chunks in the meantime.  Chunks marked `redelivered` may have been
+processed before, so they are checked against postgres first.
+""")
+async def process_batch(batch: List[dict]): # pylint: disable=missing-function-docstring
+    # A chunk published twice is processed once
+    batch = list({(chunk['file_id'], int(chunk['chunk_location'])): chunk
+                  for chunk in batch}.values())
+    redelivered = [chunk for chunk in batch if chunk.get('redelivered')]
+    if redelivered:
+        processed_chunks = await asyncio.to_thread(get_processed_chunks, redelivered)
+        batch = [chunk for chunk in batch
+                 if (chunk['file_id'], int(chunk['chunk_location'])) not in processed_chunks]
+        await asyncio.to_thread(delete_stored_chunks,
+                                [chunk for chunk in batch if chunk.get('redelivered')])
+        if not batch:
+            return
+    # Calculate the vector embedding
+    vector_embeddings = await calculate_vector_embedding([chunk['chunk_txt'] for chunk in batch])
+    # Post the vector embedding to milvus
+    await asyncio.to_thread(post_vector_embeddings_to_milvus, vector_embeddings, batch)
+    # Record the chunks and increment the count of chunks processed in postgres, once per file in
+    # the batch.  If the count of chunks processed reached the total number of chunks, post to the
+    # status queue that the file is processed
+    for file_id in await asyncio.to_thread(increment_chunks_processed_counts,
+                                           group_chunk_locations(batch)):
+        await util.announce_file_status(file_id, FILE_STATUS_COMPLETE)
+
+async def consume_chunks(consumer_index: int, idle_timeout_sec: float|None):
+    """ Processes batches of chunks from the queue until it is idle or shutdown is requested.
+
+    The consumer opens its own RabbitMQ channel and retrieves micro-batches of at most
+    CHUNK_MAX_BATCH_SIZE chunks, each waiting at most CHUNK_MAX_BATCH_DELAY_SEC for the batch to
+    fill.  A batch is acknowledged once it has been processed; if processing fails, it is requeued
+    and the consumer carries on with the next batch.
+
+    Args:
+        consumer_index (int): The index of this consumer, for logging.
+        idle_timeout_sec (float|None): How long to wait for a chunk before exiting, or None to keep
+            running until shutdown.
     """
-    # Begin retrieving chunks one by one from the queue, batching them up
-    batch = []
-    async for chunk_dict in get_chunk_from_queue(
-        settings.app_file_processing_stage_chunk2embedding_topic_name):
-        if chunk_dict:
-            batch.append(chunk_dict)
-        if len(batch) < CHUNK_BATCH_SIZE and chunk_dict:
-            continue
-        # Calculate the vector embedding
-        vector_embeddings = calculate_vector_embedding([chunk['chunk_txt'] for chunk in batch])
-        # Post the vector embedding to milvus
-        post_vector_embeddings_to_milvus(vector_embeddings, batch)
-        # Increment the count of chunks processed in postgres
-        for chunk in batch:
-            file_id = chunk['file_id']
-            chunks_processed, total_chunks = increment_chunks_processed_count(file_id)
-            if not chunks_processed:
+    async with util.get_rabbitmq_channel() as channel:
+        async for messages in util.iterate_message_batches(
+            settings.app_file_processing_stage_chunk2embedding_topic_name,
+            channel,
+            CHUNK_MAX_BATCH_SIZE,
+            CHUNK_MAX_BATCH_DELAY_SEC,
+            idle_timeout_sec):
+            print(f"Consumer {consumer_index} processing {len(messages)} chunks", flush=True)
+            try:
+                await process_batch([{**json.loads(message.body.decode('utf-8')),
+                                      'redelivered': message.redelivered}
+                                     for message in messages])
+            except BaseException as exc: # pylint: disable=broad-exception-caught
+                # Redeliver the batch, to this or another consumer
+                for message in messages:
+                    await message.nack(requeue=True)
+                if not isinstance(exc, Exception):
+                    raise
+                print(f"Consumer {consumer_index} failed to process {len(messages)} chunks, "
+                      f"requeued them: {exc!r}", flush=True)
+                # Back off, so a failing service is not retried in a tight loop
+                await asyncio.sleep(1)
                 continue
-            # If the count of chunks processed is equal to the total number of chunks, post to the
-            # status queue that the file is processed
-            if chunks_processed == total_chunks:
-                await util.announce_file_status(file_id, FILE_STATUS_COMPLETE)
-        # Reset the batch
-        batch = []
+            # Batches are processed in delivery order on this channel, so one acknowledgement
+            # covers the whole batch
+            await messages[-1].ack(multiple=True)
+
+async def main(idle_timeout_sec: float|None = settings.app_file_processing_idle_timeout_seconds,
+               num_consumers: int = settings.app_chunk2embedding_num_consumers):
+    """ Main function
+
+    Args:
+        idle_timeout_sec (float|None): How long to wait for a chunk before exiting, or None to keep
+            running until shutdown.
+        num_consumers (int): The number of concurrent consumers, each with its own channel and
+            prefetch window.
+    """
+    consumers = [asyncio.create_task(consume_chunks(consumer_index, idle_timeout_sec))
+                 for consumer_index in range(num_consumers)]
+    try:
+        await asyncio.gather(*consumers)
+    finally:
+        # Stop the other consumers if one failed, so none outlive this call and race the flush
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        # Flush whatever is left before exiting
+        await asyncio.to_thread(flush_milvus_if_necessary, True)
+
+async def run_job(): # pylint: disable=missing-function-docstring
+    util.install_shutdown_handlers()
+    try:
+        await main()
+    finally:
+        await close_rabbitmq_connection()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    asyncio.run(run_job())
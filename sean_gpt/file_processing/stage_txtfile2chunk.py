@@ -1,66 +1,122 @@
 """ Performs the first stage of file processing: chunking
 
-This file is used as a kubernetes job that retrieves a file ID from a queue, downloads the
-file from minio, and then chunks the file, posting the chunks to aqueye for processing by
-stage 1.
+This file is used as a kubernetes job that retrieves a file ID from a queue, streams the
+file from minio, and then chunks the file, posting the chunks to a queue for processing by
+stage 2.
 """
-import os
-import tempfile
+import codecs
 import json
 import uuid
 
-from typing import Generator
+from typing import AsyncGenerator, AsyncIterator, Generator, Tuple
 import asyncio
 
 from sqlmodel import Session, select
-import aio_pika
+from sqlalchemy import text
+import numpy as np
 
 from . import util
 from ..util.describe import describe
-from ..model.file import File, FILE_STATUS_PROCESSING, TextFileChunkingStatus
+from ..model.file import (
+    File, FILE_STATUS_PROCESSING, FILE_STATUS_COMPLETE, TextFileChunkingStatus)
 from ..config import settings
 from ..util.minio_client import get_minio_client, USER_UPLOAD_BUCKET_NAME
 from ..util.database import get_db_engine
+from ..util.rabbitmq import close_rabbitmq_connection
+from ..util.vector_store import vector_store
 
 CHUNK_LENGTH = 500
+# The number of characters shared by consecutive chunks
 CHUNK_STRIDE = 100
+MINIO_READ_SIZE = 64 * 1024
+MILVUS_CLONE_BATCH_SIZE = 1000
 
-async def get_file_id_from_queue(name: str) -> Generator[str, None, None]:
+async def get_file_id_from_queue(
+    name: str,
+    idle_timeout_sec: float|None = settings.app_file_processing_idle_timeout_seconds
+    ) -> Generator[str, None, None]:
     """Retrieves file IDs from the queue.
 
     This function connects to a RabbitMQ queue and retrieves file IDs. If no message
-    is received within 5 seconds, the loop breaks and stops listening for new messages.
+    is received within the idle timeout, or a shutdown is requested, the loop breaks and stops
+    listening for new messages.
 
     Args:
         name (str): The name of the queue to connect to.
+        idle_timeout_sec (float|None): The idle timeout, or None to wait until shutdown.
 
     Yields:
         Generator[str, None, None]: A generator yielding file IDs.
     """
     async with util.get_rabbitmq_channel() as channel:
-        async for message in util.iterate_queue(name, channel):
+        async for message in util.iterate_queue(name, channel, idle_timeout_sec):
             async with message.process():
                 payload = json.loads(message.body.decode('utf-8'))
                 yield payload['file_id']
 
 @describe(
-""" Downloads a file from minio, and returns the temporary file path.
+""" Streams a file from minio in fixed-size byte blocks.
+
+The minio client is synchronous, so each block is read in a worker thread, leaving the event loop
+free for the other stages and the RabbitMQ heartbeats.
 """)
-def download_file_from_minio(file_id: str) -> str:
-    """ Downloads a file from minio, and returns the temporary file path.
-    """
-    # Download the file from minio
-    # Create a Minio client
-    # Retrieve the file from minio, directly to a temporary file
-    print(f"Downloading file {file_id} from minio", flush=True)
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        get_minio_client().fget_object(
-            USER_UPLOAD_BUCKET_NAME,
-            file_id,
-            temp_file.name
-        )
-    print(f"File {file_id} downloaded from minio", flush=True)
-    return temp_file.name
+async def stream_file_from_minio( # pylint: disable=missing-function-docstring
+    file_id: str) -> AsyncGenerator[bytes, None]:
+    print(f"Streaming file {file_id} from minio", flush=True)
+    response = await asyncio.to_thread(
+        get_minio_client().get_object, USER_UPLOAD_BUCKET_NAME, file_id)
+    try:
+        blocks = response.stream(MINIO_READ_SIZE)
+        while (block := await asyncio.to_thread(next, blocks, None)) is not None:
+            yield block
+    finally:
+        response.close()
+        response.release_conn()
+
+@describe(
+""" Splits a stream of utf-8 encoded bytes into overlapping text chunks.
+
+Each chunk is at most `chunk_length` characters long and begins `chunk_length - chunk_overlap`
+characters after the previous one, so consecutive chunks share `chunk_overlap` characters.  The
+bytes are decoded incrementally, so multi-byte characters that straddle a block boundary are
+handled correctly and only about one chunk of text is held in memory at a time.
+
+Args:
+    byte_stream (AsyncIterator[bytes]): The utf-8 encoded blocks of the file.
+    chunk_length (int): The maximum number of characters in a chunk.
+    chunk_overlap (int): The number of characters shared by consecutive chunks.
+
+Yields:
+    Tuple[int, str]: The character offset of the chunk in the file and the chunk text.
+""")
+async def iterate_text_chunks( # pylint: disable=missing-function-docstring
+    byte_stream: AsyncIterator[bytes],
+    chunk_length: int = CHUNK_LENGTH,
+    chunk_overlap: int = CHUNK_STRIDE) -> AsyncGenerator[Tuple[int, str], None]:
+    if not 0 <= chunk_overlap < chunk_length:
+        raise ValueError("The chunk overlap must be non-negative and less than the chunk length.")
+    step = chunk_length - chunk_overlap
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    location = 0
+    while True:
+        block = await anext(byte_stream, None)
+        if block is None:
+            buffer += decoder.decode(b'', final=True)
+        else:
+            buffer += decoder.decode(block)
+        # Slice the chunks at an offset and trim the buffer once per block, not once per chunk
+        start = 0
+        while len(buffer) - start >= chunk_length:
+            yield location, buffer[start:start + chunk_length]
+            start += step
+            location += step
+        buffer = buffer[start:]
+        if block is None:
+            break
+    # The first `chunk_overlap` characters of the remainder were already sent with the last chunk
+    if len(buffer) > chunk_overlap or (location == 0 and buffer):
+        yield location, buffer
 
 @describe(
 """ Retrieves a file record from postgres.
@@ -77,101 +133,201 @@ def get_file_record_from_postgres(file_id: str) -> File|None:
         return file_record
 
 @describe(
-""" Chunks a txt file, and posts the chunks to a kafka topic.
+""" Creates the chunking status record of a file, before its chunks are published.
 """)
-async def chunk_txt_file(file_id: str, temp_file_path: str):
-    """ Chunks a txt file, and posts the chunks to a kafka topic.
-    """
-    # Save the chunks to the local filesystem in temporary files, temporary subdir named "chunks"
-    # Create a temporary directory for all chunks
-    print('creating temporary directory for chunks', flush=True)
-    num_chunks = 0
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Create a temporary file for each chunk
-        print('creating temporary files for chunks', flush=True)
-        with open(temp_file_path, "r", encoding='utf-8') as file:
-            while True:
-                file_chunk = file.read(CHUNK_LENGTH)
-                if not file_chunk:
-                    break
-                # Create a temporary file for the chunk with the name as the chunk location
-                with open(os.path.join(temp_dir, str(file.tell() - len(file_chunk))),
-                          "w",
-                          encoding='utf-8') as temp_file:
-                    temp_file.write(file_chunk)
-                    num_chunks += 1
-        # Create a record to track the chunking status
-        with Session(get_db_engine()) as session:
-            session.add(
-                TextFileChunkingStatus(
-                    file_id=uuid.UUID(file_id),
-                    total_chunks=num_chunks
-                )
+def create_chunking_status(file_id: str): # pylint: disable=missing-function-docstring
+    with Session(get_db_engine()) as session:
+        session.add(
+            TextFileChunkingStatus(
+                file_id=uuid.UUID(file_id),
+                total_chunks=0
+            )
+        )
+        session.commit()
+
+@describe(
+""" Records the final chunk count for a file and reports whether it is already fully processed.
+
+The chunking status record is created before any chunks are published, so the total is only known
+once the stream is exhausted.  Stage 2 may have processed every chunk by then; both updates lock
+the same row, so exactly one of the two stages observes `chunks_processed >= total_chunks`.
+""")
+def set_total_chunks(file_id: str, total_chunks: int) -> bool: # pylint: disable=missing-function-docstring
+    table_name = TextFileChunkingStatus.__tablename__
+    with get_db_engine().begin() as conn:
+        result = conn.execute(
+            text(
+                f"UPDATE {table_name} SET total_chunks = :total_chunks "
+                f"WHERE file_id = :file_id RETURNING chunks_processed"
+            ),
+            {"file_id": file_id, "total_chunks": total_chunks}
+        ).first()
+    return result is not None and result[0] >= total_chunks
+
+@describe(
+""" Streams a txt file from minio, chunks it, and posts the chunks to a queue.
+""")
+async def chunk_txt_file(file_id: str): # pylint: disable=missing-function-docstring
+    # Create a record to track the chunking status.  The total is filled in once it is known.
+    await asyncio.to_thread(create_chunking_status, file_id)
+    # The chunk processing will happen in a separate kubernetes job; post the chunks to a queue.
+    print('posting chunks to queue', flush=True)
+    async with util.get_rabbitmq_channel() as channel:
+        async with util.BatchPublisher(
+            channel, settings.app_file_processing_stage_chunk2embedding_topic_name) as publisher:
+            async for chunk_location, chunk_txt in iterate_text_chunks(
+                stream_file_from_minio(file_id)):
+                await publisher.publish({
+                    'file_id': str(file_id),
+                    'chunk_txt': chunk_txt,
+                    'chunk_location': chunk_location,
+                })
+        num_chunks = publisher.num_published
+    print(f"File {file_id} has {num_chunks} chunks", flush=True)
+    if await asyncio.to_thread(set_total_chunks, file_id, num_chunks):
+        await util.announce_file_status(file_id, FILE_STATUS_COMPLETE)
+
+@describe(
+""" Finds an earlier, fully processed upload with the same contents as a file.
+
+Returns:
+    str|None: The ID of the earlier file, or None if there is none.
+""")
+def find_processed_duplicate(file_record: File) -> str|None: # pylint: disable=missing-function-docstring
+    with Session(get_db_engine()) as session:
+        duplicate = session.exec(
+            select(File)
+            .join(TextFileChunkingStatus)
+            .where(File.hash == file_record.hash,
+                   File.type == file_record.type,
+                   File.id != file_record.id,
+                   TextFileChunkingStatus.total_chunks > 0,
+                   TextFileChunkingStatus.chunks_processed >= TextFileChunkingStatus.total_chunks)
+        ).first()
+        return str(duplicate.id) if duplicate else None
+
+@describe(
+""" Reports whether a file is recorded as fully processed.
+""")
+def is_file_processed(file_id: str) -> bool: # pylint: disable=missing-function-docstring
+    with Session(get_db_engine()) as session:
+        return session.exec(
+            select(TextFileChunkingStatus)
+            .where(TextFileChunkingStatus.file_id == uuid.UUID(file_id),
+                   TextFileChunkingStatus.total_chunks > 0,
+                   TextFileChunkingStatus.chunks_processed >= TextFileChunkingStatus.total_chunks)
+        ).first() is not None
+
+@describe(
+""" Records the chunks copied to a file as fully processed.
+""")
+def record_cloned_chunks(file_id: str, num_chunks: int): # pylint: disable=missing-function-docstring
+    with Session(get_db_engine()) as session:
+        session.add(
+            TextFileChunkingStatus(
+                file_id=uuid.UUID(file_id),
+                total_chunks=num_chunks,
+                chunks_processed=num_chunks
             )
-            session.commit()
-        print(f"File {file_id} has {num_chunks} chunks", flush=True)
-        # The chunk processing will happen in a separate kubernetes job; post the chunks to a queue.
-        # Iterate over all the chunk files, posting each to a queue
-        print('posting chunks to queue', flush=True)
-        async with util.get_rabbitmq_channel() as channel:
-            await channel.set_qos(prefetch_count=1)
-
-            for chunk_file_name in os.listdir(temp_dir):
-                # Post the contents of the chunk file to the queue
-                with open(os.path.join(temp_dir, chunk_file_name),
-                          "r",
-                          encoding='utf-8') as file_chunk:
-                    message = aio_pika.Message(
-                        json.dumps({
-                            'file_id': str(file_id),
-                            'chunk_txt': file_chunk.read(),
-                            'chunk_location': int(chunk_file_name),
-                        }).encode('utf-8'), delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                    )
-                    print(f'Posting chunk: {chunk_file_name}', flush=True)
-                    await channel.declare_queue(
-                        settings.app_file_processing_stage_chunk2embedding_topic_name)
-                    # Sending the message
-                    await channel.default_exchange.publish(
-                        message,
-                        routing_key=settings.app_file_processing_stage_chunk2embedding_topic_name,
-                    )
+        )
+        session.commit()
+
+@describe(
+""" Copies the vector store rows of one file to another file, page by page.
+
+Returns:
+    int: The number of rows copied.
+""")
+def clone_milvus_rows(source_file_id: str, file_id: str) -> int: # pylint: disable=missing-function-docstring
+    num_rows = 0
+    for rows in vector_store.iter_file_chunks(source_file_id, MILVUS_CLONE_BATCH_SIZE):
+        vector_store.insert(
+            [file_id] * len(rows),
+            [row['chunk_location'] for row in rows],
+            np.asarray([row['chunk_embedding'] for row in rows], dtype=np.float32),
+            [row['chunk_txt'] for row in rows],
+        )
+        num_rows += len(rows)
+    return num_rows
+
+@describe(
+""" Processes a file by copying the chunks and embeddings of an identical, processed file.
+
+Re-uploads of the same document skip chunking and embedding entirely.  The copy is recorded once
+it is complete, so a redelivered file that was already copied is only announced again, and one
+whose copy was interrupted has the rows copied so far deleted before it is copied again.
+
+Returns:
+    bool: Whether the file was processed.
+""")
+async def clone_processed_duplicate(file_id: str, file_record: File) -> bool: # pylint: disable=missing-function-docstring
+    source_file_id = await asyncio.to_thread(find_processed_duplicate, file_record)
+    if not source_file_id:
+        return False
+    if await asyncio.to_thread(is_file_processed, file_id):
+        print(f"File {file_id} was already copied from file {source_file_id}", flush=True)
+        await util.announce_file_status(file_id, FILE_STATUS_COMPLETE)
+        return True
+    print(f"File {file_id} is a duplicate of file {source_file_id}, copying its chunks", flush=True)
+    # Delete the rows of an earlier, interrupted copy, so that they are not stored twice
+    await vector_store.delete_file(file_id)
+    num_chunks = await asyncio.to_thread(clone_milvus_rows, source_file_id, file_id)
+    if not num_chunks:
+        return False
+    await asyncio.to_thread(record_cloned_chunks, file_id, num_chunks)
+    print(f"Copied {num_chunks} chunks to file {file_id}", flush=True)
+    await util.announce_file_status(file_id, FILE_STATUS_COMPLETE)
+    return True
 
 @describe(
 """ Chunk a file.
 """)
-async def chunk_file(file_id: str, file_record: File, temp_file_path: str):
+async def chunk_file(file_id: str, file_record: File):
     """ Chunk a file.
     """
+    # Reuse the embeddings of an identical file, if there is one
+    if await clone_processed_duplicate(file_id, file_record):
+        return
     # Chunk the file
     if file_record.type == "txt":
-        await chunk_txt_file(file_id, temp_file_path)
+        await chunk_txt_file(file_id)
     else:
         print(f"Unsupported file type: {file_record.type}", flush=True)
         return
 
-async def post_file_status(file_id: str, status: str):
-    """ Posts the file status to a queue and updates it in the database.
+def update_file_status(file_id: str, status: str) -> bool:
+    """ Updates the file status in the database, returning whether the file exists.
     """
-    # Post the file status to a queue
     with Session(get_db_engine()) as session:
         file_record = session.exec(select(File).where(File.id == file_id)).first()
         if not file_record:
             print(f"File with ID {file_id} not found in database.", flush=True)
-            return
+            return False
         file_record.status = status
         session.add(file_record)
         session.commit()
-    await util.announce_file_status(file_id, status)
+    return True
+
+async def post_file_status(file_id: str, status: str):
+    """ Posts the file status to a queue and updates it in the database.
+    """
+    if await asyncio.to_thread(update_file_status, file_id, status):
+        # Post the file status to a queue
+        await util.announce_file_status(file_id, status)
 
 @describe(
 """ Main function.
+
+Args:
+    idle_timeout_sec (float|None): How long to wait for a file before exiting, or None to keep
+        running until shutdown.
 """)
-async def main(): # pylint: disable=missing-function-docstring
+async def main( # pylint: disable=missing-function-docstring
+    idle_timeout_sec: float|None = settings.app_file_processing_idle_timeout_seconds):
     # Iterate over the queue of file IDs, chunking each file
     print("Starting file processing", flush=True)
     async for file_id in get_file_id_from_queue(
-        settings.app_file_processing_stage_txtfile2chunk_topic_name):
+        settings.app_file_processing_stage_txtfile2chunk_topic_name, idle_timeout_sec):
         # Post to the status topic that the file is processing
         print(f"Processing file {file_id}", flush=True)
         print(f"Posting file status: {FILE_STATUS_PROCESSING}", flush=True)
@@ -179,21 +335,22 @@ async def main(): # pylint: disable=missing-function-docstring
         print(f"File status posted: {FILE_STATUS_PROCESSING}", flush=True)
         # Retrieve the file record from postgres
         print("Retrieving file record from postgres", flush=True)
-        file_record = get_file_record_from_postgres(file_id)
+        file_record = await asyncio.to_thread(get_file_record_from_postgres, file_id)
         print(f"File record retrieved from postgres: {file_record}", flush=True)
         if not file_record:
             print(f"File with ID {file_id} not found in database.", flush=True)
             continue
-        # Download the file from minio
-        print(f"Downloading file {file_id} from minio", flush=True)
-        temp_file_path = download_file_from_minio(file_id)
-        print(f"File {file_id} downloaded from minio", flush=True)
-        # Chunk the file
+        # Stream the file from minio and chunk it
         print(f"Chunking file {file_id}", flush=True)
-        await chunk_file(file_id, file_record, temp_file_path)
+        await chunk_file(file_id, file_record)
         print(f"File {file_id} chunked", flush=True)
-        # Delete the temporary file
-        os.unlink(temp_file_path)
+
+async def run_job(): # pylint: disable=missing-function-docstring
+    util.install_shutdown_handlers()
+    try:
+        await main()
+    finally:
+        await close_rabbitmq_connection()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run_job())
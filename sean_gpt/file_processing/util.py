@@ -2,59 +2,173 @@
 from contextlib import asynccontextmanager
 import json
 import asyncio
+import signal
+import time
 import aio_pika
 from ..config import settings
+from ..util.rabbitmq import open_rabbitmq_channel
+from ..util.file_status import publish_file_status
 
-async def iterate_queue(queue_name, channel, timeout_sec=5):
-    """ Iterates over a queue, yielding messages. """
+# Set when the process is asked to stop; consumers finish their current message and then exit
+shutdown_requested = asyncio.Event()
+
+def install_shutdown_handlers():
+    """ Requests a graceful shutdown when the process receives SIGTERM or SIGINT.
+
+    Must be called from within the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, shutdown_requested.set)
+
+async def iterate_queue(queue_name,
+                        channel,
+                        timeout_sec=settings.app_file_processing_idle_timeout_seconds):
+    """ Iterates over a queue, yielding messages.
+
+    Stops when no message is received within `timeout_sec` seconds, or when a shutdown is
+    requested.  A `timeout_sec` of None or 0 waits for messages until shutdown.
+    """
     # Declaring queue
     queue = await channel.declare_queue(queue_name)
 
     async with queue.iterator() as queue_iter:
+        while not shutdown_requested.is_set():
+            next_message = asyncio.ensure_future(queue_iter.__anext__()) # pylint: disable=unnecessary-dunder-call
+            shutdown = asyncio.ensure_future(shutdown_requested.wait())
+            done, _ = await asyncio.wait({next_message, shutdown},
+                                         timeout=timeout_sec or None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            shutdown.cancel()
+            if next_message in done:
+                yield next_message.result()
+                continue
+            next_message.cancel()
+            if shutdown in done:
+                print("Shutdown requested. Exiting.", flush=True)
+            else:
+                # Break the loop if no message is received in time
+                print(f"No message received in {timeout_sec} seconds. Exiting.", flush=True)
+            break
+
+async def iterate_message_batches( # pylint: disable=too-many-arguments
+    queue_name,
+    channel,
+    max_batch_size,
+    max_batch_delay_sec,
+    idle_timeout_sec=settings.app_file_processing_idle_timeout_seconds):
+    """ Iterates over a queue, yielding lists of unacknowledged messages.
+
+    A batch is yielded once it holds `max_batch_size` messages, or once its oldest message has
+    waited `max_batch_delay_sec` seconds, whichever comes first.  When the queue goes idle or a
+    shutdown is requested, the messages already received are yielded and the iteration stops.
+
+    The messages are not acknowledged; the caller acknowledges each batch once it has been
+    processed.  The channel's prefetch window is set to two batches, so that the next batch is
+    received while the current one is processed.
+    """
+    await channel.set_qos(prefetch_count=2 * max_batch_size)
+    received = asyncio.Queue()
+
+    async def receive_messages():
+        try:
+            async for message in iterate_queue(queue_name, channel, idle_timeout_sec):
+                await received.put(message)
+        finally:
+            # Signal the end of the queue
+            await received.put(None)
+
+    receiver = asyncio.ensure_future(receive_messages())
+    try:
+        batch = []
+        batch_deadline = None
         while True:
+            timeout = batch_deadline - time.monotonic() if batch else None
             try:
-                # Wait for a message for 5 seconds, then break if timeout occurs
-                message = await asyncio.wait_for(queue_iter.__anext__(), timeout=timeout_sec) # pylint: disable=unnecessary-dunder-call
-                yield message
+                message = await asyncio.wait_for(received.get(), timeout)
             except asyncio.TimeoutError:
-                # Break the loop if no message is received in 5 seconds
-                print("No message received in 5 seconds. Exiting.")
+                # The oldest message in the batch has waited long enough
+                yield batch
+                batch = []
+                continue
+            if message is None:
                 break
-
+            if not batch:
+                batch_deadline = time.monotonic() + max_batch_delay_sec
+            batch.append(message)
+            if len(batch) >= max_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        # Surface any error from the receiver
+        await receiver
+    finally:
+        receiver.cancel()
 
 @asynccontextmanager
 async def get_rabbitmq_channel():
-    """ Context manager for getting a RabbitMQ channel. """
-    connection = await aio_pika.connect_robust(host=settings.rabbitmq_host,
-                                               login=settings.rabbitmq_secret_username,
-                                               password=settings.rabbitmq_secret_password)
-
-    async with connection:
-        # Creating channel
-        channel = await connection.channel()
+    """ Context manager for getting a dedicated RabbitMQ channel on the process's connection. """
+    async with open_rabbitmq_channel() as channel:
         yield channel
 
+class BatchPublisher:
+    """ Publishes persistent JSON messages to a queue, pipelining the publisher confirms.
+
+    The queue is declared once on entry.  Publishes are sent without waiting for the broker to
+    confirm each one; the confirms are awaited together whenever `window_size` publishes are in
+    flight, and once more on exit.  The channel must have publisher confirms enabled (the aio_pika
+    default), otherwise the publishes are fire-and-forget.
+
+    Usage:
+        async with BatchPublisher(channel, queue_name) as publisher:
+            for payload in payloads:
+                await publisher.publish(payload)
+    """
+    def __init__(self,
+                 channel: aio_pika.abc.AbstractChannel,
+                 queue_name: str,
+                 window_size: int = settings.app_file_processing_publish_window_size):
+        self.channel = channel
+        self.queue_name = queue_name
+        self.window_size = window_size
+        self.num_published = 0
+        self._pending = []
+        self._start_time = None
+
+    async def __aenter__(self):
+        await self.channel.declare_queue(self.queue_name)
+        self._start_time = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            # Don't leave unawaited publishes behind, but don't hide the original exception
+            await asyncio.gather(*self._pending, return_exceptions=True)
+            self._pending = []
+            return
+        await self.flush()
+        elapsed = time.perf_counter() - self._start_time
+        rate = self.num_published / elapsed if elapsed > 0 else float('inf')
+        print(f"Published {self.num_published} messages to {self.queue_name} in "
+              f"{elapsed:.2f} seconds ({rate:.0f} messages/second)", flush=True)
+
+    async def publish(self, payload: dict):
+        """ Publishes a message, waiting for confirms if the window is full. """
+        message = aio_pika.Message(json.dumps(payload).encode('utf-8'),
+                                   delivery_mode=aio_pika.DeliveryMode.PERSISTENT)
+        self._pending.append(asyncio.ensure_future(
+            self.channel.default_exchange.publish(message, routing_key=self.queue_name)))
+        if len(self._pending) >= self.window_size:
+            await self.flush()
+
+    async def flush(self):
+        """ Waits for the broker to confirm every in-flight publish. """
+        pending, self._pending = self._pending, []
+        await asyncio.gather(*pending)
+        self.num_published += len(pending)
+
 async def announce_file_status(file_id, status):
-    """ Announces the file status to a queue.
+    """ Announces the file status to the file status exchange.
     """
-    connection = await aio_pika.connect_robust(
-        host=settings.rabbitmq_host,
-        login=settings.rabbitmq_secret_username,
-        password=settings.rabbitmq_secret_password)
-    async with connection:
-        exchange_name = "monitor_file_processing"
-
-        channel = await connection.channel()
-
-        exchange = await channel.declare_exchange(name=exchange_name, type="fanout")
-
-        await exchange.publish(
-            aio_pika.Message(
-            json.dumps({
-                'file_id': file_id,
-                'status': status
-            }).encode('utf-8'),
-            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-        ),
-            routing_key='',
-        )
+    await publish_file_status(file_id, status)
@@ -0,0 +1,65 @@
+""" Runs file processing stages as a long-lived worker.
+
+Unlike the per-stage kubernetes jobs, which exit once their queue has been idle for a few seconds,
+the worker keeps consuming until it receives SIGTERM or SIGINT.  It then stops taking new messages,
+finishes the work in hand, and exits.  Imports, the OpenAI client, the milvus connection and the
+database engine are set up once for the life of the process, so small uploads do not wait on pod
+scheduling and cold starts, and all stages share one RabbitMQ connection.
+
+Usage:
+    python -m sean_gpt.file_processing.worker [--stage STAGE ...] [--idle-timeout SECONDS]
+"""
+import argparse
+import asyncio
+import importlib
+
+from . import util
+from ..util.rabbitmq import close_rabbitmq_connection
+
+STAGES = ("txtfile2chunk", "chunk2embedding")
+
+async def run_stage(stage: str, idle_timeout_sec: float|None):
+    """ Runs a stage until shutdown (or idle timeout), restarting it if it fails.
+
+    Args:
+        stage (str): The name of the stage, one of STAGES.
+        idle_timeout_sec (float|None): How long the stage waits for a message before exiting, or
+            None to keep running until shutdown.
+    """
+    # Import lazily so that only the requested stages connect to their services
+    stage_module = importlib.import_module(f".stage_{stage}", __package__)
+    while not util.shutdown_requested.is_set():
+        try:
+            await stage_module.main(idle_timeout_sec)
+        except Exception as exc: # pylint: disable=broad-exception-caught
+            print(f"Stage {stage} failed, restarting: {exc!r}", flush=True)
+            await asyncio.sleep(1)
+            continue
+        if idle_timeout_sec:
+            # The stage exited because its queue was idle
+            break
+    print(f"Stage {stage} stopped", flush=True)
+
+async def main(stages: list[str], idle_timeout_sec: float|None):
+    """ Runs the stages concurrently in this process until shutdown.
+
+    Args:
+        stages (list[str]): The names of the stages to run.
+        idle_timeout_sec (float|None): How long each stage waits for a message before exiting, or
+            None to keep running until shutdown.
+    """
+    util.install_shutdown_handlers()
+    try:
+        await asyncio.gather(*(run_stage(stage, idle_timeout_sec) for stage in stages))
+    finally:
+        await close_rabbitmq_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run file processing stages as a worker.")
+    parser.add_argument("--stage", dest="stages", action="append", choices=STAGES,
+                        help="A stage to run.  May be repeated.  Defaults to all stages.")
+    parser.add_argument("--idle-timeout", type=float, default=0,
+                        help="Exit after this many idle seconds.  0 (the default) runs until "
+                             "SIGTERM.")
+    args = parser.parse_args()
+    asyncio.run(main(args.stages or list(STAGES), args.idle_timeout or None))
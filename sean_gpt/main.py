@@ -6,15 +6,25 @@ import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from prometheus_client import start_http_server
 
+from .config import settings
 from .util.database import (
-    reset_db_connection, create_admin_if_necessary, create_milvus_collection_if_necessary)
+    reset_db_connection,
+    create_admin_if_necessary,
+    create_milvus_collection_if_necessary,
+    dispose_async_db_engine)
 from .routers import chat
 from .routers import user
 from .routers import twilio
 from .routers import generate
 from .routers import file
 from .routers import share_set
+from .util.rabbitmq import get_rabbitmq_connection, close_rabbitmq_connection
+from .util.file_status import file_status_hub
+from .util.minio_client import create_bucket_if_necessary, is_minio_healthy
+from .util.vector_store import vector_store
 from .util.user import IsVerifiedUserDep
 
 if os.environ.get('SEAN_GPT_DEBUG', '0') == '1':
@@ -23,15 +33,26 @@ if os.environ.get('SEAN_GPT_DEBUG', '0') == '1':
 @asynccontextmanager
 async def lifespan(_): # pylint: disable=missing-function-docstring
     # Startup logic
+    # Prometheus metrics of this process, on a port that the ingress does not route to
+    start_http_server(settings.api_metrics_port)
     reset_db_connection()
-    create_milvus_collection_if_necessary()
+    if settings.vector_store_backend == "milvus":
+        create_milvus_collection_if_necessary()
+    await vector_store.connect()
     create_admin_if_necessary()
+    create_bucket_if_necessary()
+    await get_rabbitmq_connection()
+    await file_status_hub.start()
     if os.environ.get('SEAN_GPT_DEBUG', '0') == '1':
         mock.startup()
     yield
     if os.environ.get('SEAN_GPT_DEBUG', '0') == '1':
         mock.shutdown()
     # Shutdown logic
+    await file_status_hub.stop()
+    await close_rabbitmq_connection()
+    await vector_store.close()
+    await dispose_async_db_engine()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -58,7 +79,22 @@ app.include_router(share_set.router)
 @app.get("/health")
 async def health_check():
     """ Health check endpoint.
+
+    This is the readiness probe, so it only reports on this process.  A dependency outage would
+    otherwise take every replica out of the service at once.
+    """
+    return {"status": "ok"}
+
+@app.get("/health/minio")
+async def minio_health_check():
+    """ Object storage health check endpoint.
+
+    Object storage is probed here, rather than on every request that uses it.
     """
+    if not await is_minio_healthy():
+        return JSONResponse(status_code=503,
+                            content={"status": "unavailable",
+                                     "detail": "Object storage unreachable"})
     return {"status": "ok"}
 
 if os.environ.get('SEAN_GPT_DEBUG', '0') == '1':
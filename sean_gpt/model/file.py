@@ -5,7 +5,9 @@ from uuid import UUID
 from datetime import datetime
 from typing import List, Optional
 
+from sqlalchemy import Column, ForeignKey
 from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel.sql.sqltypes import GUID
 
 FILE_STATUS_AWAITING_PROCESSING = "awaiting processing"
 FILE_STATUS_PROCESSING = "processing"
@@ -31,6 +33,15 @@ class TextFileChunkingStatus(SQLModel, table=True):
 
     file: "File" = Relationship(back_populates="processing_status")
 
+class ProcessedChunk(SQLModel, table=True):
+    """ A chunk of a file whose embedding was stored, recorded so that it is only counted once.
+
+    The rows are deleted with their file by the database, without loading them.
+    """
+    file_id: UUID = Field(sa_column=Column(GUID(), ForeignKey("file.id", ondelete="CASCADE"),
+                                           primary_key=True))
+    chunk_location: int = Field(primary_key=True)
+
 class File(SQLModel, table=True):
     """ File model. """
     id: UUID = Field(default_factory=uuid.uuid4, primary_key=True)
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Header, HTTPException, status
 from sqlmodel import select
 
 from ...util.describe import describe
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...model.chat import Chat
 from ...util.user import AuthenticatedUserDep
 
@@ -18,19 +18,19 @@ A user can only delete their own chats.
 Args:
     chat_id (UUID): The id of the chat to delete. Stored in the header.
     current_user (AuthenticatedUserDep): The current user.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
 """)
 @router.delete("", status_code=status.HTTP_204_NO_CONTENT)
-def delete_chat( # pylint: disable=missing-function-docstring
+async def delete_chat( # pylint: disable=missing-function-docstring
     *,
     x_chat_id: str = Header(),
     current_user: AuthenticatedUserDep,
-    session: SessionDep):
-    chat = session.exec(select(Chat).where(Chat.id == x_chat_id)).first()
+    session: AsyncSessionDep):
+    chat = (await session.exec(select(Chat).where(Chat.id == x_chat_id))).first()
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
     if chat.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
-    session.delete(chat)
-    session.commit()
+    await session.delete(chat)
+    await session.commit()
     return chat
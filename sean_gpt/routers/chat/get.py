@@ -5,7 +5,7 @@ from typing import List
 from fastapi import APIRouter
 from sqlmodel import select
 
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...model.chat import Chat, ChatRead
 from ...util.user import AuthenticatedUserDep
 from ...util.describe import describe
@@ -19,21 +19,21 @@ Args:
     name (str): The name of the chat to filter by.
     id (UUID): The id of the chat to filter by.
     current_user (AuthenticatedUserDep): The current user.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
 
 Returns:
     A list of chats.
 """)
 @router.get("")
-def get_chats( # pylint: disable=missing-function-docstring
+async def get_chats( # pylint: disable=missing-function-docstring
     *,
     name: None|str = None,
     id: None|UUID = None, # pylint: disable=redefined-builtin
     current_user: AuthenticatedUserDep,
-    session: SessionDep) -> List[ChatRead]:
+    session: AsyncSessionDep) -> List[ChatRead]:
     query = select(Chat).where(Chat.user_id == current_user.id)
     if name:
         query = query.where(Chat.name == name)
     if id:
         query = query.where(Chat.id == id)
-    return session.exec(query).all()
+    return (await session.exec(query)).all()
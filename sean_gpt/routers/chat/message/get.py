@@ -2,10 +2,11 @@
 from fastapi import APIRouter, Header, HTTPException, status
 from sqlmodel import select
 
+from ....util.chat import count_chat_messages
 from ....util.describe import describe
-from ....util.database import SessionDep
+from ....util.database import AsyncSessionDep
 from ....model.chat import Chat
-from ....model.message import MessageRead
+from ....model.message import Message, MessageRead
 from ....util.user import AuthenticatedUserDep
 
 router = APIRouter(prefix="/message")
@@ -17,24 +18,24 @@ Note that the user can only get messages from chats that they own.
 
 Args:
     x_chat_id (str): The chat id.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
     current_user (AuthenticatedUserDep): The current user.
 
 Returns:
     dict: The number of messages in the chat.
 """)
 @router.get("/len", status_code=status.HTTP_200_OK)
-def get_message_len(*, # pylint: disable=missing-function-docstring
+async def get_message_len(*, # pylint: disable=missing-function-docstring
     x_chat_id: str = Header(),
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep
 ) -> dict:
-    chat = session.exec(select(Chat).where(Chat.id == x_chat_id)).first()
+    chat = (await session.exec(select(Chat).where(Chat.id == x_chat_id))).first()
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found.")
     if not chat.user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found.")
-    return {'len':len(chat.messages)}
+    return {'len':await count_chat_messages(chat.id, session)}
 
 @describe(
 """ Gets the messages for the specified chat.
@@ -47,7 +48,7 @@ If the chat_index is out of bounds or negative, raise a 404 error.
 
 Args:
     x_chat_id (str): The chat id.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
     current_user (AuthenticatedUserDep): The current user.
     chat_index (int): The chat index.
 
@@ -55,13 +56,13 @@ Returns:
     MessageRead: The message.
 """)
 @router.get("", status_code=status.HTTP_200_OK)
-def get_message(*, # pylint: disable=missing-function-docstring
+async def get_message(*, # pylint: disable=missing-function-docstring
     x_chat_id: str = Header(),
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep,
     chat_index: int = 0
 ) -> MessageRead:
-    chat = session.exec(select(Chat).where(Chat.id == x_chat_id)).first()
+    chat = (await session.exec(select(Chat).where(Chat.id == x_chat_id))).first()
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found.")
     if not chat.user_id == current_user.id:
@@ -72,6 +73,9 @@ def get_message(*, # pylint: disable=missing-function-docstring
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="Chat index must be positive.")
     # If the chat_index is beyond the end of the list, raise an error.
-    if chat_index >= len(chat.messages):
+    message = (await session.exec(select(Message)
+                                  .where(Message.chat_id == chat.id)
+                                  .where(Message.chat_index == chat_index))).first()
+    if not message:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found.")
-    return chat.messages[chat_index]
+    return message
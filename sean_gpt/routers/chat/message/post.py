@@ -2,8 +2,9 @@
 from fastapi import APIRouter, Header, HTTPException, status, Body
 from sqlmodel import select
 
+from ....util.chat import count_chat_messages
 from ....util.describe import describe
-from ....util.database import SessionDep
+from ....util.database import AsyncSessionDep
 from ....model.chat import Chat
 from ....model.message import Message, MessageCreate, MessageRead
 from ....util.user import AuthenticatedUserDep
@@ -18,28 +19,28 @@ Note that the user can only create messages in chats that they own.
 Args:
     x_chat_id (str): The ID of the chat to create the message in (header).
     message (MessageCreate): The message to create.
-    session (Session): The database session (dependency).
+    session (AsyncSession): The database session (dependency).
     current_user (AuthenticatedUser): The current user (dependency).
     
 Returns:
     The created message.
 """)
 @router.post("", status_code=status.HTTP_201_CREATED)
-def create_message(*, # pylint: disable=missing-function-docstring
+async def create_message(*, # pylint: disable=missing-function-docstring
     x_chat_id: str = Header(),
     message: MessageCreate = Body(),
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep
 ) -> MessageRead:
-    chat = session.exec(select(Chat).where(Chat.id == x_chat_id)).first()
+    chat = (await session.exec(select(Chat).where(Chat.id == x_chat_id))).first()
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found.")
     if not chat.user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found.")
     message = Message(**message.model_dump(),
                       chat_id=chat.id,
-                      chat_index=len(chat.messages))
+                      chat_index=await count_chat_messages(chat.id, session))
     session.add(message)
-    session.commit()
-    session.refresh(message)
+    await session.commit()
+    await session.refresh(message)
     return message
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, status
 from openai import OpenAI
 
 from ...util.user import AuthenticatedUserDep
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...model.chat import ChatRead, Chat, ChatCreate
 from ...model.ai import AI
 from ...ai import default_ai
@@ -20,20 +20,20 @@ Args:
     new_chat (ChatCreate): The chat to create.
     ai (AI): The AI to use for this chat.
     current_user (AuthenticatedUserDep): The current user.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
 
 Returns:
     The created chat.
 """)
 @router.post("", status_code=status.HTTP_201_CREATED)
-def create_chat( # pylint: disable=missing-function-docstring
+async def create_chat( # pylint: disable=missing-function-docstring
     *,
     new_chat: ChatCreate,
     ai:AI = Depends(default_ai),
     current_user: AuthenticatedUserDep,
-    session: SessionDep) -> ChatRead:
+    session: AsyncSessionDep) -> ChatRead:
     chat = Chat(**new_chat.model_dump(), user_id=current_user.id, assistant_id=ai.id)
     session.add(chat)
-    session.commit()
-    session.refresh(chat)
+    await session.commit()
+    await session.refresh(chat)
     return chat
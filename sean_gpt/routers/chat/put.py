@@ -7,7 +7,7 @@ from pydantic import BaseModel
 
 from ...util.describe import describe
 from ...util.user import AuthenticatedUserDep
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...model.chat import Chat
 
 router = APIRouter(prefix="/chat")
@@ -23,26 +23,26 @@ Args:
     update_params (ChatUpdate): The chat to update.
     chat_id (UUID): The id of the chat to update. Stored in the header.
     current_user (AuthenticatedUserDep): The current user.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
 """)
 @router.put("", status_code=status.HTTP_204_NO_CONTENT)
-def update_chat( # pylint: disable=missing-function-docstring
+async def update_chat( # pylint: disable=missing-function-docstring
     *,
     update_params: ChatUpdate,
     x_chat_id: str = Header(),
     current_user: AuthenticatedUserDep,
-    session: SessionDep):
+    session: AsyncSessionDep):
     try:
         uuid.UUID(x_chat_id)
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found") from exc
 
-    chat = session.exec(select(Chat).where(Chat.id == x_chat_id)).first()
+    chat = (await session.exec(select(Chat).where(Chat.id == x_chat_id))).first()
     if not chat:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
     if chat.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
     if update_params.name:
         chat.name = update_params.name
-    session.commit()
-    session.refresh(chat)
+    await session.commit()
+    await session.refresh(chat)
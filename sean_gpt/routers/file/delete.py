@@ -4,14 +4,13 @@ import uuid
 
 from fastapi import APIRouter, HTTPException, status
 from sqlmodel import select
-from pymilvus import connections, Collection
 
 from ...util.user import AuthenticatedUserDep
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...util.minio_client import MinioClientDep, USER_UPLOAD_BUCKET_NAME
 from ...util.describe import describe
+from ...util.vector_store import vector_store
 from ...model.file import File, ShareSet, FileShareSetLink
-from ...config import settings
 
 router = APIRouter(
     prefix="/file"
@@ -27,29 +26,29 @@ Args:
 async def delete_file( # pylint: disable=missing-function-docstring
     *,
     file_id: uuid.UUID,
-    session: SessionDep,
+    session: AsyncSessionDep,
     minio_client: MinioClientDep,
     current_user: AuthenticatedUserDep) -> None:
     # Delete the file from the database
-    file_record = session.exec(select(File).where(File.id == file_id)).first()
+    file_record = (await session.exec(select(File).where(File.id == file_id))).first()
     # Only the file owner can delete the file
     if file_record is None or file_record.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="File not found")
 
     # Delete the all the file's share set links from the database
-    share_set_links = session.exec(select(FileShareSetLink)
-                                   .where(FileShareSetLink.file_id == file_id)).all()
+    share_set_links = (await session.exec(select(FileShareSetLink)
+                                          .where(FileShareSetLink.file_id == file_id))).all()
     for share_set_link in share_set_links:
-        session.delete(share_set_link)
+        await session.delete(share_set_link)
     # Need to unlink the share sets and files before deleting
-    session.commit()
+    await session.commit()
 
-    share_set = session.exec(select(ShareSet).where(ShareSet.id ==
-                                                    file_record.default_share_set_id)).first()
+    share_set = (await session.exec(
+        select(ShareSet).where(ShareSet.id == file_record.default_share_set_id))).first()
     if share_set is None:
         raise HTTPException(status_code=404, detail="Share set not found")
-    session.delete(file_record)
-    session.commit()
+    await session.delete(file_record)
+    await session.commit()
 
     # Delete the file from the minio service
     try:
@@ -61,12 +60,7 @@ async def delete_file( # pylint: disable=missing-function-docstring
         raise HTTPException(status_code=500, detail=str(exception)) from exception
 
     # Delete the embeddings associated with this file from milvus
-    connections.connect(host=settings.milvus_host, port=settings.milvus_port)
-    milvus_collection = Collection(name=settings.milvus_collection_name)
-    milvus_collection.load()
-    milvus_collection.delete(
-        expr=f'file_id in {[str(file_id)]}',
-    )
+    await vector_store.delete_file(str(file_id))
 
-    session.delete(share_set)
-    session.commit()
+    await session.delete(share_set)
+    await session.commit()
@@ -1,29 +1,74 @@
 """ File DELETE endpoint.
 """
 import uuid
-from typing import Annotated, List, Union
-import tempfile
-import os
+from typing import Annotated, Iterator, List, Tuple, Union
+from urllib.parse import quote
+import asyncio
+import mimetypes
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.responses import Response, StreamingResponse
 from sqlmodel import select
-from pymilvus import connections, Collection
-import openai
 
 from ...util.minio_client import MinioClientDep, USER_UPLOAD_BUCKET_NAME
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...util.user import AuthenticatedUserDep
 from ...util.describe import describe
+from ...util.embedding import embed_query
+from ...util.vector_store import vector_store
 from ...model.file import File, ShareSet, FileShareSetLink
-from ...config import settings
-
-openai_client = openai.OpenAI(api_key = settings.openai_api_key)
 
 router = APIRouter(
     prefix="/file"
 )
 
+# The size of the blocks streamed from minio to the client
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+@describe(
+""" Parses the byte range of a Range header.
+
+Only a single range is supported.  Multiple ranges, and headers that are not byte ranges, are
+ignored, so the whole file is sent, as RFC 9110 allows.
+
+Args:
+    range_header (str): The value of the Range header.
+    size (int): The size of the file.
+
+Returns:
+    Tuple[int, int]: The first and last byte of the range (inclusive), or None for the whole file.
+
+Raises:
+    HTTPException: 416 if the range is not satisfiable.
+""")
+def parse_byte_range( # pylint: disable=missing-function-docstring
+    range_header: str, size: int) -> Tuple[int, int] | None:
+    unit, _, byte_range = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in byte_range:
+        return None
+    first, _, last = byte_range.strip().partition('-')
+    try:
+        if first:
+            first, last = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            # A suffix range: the last N bytes
+            first, last = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if first > last or first >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable.",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return first, last
+
+@describe(
+""" Yields the blocks of a minio object response, releasing the connection afterwards. """)
+def stream_minio_object(minio_response) -> Iterator[bytes]: # pylint: disable=missing-function-docstring
+    try:
+        yield from minio_response.stream(DOWNLOAD_CHUNK_SIZE)
+    finally:
+        minio_response.close()
+        minio_response.release_conn()
+
 @describe(
 """ Gets a file.
 
@@ -31,7 +76,7 @@ Args:
     file_id (UUID): The id of the file to retrieve.
     share_set_id (UUID): The id of the share set to retrieve.
     semantic_search (str): The semantic content query to match.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
 """)
 @router.get("")
 async def get_files( # pylint: disable=missing-function-docstring
@@ -39,7 +84,7 @@ async def get_files( # pylint: disable=missing-function-docstring
     file_id: Annotated[Union[uuid.UUID, None], Query()] = None,
     share_set_id: Annotated[uuid.UUID | None, Query()] = None,
     semantic_search: Annotated[str | None, Query()] = None,
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep) -> List[File]:
     # Important:  A file can only be accessed if it is:
     #   1. Owned by the user making the request OR
@@ -52,36 +97,24 @@ async def get_files( # pylint: disable=missing-function-docstring
         if share_set_id is not None or semantic_search is not None:
             raise HTTPException(status_code=400, detail="Cannot use file_id with other arguments.")
 
-        ret_files = session.exec(select(File).where(File.id == file_id)).all()
+        ret_files = (await session.exec(select(File).where(File.id == file_id))).all()
     # Retrieve a list of files by share_set_id
     # This requires a join with FileShareSetLink
     elif share_set_id is not None and semantic_search is None:
-        return session.exec(
+        return (await session.exec(
             select(File).join(FileShareSetLink).where(FileShareSetLink.share_set_id == share_set_id)
-        ).all()
+        )).all()
     # Retrieve a list of files by semantic_search
     elif semantic_search is not None:
-        # First, get the embedding of the search query from OpenAI
-        response = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=semantic_search,
-            encoding_format="float"
-        )
-        embedding = response['data'][0]['embedding']
+        # First, get the embedding of the search query, from the cache or else from OpenAI
+        embedding = await embed_query(semantic_search)
         # Then, use the embedding to search for similar embeddings in milvus
-        connections.connect(host=settings.milvus_host, port=settings.milvus_port)
-        milvus_collection = Collection(name=settings.milvus_collection_name)
-        milvus_collection.load()
-        results = milvus_collection.search(
-            data=[embedding],
-            anns_field='chunk_embedding',
-            limit=10, # TODO: Make this configurable in the GET query
-            param={},
-            output_fields=['file_id']
-        )
+        hits = await vector_store.search(embedding,
+                                         limit=10, # TODO: Make this configurable in the GET query
+                                         output_fields=['file_id'])
         # Finally, retrieve the files that match the results
-        file_ids = [hit.entity.get('file_id') for hit in results[0]]
-        ret_files = session.exec(select(File).where(File.id.in_(file_ids))).all() # pylint: disable=no-member
+        file_ids = [hit['file_id'] for hit in hits]
+        ret_files = (await session.exec(select(File).where(File.id.in_(file_ids)))).all() # pylint: disable=no-member
         print(f'Found {len(ret_files)} files matching semantic search', flush=True)
         print(f'Files: {ret_files}', flush=True)
     else:
@@ -96,8 +129,8 @@ async def get_files( # pylint: disable=missing-function-docstring
             file_ids_to_keep.append(file.id)
             continue
         # Check if the file is public
-        default_share_set = session.exec(select(ShareSet).where(ShareSet.id ==
-                                                                file.default_share_set_id)).first()
+        default_share_set = (await session.exec(
+            select(ShareSet).where(ShareSet.id == file.default_share_set_id))).first()
         if default_share_set.is_public:
             file_ids_to_keep.append(file.id)
             continue
@@ -109,46 +142,73 @@ async def get_files( # pylint: disable=missing-function-docstring
 @describe(
 """ Downloads a file.
 
+The file is streamed from object storage as it is sent, so neither the time to the first byte nor
+the disk usage of the server depend on the size of the file.  The file's hash is its ETag, so
+clients can revalidate with If-None-Match, and a single byte range can be requested with Range
+(and If-Range).
+
 Args:
     id (UUID): The id of the file to download.
 
 Returns:
-    FileResponse: The file to download.
+    StreamingResponse: The file (or the requested range of it) to download.
 """)
-@router.get("/download/{file_id}")
-async def download_file( # pylint: disable=missing-function-docstring
+@router.get("/download/{file_id}", response_model=None)
+async def download_file( # pylint: disable=missing-function-docstring disable=too-many-arguments disable=too-many-locals
     file_id: uuid.UUID,
-    session: SessionDep,
+    session: AsyncSessionDep,
     minio_client: MinioClientDep,
-    current_user: AuthenticatedUserDep) -> FileResponse:
+    current_user: AuthenticatedUserDep,
+    range_header: Annotated[str | None, Header(alias="Range")] = None,
+    if_range: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None) -> Response:
     # Important:  A file can only be downloaded if it is:
     #   1. Owned by the user making the request OR
     #   2. A public file
     # A file is public if the default share set is public
-    file = session.exec(select(File).where(File.id == file_id)).first()
+    file = (await session.exec(select(File).where(File.id == file_id))).first()
     if file is None:
         raise HTTPException(status_code=404, detail="File not found.")
     # Check if the user can access the file
     if file.owner_id != current_user.id:
         # Check if the file is public
-        default_share_set = session.exec(select(ShareSet).where(ShareSet.id ==
-                                                                file.default_share_set_id)).first()
+        default_share_set = (await session.exec(
+            select(ShareSet).where(ShareSet.id == file.default_share_set_id))).first()
         if not default_share_set.is_public:
             raise HTTPException(status_code=404, detail="File not found.")
 
-    # Retrieve the file from minio, directly to a temporary file
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        minio_client.fget_object(
-            USER_UPLOAD_BUCKET_NAME,
-            str(file.id),
-            temp_file.name
-        )
-
-    async def delete_temp_file():
-        """ Deletes the temporary file. """
-        os.unlink(temp_file.name)
-
-    # Return the file
-    return FileResponse(temp_file.name,
-                        filename=file.name,
-                        background=delete_temp_file)
+    # Files cannot be edited once they are uploaded, so the content hash is a strong ETag
+    etag = f'"{file.hash}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if if_none_match is not None and (
+        if_none_match.strip() == '*' or
+        etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))):
+        return Response(status_code=304, headers=headers)
+
+    # Determine the range to send.  A stale If-Range means the whole file is sent instead.
+    byte_range = None
+    if range_header is not None and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_byte_range(range_header, file.size)
+    # An offset and length of 0 get the whole object
+    status_code, offset, length = 200, 0, 0
+    headers["Content-Length"] = str(file.size)
+    if byte_range is not None:
+        status_code, offset, length = 206, byte_range[0], byte_range[1] - byte_range[0] + 1
+        headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{file.size}"
+        headers["Content-Length"] = str(length)
+    quoted_name = quote(file.name)
+    headers["Content-Disposition"] = (f'attachment; filename="{file.name}"'
+                                      if quoted_name == file.name else
+                                      f"attachment; filename*=utf-8''{quoted_name}")
+
+    # Stream the file from minio.  The blocking minio calls run in the thread pool.
+    minio_response = await asyncio.to_thread(minio_client.get_object,
+                                             USER_UPLOAD_BUCKET_NAME,
+                                             str(file.id),
+                                             offset=offset,
+                                             length=length)
+    return StreamingResponse(stream_minio_object(minio_response),
+                             status_code=status_code,
+                             headers=headers,
+                             media_type=(mimetypes.guess_type(file.name)[0] or
+                                         "application/octet-stream"))
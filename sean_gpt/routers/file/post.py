@@ -1,7 +1,8 @@
 """ File POST endpoint.
 """
+from typing import BinaryIO
+import asyncio
 import hashlib
-import tempfile
 import os
 import uuid
 import json
@@ -10,8 +11,10 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 import aio_pika
 
 from ...util.user import AuthenticatedUserDep
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...util.minio_client import MinioClientDep, USER_UPLOAD_BUCKET_NAME
+from ...util.rabbitmq import acquire_rabbitmq_channel
+from ...util.file_status import publish_file_status
 from ...util.describe import describe
 from ...model.file import (
     File as FileModel,
@@ -26,6 +29,31 @@ router = APIRouter(
     prefix="/file"
 )
 
+class FileTooLargeError(Exception):
+    """ Raised when an upload exceeds the maximum file size. """
+
+class HashingReader: # pylint: disable=too-few-public-methods
+    """ Reads a file, hashing and counting the bytes as they are read.
+
+    Args:
+        file (BinaryIO): The file to read.
+        max_size (int): The maximum number of bytes to read before raising FileTooLargeError.
+    """
+    def __init__(self, file: BinaryIO, max_size: int):
+        self.file = file
+        self.max_size = max_size
+        self.size = 0
+        self.sha256_hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        """ Reads, hashes and counts up to `size` bytes. """
+        data = self.file.read(size)
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise FileTooLargeError()
+        self.sha256_hash.update(data)
+        return data
+
 # TODO: This function is getting out of hand. It should be refactored into smaller building blocks.
 @describe(
 """ Uploads a file.
@@ -37,7 +65,7 @@ Args:
 async def upload_file( # pylint: disable=missing-function-docstring disable=too-many-locals
     *,
     file: UploadFile = File(...),
-    session: SessionDep,
+    session: AsyncSessionDep,
     minio_client: MinioClientDep,
     current_user: AuthenticatedUserDep) -> FileModel:
     # Determine the file type from the file extension
@@ -47,36 +75,35 @@ async def upload_file( # pylint: disable=missing-function-docstring disable=too-
             status_code=422,
             detail=f"File type {file_extension} is not supported."
         )
+    # Reject files that are too large before storing anything
+    if file.size is not None and file.size > settings.app_file_upload_max_size_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Files cannot be larger than {settings.app_file_upload_max_size_bytes} bytes."
+        )
+    # Create the file's unique id
+    file_id = uuid.uuid4()
+    # Stream the file to the minio service in multipart upload parts, hashing it and calculating
+    # its size on the way.  The blocking reads and uploads run in the thread pool.  The database
+    # rows are only created once the object is stored, so a rejected or failed upload leaves none
+    # behind (minio aborts the multipart upload itself).
+    reader = HashingReader(file.file, settings.app_file_upload_max_size_bytes)
+    try:
+        await asyncio.to_thread(minio_client.put_object,
+                                USER_UPLOAD_BUCKET_NAME,
+                                str(file_id),
+                                reader,
+                                length=-1,
+                                part_size=settings.app_file_upload_part_size_bytes)
+    except FileTooLargeError as err:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Files cannot be larger than {settings.app_file_upload_max_size_bytes} bytes."
+        ) from err
     # Create the default share set for this file
     default_share_set = ShareSet(name="",
                                  is_public=False,
                                  owner_id=current_user.id)
-    session.add(default_share_set)
-    session.commit()
-    session.refresh(default_share_set)
-    # Create the file's unique id
-    file_id = uuid.uuid4()
-    # Hash the file, calculate its size, and put it in temporary storage
-    sha256_hash = hashlib.sha256()
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    chunk_size = 8192
-    chunk = await file.read(chunk_size)
-    while len(chunk) > 0:
-        sha256_hash.update(chunk)
-        temp_file.write(chunk)
-        chunk = await file.read(chunk_size)
-    file_hash = sha256_hash.hexdigest()
-    temp_file.close()
-    # Store the file in the minio service
-    try:
-        minio_client.fput_object(
-            USER_UPLOAD_BUCKET_NAME,
-            str(file_id),
-            temp_file.name
-        )
-    finally:
-        # Remove the temporary file
-        os.unlink(temp_file.name)
     # Create a file record in the database
     file_record = FileModel(
         id=file_id,
@@ -85,38 +112,26 @@ async def upload_file( # pylint: disable=missing-function-docstring disable=too-
         status=FILE_STATUS_AWAITING_PROCESSING,
         name=file.filename,
         type=file_extension,
-        hash=file_hash,
-        size=file.size
+        hash=reader.sha256_hash.hexdigest(),
+        size=reader.size
     )
-    session.add(file_record)
-    session.commit()
     # Create the link between the file and its default share set
     file_share_set_link = FileShareSetLink(
         file_id=file_id,
         share_set_id=default_share_set.id
     )
-    session.add(file_share_set_link)
-    session.commit()
-    session.refresh(file_record)
-    # Pass the file's status (awaiting processing) to the queue for file-monitoring
-    connection = await aio_pika.connect_robust(host=settings.rabbitmq_host,
-                                            login=settings.rabbitmq_secret_username,
-                                            password=settings.rabbitmq_secret_password)
-    async with connection:
-        channel = await connection.channel()
-
-        exchange = await channel.declare_exchange(name="monitor_file_processing", type="fanout")
-
-        await exchange.publish(
-            aio_pika.Message(
-            json.dumps({
-                'file_id': str(file_id),
-                'status': FILE_STATUS_AWAITING_PROCESSING
-            }).encode('utf-8'),
-            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-        ),
-            routing_key='',
-        )
+    # Add the rows in one transaction, and remove the stored object if they cannot be added
+    session.add_all([default_share_set, file_record, file_share_set_link])
+    try:
+        await session.commit()
+    except Exception:
+        await asyncio.to_thread(minio_client.remove_object, USER_UPLOAD_BUCKET_NAME, str(file_id))
+        raise
+    await session.refresh(file_record)
+    # Borrow a pooled channel only to publish, so it is not held while the upload streams
+    async with acquire_rabbitmq_channel() as channel:
+        # Pass the file's status (awaiting processing) to the queue for file-monitoring
+        await publish_file_status(file_id, FILE_STATUS_AWAITING_PROCESSING, channel)
 
         await channel.declare_queue(settings.app_file_processing_stage_txtfile2chunk_topic_name)
         # Sending the message
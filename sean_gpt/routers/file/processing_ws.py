@@ -1,17 +1,16 @@
 """ This module contains the route for monitoring file processing status via websocket.
 """
 import uuid
-import json
 import asyncio
 
 from fastapi import APIRouter, WebSocket, WebSocketException, WebSocketDisconnect, Query, status
 from sqlmodel import select
-import aio_pika
 
 from ...util.describe import describe
 from ...config import settings
-from ...util.database import RedisConnectionDep, SessionDep
-from ...util.user import IsVerifiedUserDep
+from ...util.database import RedisConnectionDep, AsyncSessionDep
+from ...util.file_status import file_status_hub
+from ...util.user import AuthenticatedUserDep, IsVerifiedUserDep
 from ...model.file import File, ORDERED_FILE_STATUSES
 
 router = APIRouter(prefix="/file/processing")
@@ -27,25 +26,26 @@ Returns:
 """)
 @router.get("/token", dependencies=[IsVerifiedUserDep])
 async def generate_chat_response( # pylint: disable=missing-function-docstring
-    redis_conn: RedisConnectionDep):
+    redis_conn: RedisConnectionDep,
+    current_user: AuthenticatedUserDep):
     # Create the token using uuid4
     token = str(uuid.uuid4())
-    # Save the token in redis with a timeout
-    await redis_conn.set(token, 1, ex=settings.app_ws_token_timeout_seconds)
+    # Save the token in redis with a timeout, recording whose files it may monitor
+    await redis_conn.set(token, str(current_user.id), ex=settings.app_ws_token_timeout_seconds)
     # Return the token
     return {"token": token}
 
 @describe(
 """ Generates a chat completion stream via websocket.
 
-The current file status is stored in the file record of the postgres database.  Redis is used for
-inter-process communication, so there is a pubsub channel where file status notifications are
-published.
+The current file status is stored in the file record of the postgres database.  Later status
+changes are delivered by this process's file status hub, which receives only the events of the
+files being watched.  Only the owner of a file, as recorded with the token, may monitor it.
 
 Args:
     token (str):  The token generated by the /token endpoint.
     redis_conn (RedisConnectionDep):  The redis connection.
-    session (SessionDep):  The database session.
+    session (AsyncSessionDep):  The database session.
     websocket (WebSocket):  The websocket connection.
     consumer (KafkaConsumerDep):  The kafka consumer.
 """)
@@ -54,10 +54,11 @@ async def generate_chat_stream( # pylint: disable=missing-function-docstring
     *,
     token: str = Query(),
     redis_conn: RedisConnectionDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     websocket: WebSocket):
     # First, check that the token is valid in redis
-    if not await redis_conn.exists(token):
+    user_id = await redis_conn.get(token)
+    if user_id is None:
         raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
     # Delete the token from redis
     await redis_conn.delete(token)
@@ -70,24 +71,25 @@ async def generate_chat_stream( # pylint: disable=missing-function-docstring
     #          'file_id': "..."
     #      }
     #  }
-    mq_conn = await aio_pika.connect_robust(host=settings.rabbitmq_host,
-                                            login=settings.rabbitmq_secret_username,
-                                            password=settings.rabbitmq_secret_password)
-    async with mq_conn:
-        channel = await mq_conn.channel()
-        # Put the websocket in a try block to catch any disconnect exceptions
+    # Put the websocket in a try block to catch any disconnect exceptions
+    try:
+        message = await websocket.receive_json()
+        if message['action'] != 'monitor_file_processing':
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+        if 'file_id' not in message['payload']:
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+        # Get the file ID, which is also the routing key of its status events
         try:
-            message = await websocket.receive_json()
-            if message['action'] != 'monitor_file_processing':
-                raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
-            if 'file_id' not in message['payload']:
-                raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
-            # Get the file ID
-            file_id = message['payload']['file_id']
-            # Check that the file exists
-            file = session.exec(select(File).where(File.id == file_id)).first()
-            if not file:
-                raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+            file_id = uuid.UUID(str(message['payload']['file_id']))
+        except ValueError as err:
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION) from err
+        # Check that the file exists and belongs to the token's user
+        file = (await session.exec(select(File).where(File.id == file_id))).first()
+        if not file or str(file.owner_id) != user_id.decode('utf-8'):
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+        # Subscribe before reading the current status, so that no status change is missed
+        async with file_status_hub.subscribe(file_id) as statuses:
+            await session.refresh(file, ['status'])
             # Start sending back file processing statuses, starting with the current file status
             for file_status in ORDERED_FILE_STATUSES:
                 await websocket.send_json({
@@ -95,32 +97,24 @@ async def generate_chat_stream( # pylint: disable=missing-function-docstring
                     'status': file_status})
                 if file.status == file_status:
                     break
-
-            await channel.declare_exchange(name='monitor_file_processing', type='fanout')
-            queue = await channel.declare_queue(name='', exclusive=True)
-            await queue.bind(exchange='monitor_file_processing')
-            async with queue.iterator() as queue_iter:
-                while True:
-                    try:
-                        # Wait for a message for 5 seconds, then break if timeout occurs
-                        message = await asyncio.wait_for(
-                            queue_iter.__anext__(), # pylint: disable=unnecessary-dunder-call
-                            timeout=settings.app_file_status_consumer_timeout_seconds)
-                    except asyncio.TimeoutError:
-                        # Break the loop if no message is received in 5 seconds
-                        print(f"No message received in "
-                              f"{settings.app_file_status_consumer_timeout_seconds} seconds. "
-                               "Exiting.")
-                        break
-                    else:
-                        async with message.process():
-                            body = json.loads(message.body.decode('utf-8'))
-                            if body['file_id'] == file_id:
-                                await websocket.send_json(body)
-                                if body['status'] == ORDERED_FILE_STATUSES[-1]:
-                                    # Stop consuming
-                                    break
-            await websocket.close()
-        except WebSocketDisconnect:
-            # The client disconnected, so close the websocket
-            await websocket.close()
+            last_status_index = ORDERED_FILE_STATUSES.index(file_status)
+            while last_status_index < len(ORDERED_FILE_STATUSES) - 1:
+                try:
+                    body = await asyncio.wait_for(
+                        statuses.get(),
+                        timeout=settings.app_file_status_consumer_timeout_seconds)
+                except asyncio.TimeoutError:
+                    # Stop waiting if no status change arrives in time
+                    print(f"No message received in "
+                          f"{settings.app_file_status_consumer_timeout_seconds} seconds. "
+                           "Exiting.")
+                    break
+                # Skip statuses that were already sent
+                if ORDERED_FILE_STATUSES.index(body['status']) <= last_status_index:
+                    continue
+                await websocket.send_json(body)
+                last_status_index = ORDERED_FILE_STATUSES.index(body['status'])
+        await websocket.close()
+    except WebSocketDisconnect:
+        # The client disconnected, so close the websocket
+        await websocket.close()
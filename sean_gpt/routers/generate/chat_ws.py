@@ -8,7 +8,7 @@ from sean_gpt.ai import default_ai
 from ...util.describe import describe
 from ...config import settings
 from ...util.database import RedisConnectionDep
-from ...ai import default_ai, nuclear_tools, run_tool
+from ...ai import default_ai, nuclear_tools, run_tools
 
 openai_client = AsyncOpenAI(api_key = settings.openai_api_key)
 
@@ -58,38 +58,50 @@ async def generate_chat_stream( # pylint: disable=missing-function-docstring
         # Send the request to OpenAI
         include_tools = True
         while response_stream := await get_chat_completion_stream(conversation, include_tools):
-            # Send the response back to the client chunk by chunk
+            # Send the response back to the client chunk by chunk.  Tool calls are streamed as
+            # fragments, keyed by their index in the turn, so they are assembled as they arrive.
             finish_reason = None
+            tool_calls = {}
             async for chunk in response_stream:
                 if (chunk.choices[0].delta.content is not None and
                     chunk.choices[0].delta.content != ''):
                     await websocket.send_text(chunk.choices[0].delta.content)
-                if chunk.choices[0].delta.tool_calls is not None:
-                    tool_call_results = []
-                    for tool_call in chunk.choices[0].delta.tool_calls:
-                        if (not tool_call.function or
-                            not tool_call.function.name or
-                            not tool_call.function.arguments):
-                            continue
-                        tool_call_results.append((run_tool(tool_call.function.name,
-                                                           tool_call.function.arguments),
-                                                  tool_call.id))
-                    for result, tool_call_id in tool_call_results:
-                        conversation.append({
-                            "role": "tool",
-                            "content": result,
-                            "tool_call_id": tool_call_id
-                        })
-                        conversation.append({
-                            "role": "system",
-                            "content": ("When passing retrieved data to the user, never provide an "
+                for tool_call in chunk.choices[0].delta.tool_calls or []:
+                    call = tool_calls.setdefault(tool_call.index,
+                                                 {'id': '', 'name': '', 'arguments': ''})
+                    call['id'] = tool_call.id or call['id']
+                    if tool_call.function:
+                        call['name'] += tool_call.function.name or ''
+                        call['arguments'] += tool_call.function.arguments or ''
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+            tool_calls = [call for _, call in sorted(tool_calls.items()) if call['name']]
+            if tool_calls:
+                # Run the tool calls of the turn concurrently
+                results = await run_tools([(call['name'], call['arguments'])
+                                           for call in tool_calls])
+                conversation.append({
+                    "role": "assistant",
+                    "tool_calls": [{
+                        "id": call['id'],
+                        "type": "function",
+                        "function": {"name": call['name'], "arguments": call['arguments']}
+                    } for call in tool_calls]
+                })
+                for result, call in zip(results, tool_calls):
+                    conversation.append({
+                        "role": "tool",
+                        "content": result,
+                        "tool_call_id": call['id']
+                    })
+                conversation.append({
+                    "role": "system",
+                    "content": ("When passing retrieved data to the user, never provide an "
 "interpretation of the results to answer the user's question. Provide them a quotation and a "
 "download link. You are not the expert and are not qualified to interpret the results. Your only "
 "job is to identify which document answers the user's query, give a quote that inspires confidence "
 "that the answer is in the document, and provide a download link. Feel free to provide multiple "
 "documents that may answer the user's query. Use markup to make the links pretty.")
-                        })
-                finish_reason = chunk.choices[0].finish_reason
+                })
             if finish_reason is not None and finish_reason != "tool_calls":
                 break
             # Only send the tools once
@@ -13,6 +13,8 @@ from typing import Any
 import json
 
 from fastapi import APIRouter, Body
+from openai.types import CreateEmbeddingResponse, Embedding
+from openai.types.create_embedding_response import Usage
 import redis
 
 from ...config import settings
@@ -33,43 +35,36 @@ def get_random_embedding(*args, **kwargs):
     """ Mocks the openai embeddings endpoint.
     """
     print('Mock OpenAI embeddings request:', kwargs['input'])
-    if isinstance(kwargs['input'], str):
-        return {
-            "object": "list",
-            "data": [
-                {
-                "object": "embedding",
-                "embedding": [0.0 for _ in range(1536)],
-                "index": 0
-                }
-            ],
-            "model": "text-embedding-ada-002",
-            "usage": {
-                "prompt_tokens": 8,
-                "total_tokens": 8
-            }
-        }
-    # The input is a list of strings
+    # The input is either a string or a list of strings
     # So return a list of embeddings that matches the length of the input
-    return {
-        "object": "list",
-        "data": [
-            {
-            "object": "embedding",
-            "embedding": [0.0 for _ in range(1536)],
-            "index": i
-            } for i in range(len(kwargs['input']))
+    inputs = [kwargs['input']] if isinstance(kwargs['input'], str) else kwargs['input']
+    return CreateEmbeddingResponse(
+        object="list",
+        data=[
+            Embedding(
+                object="embedding",
+                embedding=[0.0 for _ in range(settings.app_text_embedding_model_dim)],
+                index=i
+            ) for i in range(len(inputs))
         ],
-        "model": "text-embedding-ada-002",
-        "usage": {
-            "prompt_tokens": 8,
-            "total_tokens": 8
-        }
-    }
+        model=kwargs['model'],
+        usage=Usage(
+            prompt_tokens=8,
+            total_tokens=8
+        )
+    )
+
+async def get_random_embedding_async(*args, **kwargs):
+    """ Mocks the openai async embeddings endpoint.
+    """
+    return get_random_embedding(*args, **kwargs)
 
 embeddings_patch = patch('openai.resources.Embeddings.create',
                         new=get_random_embedding)
 
+async_embeddings_patch = patch('openai.resources.AsyncEmbeddings.create',
+                               new=get_random_embedding_async)
+
 chat_completion_patch = patch('openai.resources.chat.AsyncCompletions.create',
                               new=get_openai_stream)
 
@@ -80,10 +75,12 @@ def startup():
     redis_conn.set("latest_openai_request", json.dumps({'msg':"No request yet submitted"}))
     chat_completion_patch.start()
     embeddings_patch.start()
+    async_embeddings_patch.start()
 
 def shutdown():
     chat_completion_patch.stop()
     embeddings_patch.stop()
+    async_embeddings_patch.stop()
 
 router = APIRouter(prefix="/mock/openai")
 
@@ -7,7 +7,7 @@ from fastapi import APIRouter, Query
 from sqlmodel import select
 
 from ...util.user import AuthenticatedUserDep
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...util.describe import describe
 from ...model.file import ShareSet, FileShareSetLink
 
@@ -21,7 +21,7 @@ router = APIRouter(
 Args:
     file_id (UUID): The id of the file to retrieve.
     share_set_id (UUID): The id of the share set to retrieve.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
     current_user (AuthenticatedUserDep): The current user.
 """)
 @router.get("")
@@ -29,7 +29,7 @@ async def get_share_sets(# pylint: disable=missing-function-docstring
     *,
     file_id: Annotated[Union[uuid.UUID, None], Query()] = None,
     share_set_id: Annotated[uuid.UUID | None, Query()] = None,
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep) -> List[ShareSet]:
     # Important:  A share set can only be retrieved if the user is the owner or the share set is
     #             public.
@@ -46,4 +46,4 @@ async def get_share_sets(# pylint: disable=missing-function-docstring
     # Finally, continue to filter share sets by current owner or public
     query = query.where((ShareSet.owner_id == current_user.id) | (ShareSet.is_public))
 
-    return session.exec(query).all()
+    return (await session.exec(query)).all()
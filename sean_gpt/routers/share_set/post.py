@@ -7,7 +7,7 @@ from fastapi import APIRouter, Body
 from ...model.file import ShareSet
 from ...util.describe import describe
 from ...util.user import AuthenticatedUserDep
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 
 router = APIRouter(
     prefix="/share_set"
@@ -18,7 +18,7 @@ router = APIRouter(
 
 Args:
     name (str): The name of the share set, optional
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
     current_user (AuthenticatedUserDep): The current user.
 
 Returns:
@@ -28,11 +28,11 @@ Returns:
 async def create_share_set(# pylint: disable=missing-function-docstring
     *,
     name: Annotated[str | None, Body(embed=True)] = None,
-    session: SessionDep,
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep) -> ShareSet:
     # Create the share set
     share_set = ShareSet(name=name if name else "", owner_id=current_user.id)
     session.add(share_set)
-    session.commit()
-    session.refresh(share_set)
+    await session.commit()
+    await session.refresh(share_set)
     return share_set
@@ -3,7 +3,8 @@ from fastapi import APIRouter
 from openai import AsyncOpenAI
 
 from ...ai import default_ai
-from ...util.database import SessionDep, RedisConnectionDep
+from ...util.database import AsyncSessionDep, RedisConnectionDep
+from ...util.chat import count_chat_messages
 from ...util.describe import describe
 from ...config import settings
 from .util import (
@@ -39,7 +40,7 @@ Returns:
 async def twilio_webhook( # pylint: disable=missing-function-docstring
     incoming_message: TwilioMessageDep,
     current_user: TwilioGetUserDep,
-    session: SessionDep,
+    session: AsyncSessionDep,
     redis_conn: RedisConnectionDep):
     # Check if the user is trying to send an unsupported message type (whatsapp, MMS, etc.)
     unsupported_response = check_for_unsupported_msg(incoming_message)
@@ -47,7 +48,7 @@ async def twilio_webhook( # pylint: disable=missing-function-docstring
         return unsupported_response
 
     # Check if the user exists and is opted into messaging
-    check_user_response = check_user_sms(current_user, incoming_message, session)
+    check_user_response = await check_user_sms(current_user, incoming_message, session)
     if check_user_response:
         return check_user_response
 
@@ -56,7 +57,7 @@ async def twilio_webhook( # pylint: disable=missing-function-docstring
                                      redis_conn,
                                      session) as (chat_response_session_id, chat, interrupt_pubsub):
         # Check if this is a new user (twilio chat has no messages yet)
-        if not chat.messages:
+        if not await count_chat_messages(chat.id, session):
             return await create_and_save_twiml_response(chat,
                                                   incoming_message,
                                                   settings.app_welcome_message,
@@ -65,10 +66,10 @@ async def twilio_webhook( # pylint: disable=missing-function-docstring
 
         # If this is a redirect, don't save the user's message
         if not await is_twilio_redirect(incoming_message, redis_conn):
-            save_user_twilio_message(chat, incoming_message, session)
+            await save_user_twilio_message(chat, incoming_message, session)
 
         # - Begin streaming a response from openAI
-        messages_openai = get_messages_openai(chat.id, session)
+        messages_openai = await get_messages_openai(chat.id, session)
 
         response_stream = await openai_client.chat.completions.create(
             model=default_ai().name,
@@ -7,17 +7,19 @@ import math
 
 from fastapi import Request, HTTPException, Depends, Response
 from twilio.request_validator import RequestValidator
-from sqlmodel import select, Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import twilio.twiml.messaging_response as twiml
 
 from ...config import settings
 from ...model.authenticated_user import AuthenticatedUser
 from ...model.twilio_message import TwilioMessage
 from ...model.chat import Chat
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...model.ai import AI
 from ...ai import default_ai
 from ...model.message import Message
+from ...util.chat import count_chat_messages
 
 async def validate_twilio(request: Request):
     """ Validates a Twilio request.
@@ -49,13 +51,13 @@ async def validate_twilio(request: Request):
 
 async def twilio_get_or_create_user(
         request: Request,
-        session: SessionDep,
+        session: AsyncSessionDep,
         ai:AI = Depends(default_ai)) -> Optional[AuthenticatedUser]:
     """ Gets or creates a user from a Twilio message.
     
     Args:
         incoming_message (TwilioMessage): The incoming message.
-        session (SessionDep): The database session.
+        session (AsyncSessionDep): The database session.
         ai (AI): The AI to use for this chat.
         
     Returns:
@@ -67,14 +69,14 @@ async def twilio_get_or_create_user(
     # - Retrieve the user's phone number
     user_phone = incoming_message.from_
     # - Check if the user exists
-    user = session.exec(select(AuthenticatedUser)
-                        .where(AuthenticatedUser.phone == user_phone)).first()
+    user = (await session.exec(select(AuthenticatedUser)
+                               .where(AuthenticatedUser.phone == user_phone))).first()
     # - If not, check if the message body is a referral code
     if not user:
-        referring_user = (session
+        referring_user = (await session
                           .exec(select(AuthenticatedUser)
                                 .where(AuthenticatedUser.referral_code == incoming_message.body))
-                                .first())
+                          ).first()
         # - If so, create the user with the referral code
         if referring_user:
             user = AuthenticatedUser(
@@ -89,8 +91,8 @@ async def twilio_get_or_create_user(
             # Add the user's unique Twilio-only chat to the database
             session.add(twilio_chat)
             session.add(user)
-            session.commit()
-            session.refresh(user)
+            await session.commit()
+            await session.refresh(user)
             # Create a twilio chat for the user
 
     else:
@@ -98,8 +100,8 @@ async def twilio_get_or_create_user(
         if not user.is_phone_verified:
             user.is_phone_verified = True
             session.add(user)
-            session.commit()
-            session.refresh(user)
+            await session.commit()
+            await session.refresh(user)
     # - Return the user
     return user
 
@@ -136,7 +138,9 @@ def check_for_unsupported_msg(msg: TwilioMessage) -> Response|None:
                         media_type="application/xml")
     return None
 
-def check_user_sms(user: AuthenticatedUser, msg: TwilioMessage, session: Session) -> Response|None:
+async def check_user_sms(user: AuthenticatedUser,
+                         msg: TwilioMessage,
+                         session: AsyncSession) -> Response|None:
     """ Verifies that the user exists and has opted into SMS.
     
     Args:
@@ -158,8 +162,8 @@ def check_user_sms(user: AuthenticatedUser, msg: TwilioMessage, session: Session
         if msg.body.lower() == "agree": # pylint: disable=no-member
             user.opted_into_sms = True
             session.add(user)
-            session.commit()
-            session.refresh(user)
+            await session.commit()
+            await session.refresh(user)
         else:
             twiml_response = twiml.MessagingResponse()
             twiml_response.message(settings.app_sms_opt_in_message)
@@ -168,13 +172,13 @@ def check_user_sms(user: AuthenticatedUser, msg: TwilioMessage, session: Session
     return None
 
 @asynccontextmanager
-async def chat_response_session(chat_id: UUID, redis_conn, session: Session):
+async def chat_response_session(chat_id: UUID, redis_conn, session: AsyncSession):
     """ Context manager for a chat response session.
     
     Args:
         chat_id (UUID): The chat ID.
         redis_conn: The redis connection.
-        session (Session): The database session.
+        session (AsyncSession): The database session.
         
     Yields:
         Tuple[str, Chat, ai.Message]: The chat response session ID, chat, and interrupt pubsub."""
@@ -182,7 +186,7 @@ async def chat_response_session(chat_id: UUID, redis_conn, session: Session):
     chat_response_session_id = str(uuid.uuid4())
 
     # - Retrieve the chat
-    chat = session.exec(select(Chat).where(Chat.id == chat_id)).first()
+    chat = (await session.exec(select(Chat).where(Chat.id == chat_id))).first()
 
     # Subscribe to stream interrupt events
     interrupt_channel_name = f'interrupt channel for chat with ID: {chat.id}'
@@ -199,7 +203,7 @@ async def chat_response_session(chat_id: UUID, redis_conn, session: Session):
 async def create_and_save_twiml_response(chat:Chat, # pylint: disable=too-many-arguments
                                          incoming_message,
                                          msg_body:str,
-                                         session:Session,
+                                         session:AsyncSession,
                                          redis_conn,
                                          requires_redirect:bool = False) -> Response:
     """ Creates and saves a twiml response.
@@ -208,7 +212,7 @@ async def create_and_save_twiml_response(chat:Chat, # pylint: disable=too-many-a
         chat (Chat): The chat.
         incoming_message (TwilioMessage): The incoming message.
         msg_body (str): The message body.
-        session (Session): The database session.
+        session (AsyncSession): The database session.
         redis_conn: The redis connection.
         requires_redirect (bool): Whether the response requires a redirect.
 
@@ -219,13 +223,13 @@ async def create_and_save_twiml_response(chat:Chat, # pylint: disable=too-many-a
     twiml_response.message(msg_body)
     # - Save the message to the database (commit and refresh)
     ai_message = Message(
-        chat_index=len(chat.messages),
+        chat_index=await count_chat_messages(chat.id, session),
         chat_id=chat.id,
         role='assistant',
         content=msg_body,
     )
     session.add(ai_message)
-    session.commit()
+    await session.commit()
     # - Send the response to Twilio, with a redirect if the stream was incomplete.
     if requires_redirect:
         # Save that this is a redirect
@@ -246,31 +250,31 @@ async def is_twilio_redirect(msg: TwilioMessage, redis_conn) -> bool:
     """
     return (await redis_conn.get(f'multi-part message with SID: {msg.message_sid}')) is not None
 
-def save_user_twilio_message(chat, msg, session):
+async def save_user_twilio_message(chat, msg, session):
     """ Saves a user's twilio message to the database.
 
     Args:
         chat (Chat): The chat.
         msg (TwilioMessage): The twilio message.
-        session (Session): The database session.
+        session (AsyncSession): The database session.
     """
     # - Save the incoming message to the database (commit and refresh)
     user_message = Message(
-        chat_index=len(chat.messages),
+        chat_index=await count_chat_messages(chat.id, session),
         chat_id=chat.id,
         role='user',
         content=msg.body,
     )
     session.add(user_message)
-    session.commit()
-    session.refresh(user_message)
+    await session.commit()
+    await session.refresh(user_message)
 
-def get_messages_openai(chat_id, session):
+async def get_messages_openai(chat_id, session):
     """ Gets the messages in a chat in the OpenAI format.
 
     Args:
         chat_id (UUID): The chat ID.
-        session (Session): The database session.
+        session (AsyncSession): The database session.
 
     Returns:
         List[Dict[str, str]]: The messages in the OpenAI format.
@@ -282,11 +286,11 @@ def get_messages_openai(chat_id, session):
     }
     # Retrieve the last X messages from the chat, in ascending order of chat_index
     # X = settings.app_chat_history_length
-    messages = (session
+    messages = (await session
                 .exec(select(Message)
                       .where(Message.chat_id == chat_id)
                       .order_by(Message.chat_index.desc()) # pylint: disable=no-member
-                      .limit(settings.app_chat_history_length-1)).all())
+                      .limit(settings.app_chat_history_length-1))).all()
 
     # Put them in openai format, prepend the system message
     openai_messages = ([openai_system_message] +
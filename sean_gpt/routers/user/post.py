@@ -10,7 +10,7 @@ from sqlmodel import select
 
 from ...config import settings
 from ...util.user import authenticate_user, AuthenticatedUserDep
-from ...util.auth import create_access_token, get_password_hash
+from ...util.auth import create_access_token, get_password_hash_async
 from ...util.describe import describe
 from ...model.authenticated_user import UserRead, AuthenticatedUser, UserCreate
 from ...model.access_token import AccessToken
@@ -18,7 +18,7 @@ from ...model.verification_token import VerificationToken
 from ...model.chat import Chat
 from ...model.ai import AI
 from ...ai import default_ai
-from ...util.database import SessionDep
+from ...util.database import AsyncSessionDep
 from ...util.sms import TwilioClientDep
 
 router = APIRouter(prefix="/user")
@@ -34,15 +34,15 @@ Returns:
           UserRead: The user's information.
 """)
 @router.post("", status_code=status.HTTP_201_CREATED)
-def create_user( # pylint: disable=missing-function-docstring
+async def create_user( # pylint: disable=missing-function-docstring
     *,
     user: UserCreate,
     referral_code: str = Body(),
     ai:AI = Depends(default_ai),
-    session: SessionDep) -> UserRead:
+    session: AsyncSessionDep) -> UserRead:
     # Check if the user exists
     select_user = select(AuthenticatedUser).where(AuthenticatedUser.phone == user.phone)
-    existing_user = session.exec(select_user).first()
+    existing_user = (await session.exec(select_user)).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -51,7 +51,7 @@ def create_user( # pylint: disable=missing-function-docstring
     # Check if the referral code exists
     select_referral = (select(AuthenticatedUser)
                        .where(AuthenticatedUser.referral_code == referral_code))
-    existing_referral = session.exec(select_referral).first()
+    existing_referral = (await session.exec(select_referral)).first()
     if not existing_referral:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -59,7 +59,7 @@ def create_user( # pylint: disable=missing-function-docstring
         )
     # Create the user
     user = AuthenticatedUser(phone=user.phone,
-                             hashed_password=get_password_hash(user.password),
+                             hashed_password=await get_password_hash_async(user.password),
                              referrer_user_id=existing_referral.id,
                              is_phone_verified=True,) # TODO:  Remove when SMS is implemented
     # Create the user's unique Twilio-only chat (all users have one)
@@ -69,8 +69,8 @@ def create_user( # pylint: disable=missing-function-docstring
     session.add(twilio_chat)
     # Add the user to the database
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
     return user
 
 @describe(""" Authenticates a user and returns an OAuth2.0 access token.
@@ -87,7 +87,7 @@ Returns:
 """)
 @router.post("/token", response_model=AccessToken)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Security()]): # pylint: disable=missing-function-docstring
-    user = authenticate_user(phone=form_data.username, password=form_data.password)
+    user = await authenticate_user(phone=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -102,11 +102,12 @@ async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm,
 
 @describe(""" Requests a verification token be texted to the user's phone. """)
 @router.post("/request_phone_verification")
-def request_phone_verification( # pylint: disable=missing-function-docstring
-    session: SessionDep,
+async def request_phone_verification( # pylint: disable=missing-function-docstring
+    session: AsyncSessionDep,
     current_user: AuthenticatedUserDep,
     sms_client: TwilioClientDep):
     session.add(current_user)
+    await session.refresh(current_user, ['verification_token'])
     # Check if the user is already verified
     if current_user.is_phone_verified:
         raise HTTPException(
@@ -125,13 +126,13 @@ def request_phone_verification( # pylint: disable=missing-function-docstring
     # Generate a verification token
     token_code = secrets.token_urlsafe(8)
     verification_token = VerificationToken(
-        code_hash=get_password_hash(token_code),
+        code_hash=await get_password_hash_async(token_code),
         user_id=current_user.id)
     # Add the verification token to the database
     session.add(verification_token)
-    session.commit()
-    session.refresh(verification_token)
-    session.refresh(current_user)
+    await session.commit()
+    await session.refresh(verification_token)
+    await session.refresh(current_user, ['verification_token'])
     # Check that the verification token was added to the user
     if not current_user.verification_token:
         raise HTTPException(
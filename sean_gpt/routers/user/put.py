@@ -7,8 +7,8 @@ from sqlmodel import select
 
 from ...util.describe import describe
 from ...util.user import AuthenticatedUserDep
-from ...util.auth import verify_password, get_password_hash
-from ...util.database import SessionDep
+from ...util.auth import verify_password_async, get_password_hash_async
+from ...util.database import AsyncSessionDep
 from ...model.authenticated_user import AuthenticatedUser
 
 router = APIRouter(prefix="/user")
@@ -29,32 +29,36 @@ Args:
     old_password (str): The old password.
 """)
 @router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
-def change_password( # pylint: disable=missing-function-docstring
+async def change_password( # pylint: disable=missing-function-docstring
     change_request: PasswordChangeRequest,
     current_user: AuthenticatedUserDep,
-    session: SessionDep
+    session: AsyncSessionDep
     ):
     # We know that the authentication token is valid because the user is authenticated.
     # Check the old password
-    if not verify_password(change_request.old_password, current_user.hashed_password):
+    if not await verify_password_async(change_request.old_password,
+                                       current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Unable to change password:  Incorrect password."
         )
     # Retrieve the previous hashed password
     old_password_hash = current_user.hashed_password
-    new_password_hash = get_password_hash(change_request.new_password)
+    new_password_hash = await get_password_hash_async(change_request.new_password)
     # Change the password
     current_user.hashed_password = new_password_hash
     session.add(current_user)
-    session.commit()
-    check_current_user = session.exec(select(AuthenticatedUser)
-                                      .where(AuthenticatedUser.id == current_user.id)).first()
+    await session.commit()
+    # The session does not expire on commit, so reload the row rather than the cached attributes
+    select_current_user = (select(AuthenticatedUser)
+                           .where(AuthenticatedUser.id == current_user.id)
+                           .execution_options(populate_existing=True))
+    check_current_user = (await session.exec(select_current_user)).first()
     # Check that the password has been changed
     if check_current_user.hashed_password != new_password_hash:
         check_current_user.hashed_password = old_password_hash
         session.add(check_current_user)
-        session.commit()
+        await session.commit()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Password has not been changed."
@@ -70,12 +74,13 @@ Args:
     phone_verification_code (str): The verification code.
 """)
 @router.put("/is_phone_verified", status_code=status.HTTP_204_NO_CONTENT)
-def verify_phone(*, # pylint: disable=missing-function-docstring
+async def verify_phone(*, # pylint: disable=missing-function-docstring
     phone_verification_code: str = Body(embed=True),
     current_user: AuthenticatedUserDep,
-    session: SessionDep
+    session: AsyncSessionDep
     ):
     session.add(current_user)
+    await session.refresh(current_user, ['verification_token'])
     # We know that the authentication token is valid because the user is authenticated.
     # Check that the user has a verification token
     if not current_user.verification_token:
@@ -84,7 +89,8 @@ def verify_phone(*, # pylint: disable=missing-function-docstring
             detail="Unable to verify phone:  Invalid verification code."
         )
     # Check the verification code using the cryptographic hash comparison function
-    if not verify_password(phone_verification_code, current_user.verification_token.code_hash):
+    if not await verify_password_async(phone_verification_code,
+                                       current_user.verification_token.code_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Unable to verify phone:  Invalid verification code."
@@ -97,21 +103,24 @@ def verify_phone(*, # pylint: disable=missing-function-docstring
         )
     # Set the phone verification status to True
     current_user.is_phone_verified = True
-    session.commit()
+    await session.commit()
     # Check that the phone verification status has been changed
-    check_current_user = session.exec(select(AuthenticatedUser)
-                                      .where(AuthenticatedUser.id == current_user.id)).first()
+    # The session does not expire on commit, so reload the row rather than the cached attributes
+    select_current_user = (select(AuthenticatedUser)
+                           .where(AuthenticatedUser.id == current_user.id)
+                           .execution_options(populate_existing=True))
+    check_current_user = (await session.exec(select_current_user)).first()
     if not check_current_user.is_phone_verified:
         check_current_user.is_phone_verified = False
         session.add(check_current_user)
-        session.commit()
+        await session.commit()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Phone verification status has not been changed."
         )
     # Delete the verification token now that it has been used
-    session.delete(current_user.verification_token)
-    session.commit()
+    await session.delete(current_user.verification_token)
+    await session.commit()
 
 @describe(
 """ Set the opted_into_sms status of the current user.
@@ -122,22 +131,22 @@ opt-in status.
 Args:
     opted_into_sms (bool): The new opt-in status.
     current_user (AuthenticatedUserDep): The current user.
-    session (SessionDep): The database session.
+    session (AsyncSessionDep): The database session.
 
 Returns:
     current_user (AuthenticatedUser): The current user (after the opt-in status has been changed).
 """)
 @router.put("/opted_into_sms", response_model=AuthenticatedUser)
-def set_opted_into_sms(*, # pylint: disable=missing-function-docstring
+async def set_opted_into_sms(*, # pylint: disable=missing-function-docstring
     opted_into_sms: bool = Body(embed=True),
     current_user: AuthenticatedUserDep,
-    session: SessionDep
+    session: AsyncSessionDep
     ):
     session.add(current_user)
     # We know that the authentication token is valid because the user is authenticated.
     # Set the opted_into_sms status
     session.add(current_user)
     current_user.opted_into_sms = opted_into_sms
-    session.commit()
-    session.refresh(current_user)
+    await session.commit()
+    await session.refresh(current_user)
     return current_user
@@ -1,16 +1,50 @@
-""" Authentication utilities. """
+""" Authentication utilities.
+
+bcrypt is deliberately slow (hundreds of milliseconds of CPU per call), so password hashing and
+verification run on a small, bounded pool of worker threads.  The bcrypt extension releases the GIL
+while hashing, so the workers do not stall the event loop, and a burst of logins queues for a worker
+instead of occupying every request thread.  The number of waiting operations is exported as the
+`sean_gpt_password_hash_queue_depth` metric.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Callable
+import asyncio
+import time
 import uuid
 
 from passlib.context import CryptContext
+from prometheus_client import Gauge, Histogram
 from jose import jwt
 
 from ..config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+_PASSWORD_HASH_EXECUTOR = ThreadPoolExecutor(max_workers=settings.app_password_hash_max_workers,
+                                             thread_name_prefix="password-hash")
+
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    'sean_gpt_password_hash_queue_depth',
+    'Password hashing operations waiting for a worker.')
+PASSWORD_HASH_QUEUE_WAIT_SECONDS = Histogram(
+    'sean_gpt_password_hash_queue_wait_seconds',
+    'Time password hashing operations spend waiting for a worker.')
+
+def _submit_password_hash_operation(function: Callable, *args) -> Future:
+    """ Runs a password hashing operation on the bounded worker pool. """
+    PASSWORD_HASH_QUEUE_DEPTH.inc()
+    submitted_at = time.perf_counter()
+    def run():
+        PASSWORD_HASH_QUEUE_DEPTH.dec()
+        PASSWORD_HASH_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - submitted_at)
+        return function(*args)
+    return _PASSWORD_HASH_EXECUTOR.submit(run)
+
 def verify_password(plain_password:str, hashed_password:str) -> bool:
-    """ Verifies a password against a hash.
+    """ Verifies a password against a hash, blocking until a worker has done so.
+
+    Use `verify_password_async` from coroutines.
 
     Args:
         plain_password (str): The plain text password.
@@ -19,10 +53,37 @@ def verify_password(plain_password:str, hashed_password:str) -> bool:
     Returns:
         bool: True if the password is correct, otherwise False.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return _submit_password_hash_operation(
+        pwd_context.verify, plain_password, hashed_password).result()
+
+async def verify_password_async(plain_password:str, hashed_password:str) -> bool:
+    """ Verifies a password against a hash without blocking the event loop.
+
+    Args:
+        plain_password (str): The plain text password.
+        hashed_password (str): The hashed password.
+
+    Returns:
+        bool: True if the password is correct, otherwise False.
+    """
+    return await asyncio.wrap_future(_submit_password_hash_operation(
+        pwd_context.verify, plain_password, hashed_password))
 
 def get_password_hash(password:str) -> str:
-    """ Hashes a password.
+    """ Hashes a password, blocking until a worker has done so.
+
+    Use `get_password_hash_async` from coroutines.
+
+    Args:
+        password (str): The password to hash.
+
+    Returns:
+        str: The hashed password.
+    """
+    return _submit_password_hash_operation(pwd_context.hash, password).result()
+
+async def get_password_hash_async(password:str) -> str:
+    """ Hashes a password without blocking the event loop.
 
     Args:
         password (str): The password to hash.
@@ -30,7 +91,7 @@ def get_password_hash(password:str) -> str:
     Returns:
         str: The hashed password.
     """
-    return pwd_context.hash(password)
+    return await asyncio.wrap_future(_submit_password_hash_operation(pwd_context.hash, password))
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """ Creates an OAuth2.0 access token.
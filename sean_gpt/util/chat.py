@@ -0,0 +1,21 @@
+""" Utility functions for chats. """
+from uuid import UUID
+
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..model.message import Message
+
+async def count_chat_messages(chat_id: UUID, session: AsyncSession) -> int:
+    """ Counts the messages in a chat, without loading them.
+
+    Args:
+        chat_id (UUID): The chat ID.
+        session (AsyncSession): The database session.
+
+    Returns:
+        int: The number of messages in the chat.
+    """
+    return (await session.exec(select(func.count()) # pylint: disable=not-callable
+                               .select_from(Message)
+                               .where(Message.chat_id == chat_id))).one()
@@ -0,0 +1,316 @@
+""" Text embedding utilities.
+
+Embedding requests are sent with the async OpenAI client, so they do not block the event loop.  The
+scheduler splits large batches into requests that fit a token budget, keeps several requests in
+flight at once, and stays under the account's tokens-per-minute and requests-per-minute limits.
+Embeddings that were already calculated can be served from a cache in redis instead.  Search
+queries have a cache of their own, shared by all API replicas, so repeated queries skip the
+embedding request.
+"""
+from typing import List, Optional
+import asyncio
+import hashlib
+import math
+import random
+import time
+import unicodedata
+
+from openai import AsyncOpenAI, RateLimitError
+from prometheus_client import Counter
+import aioredis
+from aioredis import RedisError
+import numpy as np
+
+from ..config import settings
+from .describe import describe
+
+# English text averages about 4 characters per token; under-counting characters per token
+# over-estimates tokens, which keeps requests under the limits.
+_CHARACTERS_PER_TOKEN = 3
+
+@describe(
+""" Estimates the number of tokens in a text without loading a tokenizer.
+
+Args:
+    text (str): The text to estimate.
+
+Returns:
+    int: The estimated number of tokens.
+""")
+def estimate_tokens(text: str) -> int: # pylint: disable=missing-function-docstring
+    return max(1, math.ceil(len(text) / _CHARACTERS_PER_TOKEN))
+
+class TokenBucket: # pylint: disable=too-few-public-methods
+    """ An asyncio token bucket that refills continuously up to a per-minute limit.
+
+    Args:
+        per_minute (float): The number of tokens that become available each minute.  This is also
+            the capacity of the bucket.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self, amount: float = 1):
+        """ Waits until `amount` tokens are available, then takes them. """
+        # A request larger than the bucket can never be satisfied in full, so wait for a full bucket
+        amount = min(amount, self.capacity)
+        # Waiters are served in order so that large requests are not starved by small ones
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    'sean_gpt_embedding_cache_lookups_total',
+    "Embedding cache lookups, by cache and result (hit, miss, or error when redis is unavailable)."
+    "  The hit rate is hits / all lookups.",
+    ['cache', 'result'])
+
+class EmbeddingCache:
+    """ A size-bounded, least-recently-used cache of embeddings in redis.
+
+    Entries are keyed by a hash of the model name and the text, and stored as float32 bytes.  A
+    sorted set indexes the entries by last access time; once it holds more than `max_entries`
+    entries, the least recently used ones are evicted.  Entries may also expire `ttl_seconds` after
+    they are cached.  Redis errors are logged and treated as cache misses, so an unavailable cache
+    only costs the embedding requests it would have saved.
+
+    Args:
+        redis_conn: The aioredis connection.
+        max_entries (int): The maximum number of cached embeddings.
+        ttl_seconds (float): How long an embedding is cached.  0 caches it until it is evicted.
+        namespace (str): Prefixes the redis keys, so that caches with different limits are kept
+            apart.  Also labels the cache's metrics.
+    """
+    def __init__(self, redis_conn, max_entries: int = settings.app_embedding_cache_max_entries,
+                 ttl_seconds: float = 0, namespace: str = 'embedding cache'):
+        self.redis_conn = redis_conn
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self._entry_key_prefix = f'{namespace} entry: '
+        self._index_key = f'{namespace} index'
+
+    def key(self, model: str, text: str) -> str:
+        """ The redis key of the embedding of a text by a model. """
+        digest = hashlib.sha256(f'{model}\0{text}'.encode('utf-8')).hexdigest()
+        return self._entry_key_prefix + digest
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """ Retrieves the cached embeddings of texts, with None for each cache miss. """
+        keys = [self.key(model, text) for text in texts]
+        try:
+            values = await self.redis_conn.mget(keys)
+            hit_keys = {key: time.time() for key, value in zip(keys, values) if value is not None}
+            if hit_keys:
+                await self.redis_conn.zadd(self._index_key, hit_keys)
+        except RedisError as exc:
+            print(f"Embedding cache unavailable: {exc}", flush=True)
+            EMBEDDING_CACHE_LOOKUPS.labels(self.namespace, 'error').inc(len(texts))
+            return [None] * len(texts)
+        num_hits = sum(value is not None for value in values)
+        EMBEDDING_CACHE_LOOKUPS.labels(self.namespace, 'hit').inc(num_hits)
+        EMBEDDING_CACHE_LOOKUPS.labels(self.namespace, 'miss').inc(len(texts) - num_hits)
+        return [np.frombuffer(value, dtype=np.float32).tolist() if value is not None else None
+                for value in values]
+
+    async def set_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """ Caches the embeddings of texts, evicting the least recently used entries if full. """
+        now = time.time()
+        entries = {self.key(model, text): np.asarray(embedding, dtype=np.float32).tobytes()
+                   for text, embedding in zip(texts, embeddings)}
+        try:
+            async with self.redis_conn.pipeline(transaction=False) as pipe:
+                if self.ttl_seconds > 0:
+                    for key, value in entries.items():
+                        pipe.set(key, value, px=int(self.ttl_seconds * 1000))
+                    # An entry last used a TTL ago was cached before that, so it has expired
+                    pipe.zremrangebyscore(self._index_key, '-inf', now - self.ttl_seconds)
+                else:
+                    pipe.mset(entries)
+                pipe.zadd(self._index_key, {key: now for key in entries})
+                pipe.zcard(self._index_key)
+                *_, num_entries = await pipe.execute()
+            if num_entries > self.max_entries:
+                evicted = await self.redis_conn.zpopmin(self._index_key,
+                                                        num_entries - self.max_entries)
+                if evicted:
+                    await self.redis_conn.delete(*(key for key, _ in evicted))
+        except RedisError as exc:
+            print(f"Embedding cache unavailable: {exc}", flush=True)
+
+@describe(
+""" Normalizes a search query, so that queries differing only in spacing share a cache entry.
+
+Case is kept, since the embedding depends on it.
+
+Args:
+    query (str): The search query.
+
+Returns:
+    str: The query in NFKC form, with runs of whitespace collapsed to single spaces.
+""")
+def normalize_query(query: str) -> str: # pylint: disable=missing-function-docstring
+    return ' '.join(unicodedata.normalize('NFKC', query).split())
+
+# Module-level variables to store the query embedding client and cache of this process
+_QUERY_EMBEDDING_CLIENT = None
+_QUERY_EMBEDDING_CACHE = None
+
+@describe(
+""" Returns the process-wide cache of query embeddings, or None if it is disabled. """)
+def get_query_embedding_cache() -> Optional[EmbeddingCache]: # pylint: disable=missing-function-docstring
+    global _QUERY_EMBEDDING_CACHE # pylint: disable=global-statement
+    if _QUERY_EMBEDDING_CACHE is None and settings.app_query_embedding_cache_max_entries > 0:
+        _QUERY_EMBEDDING_CACHE = EmbeddingCache(
+            aioredis.from_url(f"redis://{settings.redis_host}"),
+            max_entries=settings.app_query_embedding_cache_max_entries,
+            ttl_seconds=settings.app_query_embedding_cache_ttl_seconds,
+            namespace='query embedding cache')
+    return _QUERY_EMBEDDING_CACHE
+
+@describe(
+""" Calculates the embedding of a search query, or retrieves it from the query embedding cache.
+
+Args:
+    query (str): The search query.
+    model (str): The embedding model.
+
+Returns:
+    List[float]: The embedding of the normalized query.
+""")
+async def embed_query( # pylint: disable=missing-function-docstring
+    query: str, model: str = settings.app_text_embedding_model) -> List[float]:
+    global _QUERY_EMBEDDING_CLIENT # pylint: disable=global-statement
+    query = normalize_query(query)
+    cache = get_query_embedding_cache()
+    if cache:
+        embedding, = await cache.get_many(model, [query])
+        if embedding is not None:
+            return embedding
+    if _QUERY_EMBEDDING_CLIENT is None:
+        _QUERY_EMBEDDING_CLIENT = AsyncOpenAI(api_key=settings.openai_api_key)
+    response = await _QUERY_EMBEDDING_CLIENT.embeddings.create(model=model, input=query,
+                                                               encoding_format="float")
+    embedding = response.data[0].embedding
+    if cache:
+        await cache.set_many(model, [query], [embedding])
+    return embedding
+
+class EmbeddingScheduler: # pylint: disable=too-many-instance-attributes
+    """ Calculates embeddings with concurrent, rate-limited requests to the OpenAI API.
+
+    Args:
+        model (str): The embedding model.
+        max_concurrent_requests (int): The maximum number of requests in flight at once.
+        max_batch_tokens (int): The estimated token budget of a single request.
+        max_batch_inputs (int): The maximum number of texts in a single request.
+        tokens_per_minute (int): The account's tokens-per-minute limit for the model.
+        requests_per_minute (int): The account's requests-per-minute limit for the model.
+        max_retries (int): The number of times a rate-limited request is retried.
+        cache (EmbeddingCache): The cache to consult before requesting embeddings, if any.
+    """
+    def __init__(self, # pylint: disable=too-many-arguments
+                 model: str = settings.app_text_embedding_model,
+                 max_concurrent_requests: int = settings.app_embedding_max_concurrent_requests,
+                 max_batch_tokens: int = settings.app_embedding_max_batch_tokens,
+                 max_batch_inputs: int = settings.app_embedding_max_batch_inputs,
+                 tokens_per_minute: int = settings.app_embedding_tokens_per_minute,
+                 requests_per_minute: int = settings.app_embedding_requests_per_minute,
+                 max_retries: int = settings.app_embedding_max_retries,
+                 cache: Optional[EmbeddingCache] = None):
+        self.model = model
+        self.cache = cache
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_retries = max_retries
+        # The scheduler owns retries, so the client must not retry on its own
+        self.client = AsyncOpenAI(api_key=settings.openai_api_key, max_retries=0)
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._request_bucket = TokenBucket(requests_per_minute)
+
+    def split_batches(self, texts: List[str]) -> List[List[str]]:
+        """ Splits texts into consecutive batches that fit the per-request token and input limits.
+        """
+        batches = []
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or
+                          len(batch) >= self.max_batch_inputs):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """ Calculates the embeddings of texts, in order.
+
+        Cached embeddings are reused, and each distinct uncached text is only sent once.
+        """
+        if not texts:
+            return []
+        if self.cache:
+            embeddings = await self.cache.get_many(self.model, texts)
+        else:
+            embeddings = [None] * len(texts)
+        missing_texts = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing_texts:
+            batch_embeddings = await asyncio.gather(
+                *(self._embed_batch(batch) for batch in self.split_batches(missing_texts)))
+            missing_embeddings = [embedding
+                                  for embeddings in batch_embeddings for embedding in embeddings]
+            if self.cache:
+                await self.cache.set_many(self.model, missing_texts, missing_embeddings)
+            calculated = dict(zip(missing_texts, missing_embeddings))
+            embeddings = [calculated[text] if embedding is None else embedding
+                          for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                await self._request_bucket.acquire()
+                await self._token_bucket.acquire(tokens)
+                try:
+                    response = await self.client.embeddings.create(
+                        model=self.model,
+                        input=texts,
+                        encoding_format="float"
+                    )
+                    return [data.embedding
+                            for data in sorted(response.data, key=lambda data: data.index)]
+                except RateLimitError as exc:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = _retry_delay(exc, attempt)
+            # Back off outside the semaphore so that other requests are not held up
+            print(f"Embedding request rate limited, retrying in {delay:.1f} seconds", flush=True)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def _retry_delay(exc: RateLimitError, attempt: int) -> float:
+    """ Exponential backoff with jitter, deferring to the server's retry-after header. """
+    retry_after = exc.response.headers.get('retry-after') if exc.response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(60, 2 ** attempt) * (0.5 + random.random() / 2)
@@ -0,0 +1,116 @@
+""" File processing status notifications.
+
+Status changes are published to a topic exchange with the file ID as the routing key.  Each API
+process runs one `FileStatusHub`, which consumes a single exclusive queue and binds it only to the
+files that connected websockets are watching, so the broker delivers just the relevant events.  The
+hub then hands each event to the per-file asyncio queues of the watchers.
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Set
+from uuid import UUID
+import asyncio
+import json
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractExchange, AbstractIncomingMessage, AbstractQueue
+
+from .describe import describe
+from .rabbitmq import acquire_rabbitmq_channel, get_rabbitmq_connection
+
+FILE_STATUS_EXCHANGE_NAME = "file_processing_status"
+
+@describe(
+""" Declares the file status exchange on a channel.
+""")
+async def declare_file_status_exchange( # pylint: disable=missing-function-docstring
+    channel: AbstractChannel) -> AbstractExchange:
+    return await channel.declare_exchange(name=FILE_STATUS_EXCHANGE_NAME,
+                                          type=aio_pika.ExchangeType.TOPIC)
+
+@describe(
+""" Publishes a file's status to the file status exchange.
+
+Args:
+    file_id (str): The ID of the file.
+    status (str): The new status of the file.
+    channel (AbstractChannel): The channel to publish on, or None to borrow a pooled channel.
+""")
+async def publish_file_status( # pylint: disable=missing-function-docstring
+    file_id: str, status: str, channel: AbstractChannel|None = None):
+    if channel is None:
+        async with acquire_rabbitmq_channel() as pooled_channel:
+            await publish_file_status(file_id, status, pooled_channel)
+        return
+    exchange = await declare_file_status_exchange(channel)
+    await exchange.publish(
+        aio_pika.Message(
+            json.dumps({
+                'file_id': str(file_id),
+                'status': status
+            }).encode('utf-8'),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        ),
+        routing_key=str(file_id),
+    )
+
+class FileStatusHub:
+    """ Demultiplexes file status events to the watchers in this process.
+
+    Usage:
+        async with file_status_hub.subscribe(file_id) as statuses:
+            status = await statuses.get()
+    """
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._channel: AbstractChannel|None = None
+        self._queue: AbstractQueue|None = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        """ Declares this process's queue and starts consuming it. """
+        connection = await get_rabbitmq_connection()
+        self._channel = await connection.channel()
+        await declare_file_status_exchange(self._channel)
+        self._queue = await self._channel.declare_queue(name='', exclusive=True)
+        await self._queue.consume(self._on_message, no_ack=True)
+
+    async def stop(self):
+        """ Stops consuming and closes the channel. """
+        if self._channel is not None and not self._channel.is_closed:
+            await self._channel.close()
+        self._channel = None
+        self._queue = None
+
+    async def _on_message(self, message: AbstractIncomingMessage):
+        body = json.loads(message.body.decode('utf-8'))
+        for statuses in self._subscribers.get(body['file_id'], ()):
+            statuses.put_nowait(body)
+
+    @asynccontextmanager
+    async def subscribe(self, file_id: UUID) -> AsyncGenerator[asyncio.Queue, None]:
+        """ Receives the status events of a file for the duration of the context.
+
+        The file ID is bound as a routing key, so it must be a UUID; a wildcard such as '#' would
+        receive the events of every file.
+        """
+        file_id = str(UUID(str(file_id)))
+        statuses = asyncio.Queue()
+        async with self._lock:
+            if self._queue is None:
+                await self.start()
+            if file_id not in self._subscribers:
+                await self._queue.bind(FILE_STATUS_EXCHANGE_NAME, routing_key=file_id)
+                self._subscribers[file_id] = set()
+            self._subscribers[file_id].add(statuses)
+        try:
+            yield statuses
+        finally:
+            async with self._lock:
+                self._subscribers[file_id].discard(statuses)
+                if not self._subscribers[file_id]:
+                    del self._subscribers[file_id]
+                    if self._queue is not None:
+                        await self._queue.unbind(FILE_STATUS_EXCHANGE_NAME, routing_key=file_id)
+
+# The hub of this process
+file_status_hub = FileStatusHub()
@@ -1,35 +1,86 @@
 """ Minio utilities.
+
+Each process shares one minio client, whose connection pool is reused across requests.  The user
+uploads bucket is created once at startup, so requests do not probe object storage first.
 """
 from typing import Annotated, Any
+import asyncio
 import logging
 
 from minio import Minio
 from fastapi import Depends
+import urllib3
 
 from .describe import describe
 from ..config import settings
 
 USER_UPLOAD_BUCKET_NAME = "useruploads"
 
+# How long the health check waits for object storage to answer
+MINIO_HEALTH_CHECK_TIMEOUT_SECONDS = 0.5
+
+# Module-level variables to store the minio clients of this process
+_MINIO_CLIENT = None
+_MINIO_HEALTH_CHECK_CLIENT = None
+
+@describe(
+""" Returns the process-wide minio client, creating it on first use. """)
+def get_minio_client() -> Minio: # pylint: disable=missing-function-docstring
+    global _MINIO_CLIENT # pylint: disable=global-statement
+    if _MINIO_CLIENT is None:
+        _MINIO_CLIENT = Minio(
+            f"{settings.minio_host}:{settings.minio_port}",
+            access_key=settings.minio_access_key,
+            secret_key=settings.minio_secret_key,
+            secure=True,
+            cert_check=False
+        )
+    return _MINIO_CLIENT
+
+@describe(
+""" Returns the process-wide minio client for health checks, creating it on first use.
+
+Its requests give up after MINIO_HEALTH_CHECK_TIMEOUT_SECONDS, without retrying, so a probe of an
+unresponsive object store frees its thread instead of waiting on the default five-minute timeout.
+""")
+def get_minio_health_check_client() -> Minio: # pylint: disable=missing-function-docstring
+    global _MINIO_HEALTH_CHECK_CLIENT # pylint: disable=global-statement
+    if _MINIO_HEALTH_CHECK_CLIENT is None:
+        _MINIO_HEALTH_CHECK_CLIENT = Minio(
+            f"{settings.minio_host}:{settings.minio_port}",
+            access_key=settings.minio_access_key,
+            secret_key=settings.minio_secret_key,
+            secure=True,
+            # The custom client replaces minio's, so it skips the certificate check itself
+            http_client=urllib3.PoolManager(
+                timeout=urllib3.Timeout(total=MINIO_HEALTH_CHECK_TIMEOUT_SECONDS),
+                retries=False,
+                cert_reqs='CERT_NONE')
+        )
+    return _MINIO_HEALTH_CHECK_CLIENT
+
 @describe(
-""" FastAPI dependency to get a minio client. """)
-def get_minio_client(): # pylint: disable=missing-function-docstring
-    # Create a Minio client
-    minio_client = Minio(
-        f"{settings.minio_host}:{settings.minio_port}",
-        access_key=settings.minio_access_key,
-        secret_key=settings.minio_secret_key,
-        secure=True,
-        cert_check=False
-    )
+""" Makes sure the user uploads bucket exists.  Called once at startup. """)
+def create_bucket_if_necessary(): # pylint: disable=missing-function-docstring
+    minio_client = get_minio_client()
     try:
-        minio_client.list_buckets()
+        if not minio_client.bucket_exists(USER_UPLOAD_BUCKET_NAME):
+            minio_client.make_bucket(USER_UPLOAD_BUCKET_NAME)
     except Exception as err:
         logging.critical("Object storage not reachable")
         raise err
-    # Make sure the user-uploads bucket exists
-    if not minio_client.bucket_exists(USER_UPLOAD_BUCKET_NAME):
-        minio_client.make_bucket(USER_UPLOAD_BUCKET_NAME)
-    return minio_client
+
+@describe(
+""" Checks that object storage is reachable, with a single request.
+
+Returns:
+    bool: True if the user uploads bucket could be checked in time, otherwise False.
+""")
+async def is_minio_healthy() -> bool: # pylint: disable=missing-function-docstring
+    try:
+        return await asyncio.to_thread(get_minio_health_check_client().bucket_exists,
+                                       USER_UPLOAD_BUCKET_NAME)
+    except Exception: # pylint: disable=broad-except
+        return False
 
 MinioClientDep = Annotated[Any, Depends(get_minio_client)]
@@ -0,0 +1,114 @@
+""" RabbitMQ utilities.
+
+Each process keeps one robust AMQP connection for its lifetime, so publishing a message does not
+pay for a TCP and AMQP handshake, and the broker does not see a new connection per request.
+Short-lived work (declaring and publishing) borrows a channel from a bounded pool; long-lived
+consumers open a dedicated channel on the same connection.
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+import asyncio
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractRobustConnection
+
+from .describe import describe
+from ..config import settings
+
+class ChannelPool:
+    """ A bounded pool of channels on a connection.
+
+    Channels are opened on demand, up to `max_size` at once.  A channel that was closed while it
+    was borrowed (for example by a channel-level error from the broker) is discarded instead of
+    being returned to the pool.
+
+    Args:
+        connection (AbstractRobustConnection): The connection to open the channels on.
+        max_size (int): The maximum number of open channels.
+    """
+    def __init__(self, connection: AbstractRobustConnection, max_size: int):
+        self.connection = connection
+        self.max_size = max_size
+        self._idle = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(max_size)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[AbstractChannel, None]:
+        """ Borrows a channel from the pool, opening one if none is idle. """
+        async with self._slots:
+            channel = None
+            while not self._idle.empty() and channel is None:
+                channel = self._idle.get_nowait()
+                if channel.is_closed:
+                    channel = None
+            if channel is None:
+                channel = await self.connection.channel()
+            try:
+                yield channel
+            finally:
+                if not channel.is_closed:
+                    self._idle.put_nowait(channel)
+
+    async def close(self):
+        """ Closes the idle channels. """
+        while not self._idle.empty():
+            channel = self._idle.get_nowait()
+            if not channel.is_closed:
+                await channel.close()
+
+# Module-level variables to store the connection and channel pool of this process
+_CONNECTION: AbstractRobustConnection|None = None
+_CHANNEL_POOL: ChannelPool|None = None
+_CONNECT_LOCK = asyncio.Lock()
+
+@describe(
+""" Returns the process-wide RabbitMQ connection, connecting on first use. """)
+async def get_rabbitmq_connection() -> AbstractRobustConnection: # pylint: disable=missing-function-docstring
+    global _CONNECTION, _CHANNEL_POOL # pylint: disable=global-statement
+    async with _CONNECT_LOCK:
+        if _CONNECTION is None or _CONNECTION.is_closed:
+            _CONNECTION = await aio_pika.connect_robust(
+                host=settings.rabbitmq_host,
+                login=settings.rabbitmq_secret_username,
+                password=settings.rabbitmq_secret_password)
+            _CHANNEL_POOL = ChannelPool(_CONNECTION, settings.app_rabbitmq_channel_pool_size)
+    return _CONNECTION
+
+@describe(
+""" Closes the process-wide RabbitMQ connection, if it is open. """)
+async def close_rabbitmq_connection(): # pylint: disable=missing-function-docstring
+    global _CONNECTION, _CHANNEL_POOL # pylint: disable=global-statement
+    async with _CONNECT_LOCK:
+        if _CHANNEL_POOL is not None:
+            await _CHANNEL_POOL.close()
+        if _CONNECTION is not None and not _CONNECTION.is_closed:
+            await _CONNECTION.close()
+        _CONNECTION = None
+        _CHANNEL_POOL = None
+
+@describe(
+""" Borrows a channel from the process-wide channel pool.
+
+Use this for short-lived work such as declaring and publishing.  The channel is returned to the
+pool afterwards, so it must not be closed, and it must not be used for consuming.
+""")
+@asynccontextmanager
+async def acquire_rabbitmq_channel() -> AsyncGenerator[AbstractChannel, None]: # pylint: disable=missing-function-docstring
+    await get_rabbitmq_connection()
+    async with _CHANNEL_POOL.acquire() as channel:
+        yield channel
+
+@describe(
+""" Opens a dedicated channel on the process-wide connection, closing it afterwards.
+
+Use this for consumers, which hold their channel (and its prefetch window) for a long time.
+""")
+@asynccontextmanager
+async def open_rabbitmq_channel() -> AsyncGenerator[AbstractChannel, None]: # pylint: disable=missing-function-docstring
+    connection = await get_rabbitmq_connection()
+    channel = await connection.channel()
+    try:
+        yield channel
+    finally:
+        if not channel.is_closed:
+            await channel.close()
@@ -0,0 +1,125 @@
+""" Rebuilds the milvus chunk embedding index with the configured parameters, without taking search
+offline.
+
+A milvus field has a single index, so the index cannot be rebuilt in place while it is searched.
+Instead, the rows are copied to a new collection built with the configured index, and the chunk
+collection name, which the API and the file processing stages use, is switched over to it as an
+alias.  The old collection serves searches until the switch, and is then dropped.
+
+Rows that the file processing stages insert into the old collection during the copy are copied again
+after the switch.  Chunks deleted from the old collection during the copy are not, so rebuild while
+no files are being deleted.  The first rebuild renames the original collection to make way for the
+alias, so calls that use the name fail (and are retried) for that moment.
+
+Run it once, by hand or as a one-off job, after changing the index settings:
+
+Usage:
+    python -m sean_gpt.util.rebuild_milvus_index [--batch-size ROWS] [--dry-run]
+"""
+import argparse
+import time
+
+from pymilvus import Collection, connections, utility
+
+from ..config import settings
+from .vector_store import (
+    EMBEDDING_FIELD_NAME,
+    get_index_params,
+    index_params,
+    is_index_up_to_date,
+    resolve_collection_name)
+
+# The columns of an inserted row, in schema order, without the auto-generated chunk_id primary key
+INSERT_FIELDS = ("file_id", "chunk_location", EMBEDDING_FIELD_NAME, "chunk_txt")
+
+def copy_rows(source: Collection,
+              target: Collection,
+              batch_size: int,
+              after_chunk_id: int = -1) -> int:
+    """ Copies the rows of one collection to another, page by page.
+
+    Args:
+        source (Collection): The loaded collection to copy from.
+        target (Collection): The collection to copy to.
+        batch_size (int): The number of rows in each page.
+        after_chunk_id (int): Only copy the rows with a greater chunk_id.  Milvus allocates the
+            auto-generated ids in increasing order, so this skips the rows that an earlier call
+            copied.
+
+    Returns:
+        int: The greatest chunk_id copied, or `after_chunk_id` if there were no rows to copy.
+    """
+    source.flush()
+    iterator = source.query_iterator(batch_size=batch_size,
+                                     expr=f"chunk_id > {after_chunk_id}",
+                                     output_fields=list(INSERT_FIELDS))
+    last_chunk_id = after_chunk_id
+    num_rows = 0
+    try:
+        while rows := iterator.next():
+            target.insert([[row[field] for row in rows] for field in INSERT_FIELDS])
+            last_chunk_id = max(last_chunk_id, *(row['chunk_id'] for row in rows))
+            num_rows += len(rows)
+    finally:
+        iterator.close()
+    target.flush()
+    print(f"Copied {num_rows} rows from '{source.name}' to '{target.name}'", flush=True)
+    return last_chunk_id
+
+def rebuild_index(collection_name: str, batch_size: int) -> bool:
+    """ Rebuilds the embedding index of a collection, if it differs from the configured index.
+
+    Args:
+        collection_name (str): The collection name (or alias) that the API and stages use.
+        batch_size (int): The number of rows copied at a time.
+
+    Returns:
+        bool: True if the index was rebuilt.
+    """
+    serving_name = resolve_collection_name(collection_name)
+    if serving_name is None:
+        raise ValueError(f"Collection '{collection_name}' does not exist.")
+    serving = Collection(name=serving_name)
+    if is_index_up_to_date(serving):
+        print(f"The index of '{collection_name}' is up to date.", flush=True)
+        return False
+    suffix = time.strftime("%Y%m%d%H%M%S")
+    print(f"Rebuilding the {EMBEDDING_FIELD_NAME} index of '{collection_name}': "
+          f"{get_index_params(serving)} -> {index_params()}", flush=True)
+    # Build the new index on an empty collection, so it grows as the rows are copied
+    rebuilt = Collection(name=f"{collection_name}_{suffix}", schema=serving.schema)
+    rebuilt.create_index(field_name=EMBEDDING_FIELD_NAME, index_params=index_params())
+    rebuilt.load()
+    serving.load()
+    last_chunk_id = copy_rows(serving, rebuilt, batch_size)
+    # Switch the name over to the rebuilt collection
+    if serving_name == collection_name:
+        retired_name = f"{collection_name}_retired_{suffix}"
+        utility.rename_collection(serving_name, retired_name)
+        utility.create_alias(rebuilt.name, collection_name)
+        serving = Collection(name=retired_name)
+    else:
+        utility.alter_alias(rebuilt.name, collection_name)
+    print(f"'{collection_name}' now refers to '{rebuilt.name}'", flush=True)
+    # Catch up on the rows inserted into the old collection during the copy
+    copy_rows(serving, rebuilt, batch_size, last_chunk_id)
+    serving.release()
+    utility.drop_collection(serving.name)
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the milvus chunk embedding index with the configured parameters.")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="The number of rows copied at a time.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report whether the index differs from the configured index.")
+    args = parser.parse_args()
+    connections.connect(host=settings.milvus_host, port=settings.milvus_port)
+    if args.dry_run:
+        collection = Collection(name=settings.milvus_collection_name)
+        print(f"Existing: {get_index_params(collection)}\n"
+              f"Configured: {index_params()}\n"
+              f"Up to date: {is_index_up_to_date(collection)}", flush=True)
+    else:
+        rebuild_index(settings.milvus_collection_name, args.batch_size)
@@ -0,0 +1,56 @@
+""" In-process caching utilities. """
+from collections import OrderedDict
+from typing import Any, Hashable
+import threading
+import time
+
+class TTLCache:
+    """ A size-bounded, least-recently-used cache whose entries expire after a time to live.
+
+    The cache is local to the process, so it suits values that change rarely and whose changes
+    can be invalidated explicitly.  It is thread-safe, since sync FastAPI dependencies run in a
+    thread pool.
+
+    Args:
+        max_entries (int): The maximum number of entries; the least recently used are evicted.
+        ttl_seconds (float): How long an entry is served after it is set.  0 disables the cache.
+    """
+    _MISSING = object()
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """ Returns the cached value of a key, or `default` if it is missing or expired. """
+        with self._lock:
+            expires_at, value = self._entries.get(key, (0, self._MISSING))
+            if value is self._MISSING:
+                return default
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """ Caches the value of a key. """
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """ Removes a key from the cache, if it is cached. """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Removes every entry from the cache. """
+        with self._lock:
+            self._entries.clear()
@@ -4,17 +4,80 @@ from typing import Annotated
 from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlmodel import select, Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from ..model.authenticated_user import UserRead, AuthenticatedUser
 from ..model.access_token import AccessTokenData
 from ..config import settings
-from .database import get_db_engine
-from .auth import verify_password
+from .database import get_async_db_engine
+from .auth import verify_password_async
+from .ttl_cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="user/token")
 
-def get_user(phone: str) -> AuthenticatedUser | None:
+# The column values of recently authenticated users, by phone (the token subject).  Every committed
+# change to a user row in this process invalidates its entry; the short TTL bounds how long other
+# processes serve a user after it changes there.
+_USER_CACHE = TTLCache(max_entries=settings.app_user_cache_max_entries,
+                       ttl_seconds=settings.app_user_cache_ttl_seconds)
+
+def invalidate_cached_user(phone: str):
+    """ Removes a user from the authenticated-user cache of this process.
+
+    Args:
+        phone (str): The phone of the user.
+    """
+    _USER_CACHE.invalidate(phone)
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context): # pylint: disable=unused-argument
+    # The attribute history still holds the flushed changes, so a changed phone yields both the
+    # old and the new one
+    changed_phones = session.info.setdefault('changed_user_phones', set())
+    for user in (*session.dirty, *session.deleted):
+        if isinstance(user, AuthenticatedUser):
+            changed_phones.update(inspect(user).attrs.phone.history.sum())
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    # Invalidating at commit, rather than at flush, keeps another request from caching the row
+    # as it was before the commit
+    for phone in session.info.pop('changed_user_phones', ()):
+        invalidate_cached_user(phone)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop('changed_user_phones', None)
+
+async def get_cached_user(phone: str) -> AuthenticatedUser | None:
+    """ Gets a user from the authenticated-user cache, or else from the database.
+
+    Each call returns a separate detached instance, so the caller may add it to its own session and
+    modify it, as if it had been loaded from the database.
+
+    Args:
+        phone (str): The phone of the user to get.
+
+    Returns:
+        AuthenticatedUser: The user with the specified phone or None.
+    """
+    values = _USER_CACHE.get(phone)
+    if values is None:
+        user = await get_user(phone)
+        if user is None:
+            return None
+        values = {attribute.key: getattr(user, attribute.key)
+                  for attribute in inspect(AuthenticatedUser).column_attrs}
+        _USER_CACHE.set(phone, values)
+        return user
+    user = AuthenticatedUser(**values)
+    make_transient_to_detached(user)
+    return user
+
+async def get_user(phone: str) -> AuthenticatedUser | None:
     """ Gets a user from the database.
 
     Args:
@@ -23,13 +86,12 @@ def get_user(phone: str) -> AuthenticatedUser | None:
     Returns:
         AuthenticatedUser: The user with the specified username or None.
     """
-    db_engine = get_db_engine()
-    with Session(db_engine) as session:
-        return session.exec(select(AuthenticatedUser)
-                            .where(AuthenticatedUser.phone == phone)).first()
+    async with AsyncSession(get_async_db_engine(), expire_on_commit=False) as session:
+        return (await session.exec(select(AuthenticatedUser)
+                                   .where(AuthenticatedUser.phone == phone))).first()
 
-def authenticate_user(phone: str, password: str) -> AuthenticatedUser | None:
-    """ Authenticates a user.
+async def authenticate_user(phone: str, password: str) -> AuthenticatedUser | None:
+    """ Authenticates a user without blocking the event loop.
     
     Args:
         phone (str): The phone of the user to authenticate.
@@ -38,14 +100,14 @@ def authenticate_user(phone: str, password: str) -> AuthenticatedUser | None:
     Returns:
         AuthenticatedUser: The user if the authentication is successful, otherwise None.
     """
-    user = get_user(phone)
+    user = await get_user(phone)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> AuthenticatedUser:
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> AuthenticatedUser:
     """ Gets the user from the database that is associated with this token.
 
     Args:
@@ -72,7 +134,7 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Authentic
         token_data = AccessTokenData(username=username)
     except JWTError as exc:
         raise credentials_exception from exc
-    user = get_user(phone=token_data.username)
+    user = await get_cached_user(phone=token_data.username)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,511 @@
+""" Vector store utilities.
+
+The chunk embeddings are stored behind the `VectorStore` interface, with two backends, chosen by
+the vector_store_backend setting:
+    - milvus: the default.  Each process keeps one milvus connection and one loaded handle on the
+      chunk collection.  Loading a collection is expensive, so it happens once, at startup, rather
+      than on every query.  A call that fails with a milvus error reconnects and is retried once,
+      so a restarted milvus does not leave the process with a dead handle.
+    - local: an exact search over a memory-mapped NumPy matrix on local disk (see
+      `LocalVectorStore`), for tests and single-node installs without a milvus server.
+
+The type and parameters of the chunk_embedding index come from the settings, and new collections are
+built with them.  An existing collection keeps its index, which is searched with the parameters of
+its own type, until `python -m sean_gpt.util.rebuild_milvus_index` rebuilds it.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List
+import asyncio
+import fcntl
+import json
+import os
+import threading
+
+from pymilvus import Collection, connections, utility, MilvusException
+import numpy as np
+
+from .describe import describe
+from ..config import settings
+
+EMBEDDING_FIELD_NAME = "chunk_embedding"
+IVF_INDEX_TYPES = ("IVF_FLAT", "IVF_SQ8")
+
+def index_params(index_type: str|None = None) -> dict:
+    """ Returns the parameters to build the embedding index with.
+
+    Args:
+        index_type (str): The index type, or None for the configured type.
+
+    Returns:
+        dict: The index_params of `Collection.create_index`.
+    """
+    index_type = (index_type or settings.milvus_index_type).upper()
+    if index_type == "HNSW":
+        params = {"M": settings.milvus_index_hnsw_m,
+                  "efConstruction": settings.milvus_index_hnsw_ef_construction}
+    elif index_type in IVF_INDEX_TYPES:
+        params = {"nlist": settings.milvus_index_ivf_nlist}
+    elif index_type == "FLAT":
+        params = {}
+    else:
+        raise ValueError(f"Unsupported milvus index type '{index_type}'.")
+    return {"index_type": index_type,
+            "metric_type": settings.milvus_index_metric_type,
+            "params": params}
+
+def search_params(limit: int,
+                  index_type: str|None = None,
+                  ef: int|None = None,
+                  nprobe: int|None = None) -> dict:
+    """ Returns the parameters to search the embedding index with.
+
+    Args:
+        limit (int): The number of results; HNSW needs an ef of at least this.
+        index_type (str): The index type, or None for the configured type.
+        ef (int): The HNSW search candidate list size, or None for the configured size.
+        nprobe (int): The number of IVF clusters to search, or None for the configured number.
+
+    Returns:
+        dict: The param of `Collection.search`.
+    """
+    index_type = (index_type or settings.milvus_index_type).upper()
+    params = {}
+    if index_type == "HNSW":
+        params = {"ef": max(ef or settings.milvus_index_hnsw_ef, limit)}
+    elif index_type in IVF_INDEX_TYPES:
+        params = {"nprobe": nprobe or settings.milvus_index_ivf_nprobe}
+    return {"metric_type": settings.milvus_index_metric_type, "params": params}
+
+def _normalize_index_params(params: dict) -> dict:
+    """ Normalizes index parameters for comparison.
+
+    Milvus may report the build parameters as strings, and either nested under "params" or
+    alongside the index and metric types.
+    """
+    build_params = params.get("params") or {
+        key: value for key, value in params.items()
+        if key not in ("index_type", "metric_type", "field_name", "index_name")}
+    return {"index_type": str(params.get("index_type", "")).upper(),
+            "metric_type": str(params.get("metric_type", "")).upper(),
+            "params": {key: str(value) for key, value in build_params.items()}}
+
+def get_index_params(collection: Collection) -> dict|None:
+    """ Returns the normalized parameters of a collection's embedding index, or None if it has none.
+
+    Args:
+        collection (Collection): The collection.
+    """
+    existing = next((index.params for index in collection.indexes
+                     if index.field_name == EMBEDDING_FIELD_NAME), None)
+    return None if existing is None else _normalize_index_params(existing)
+
+def is_index_up_to_date(collection: Collection) -> bool:
+    """ Checks whether a collection's embedding index is built with the configured parameters.
+
+    Args:
+        collection (Collection): The collection.
+    """
+    return get_index_params(collection) == _normalize_index_params(index_params())
+
+def resolve_collection_name(name: str) -> str|None:
+    """ Returns the collection that a name refers to, or None if there is none.
+
+    The chunk collection name becomes an alias once its index has been rebuilt (see
+    `sean_gpt.util.rebuild_milvus_index`).
+
+    Args:
+        name (str): A collection name or alias.
+    """
+    collection_names = utility.list_collections()
+    if name in collection_names:
+        return name
+    return next((collection_name for collection_name in collection_names
+                 if name in utility.list_aliases(collection_name)), None)
+
+class VectorStore(ABC):
+    """ A store of chunk embeddings, searchable by similarity.
+
+    The coroutines are for the API's event loop and run the blocking work in worker threads.
+    `insert`, `delete_chunks`, `flush` and `iter_file_chunks` block, and are meant to be called from
+    worker threads by the file processing stages.
+    """
+    async def connect(self):
+        """ Opens the store. """
+        await asyncio.to_thread(self._open)
+
+    async def close(self):
+        """ Closes the store. """
+        await asyncio.to_thread(self._close)
+
+    async def search(self,
+                     embedding: List[float],
+                     limit: int,
+                     output_fields: List[str]) -> List[dict]:
+        """ Finds the chunks nearest to an embedding.
+
+        Args:
+            embedding (List[float]): The query embedding.
+            limit (int): The maximum number of chunks to return.
+            output_fields (List[str]): The fields of each chunk to return.
+
+        Returns:
+            List[dict]: The output fields and distance of each chunk, nearest first.
+        """
+        return await asyncio.to_thread(self._search, embedding, limit, output_fields)
+
+    async def delete_file(self, file_id: str):
+        """ Deletes the chunks of a file.
+
+        Args:
+            file_id (str): The ID of the file.
+        """
+        await asyncio.to_thread(self._delete_file, str(file_id))
+
+    @abstractmethod
+    def _open(self):
+        """ Opens the store, blocking. """
+
+    @abstractmethod
+    def _close(self):
+        """ Closes the store, blocking. """
+
+    @abstractmethod
+    def _search(self, embedding: List[float], limit: int, output_fields: List[str]) -> List[dict]:
+        """ Finds the chunks nearest to an embedding, blocking. """
+
+    @abstractmethod
+    def _delete_file(self, file_id: str):
+        """ Deletes the chunks of a file, blocking. """
+
+    @abstractmethod
+    def insert(self,
+               file_ids: List[str],
+               chunk_locations: List[int],
+               chunk_embeddings: np.ndarray,
+               chunk_txts: List[str]):
+        """ Inserts chunks, column-wise.
+
+        Args:
+            file_ids (List[str]): The file of each chunk.
+            chunk_locations (List[int]): The location of each chunk in its file.
+            chunk_embeddings (np.ndarray): The float32 embedding of each chunk, one per row.
+            chunk_txts (List[str]): The text of each chunk.
+        """
+
+    @abstractmethod
+    def delete_chunks(self, file_id: str, chunk_locations: List[int]):
+        """ Deletes chunks of a file, by their locations in the file.
+
+        Args:
+            file_id (str): The ID of the file.
+            chunk_locations (List[int]): The locations of the chunks to delete.
+        """
+
+    @abstractmethod
+    def flush(self):
+        """ Persists the inserted chunks. """
+
+    @abstractmethod
+    def iter_file_chunks(self, file_id: str, batch_size: int) -> Iterator[List[dict]]:
+        """ Yields the chunks of a file in batches.
+
+        Each chunk is a dict of its chunk_location, chunk_embedding and chunk_txt.
+        """
+
+class MilvusVectorStore(VectorStore):
+    """ A managed milvus connection and loaded collection handle.
+
+    Args:
+        host (str): The milvus host.
+        port (str): The milvus port.
+        collection_name (str): The name of the collection to search.
+        alias (str): The pymilvus connection alias.
+    """
+    def __init__(self, host: str, port: str, collection_name: str, alias: str = "default"):
+        self.host = host
+        self.port = port
+        self.collection_name = collection_name
+        self.alias = alias
+        self._collection: Collection|None = None
+        self._index_type: str|None = None
+        self._lock = threading.Lock()
+
+    def _get_collection(self) -> Collection:
+        """ Returns the loaded collection handle, connecting and loading it if necessary.
+
+        The search parameters follow the index that the collection has, which differs from the
+        configured one until it is rebuilt.
+        """
+        with self._lock:
+            if self._collection is None:
+                connections.connect(alias=self.alias, host=self.host, port=self.port)
+                collection = Collection(name=self.collection_name, using=self.alias)
+                collection.load()
+                self._index_type = (get_index_params(collection) or {}).get('index_type')
+                self._collection = collection
+            return self._collection
+
+    def _reset(self):
+        """ Drops the collection handle and the connection, so the next call reconnects. """
+        with self._lock:
+            self._collection = None
+            connections.disconnect(self.alias)
+
+    def _call(self, function: Callable[[Collection], Any], retry: bool = True) -> Any:
+        """ Calls a function with the collection handle, reconnecting on failure.
+
+        Args:
+            function (Callable[[Collection], Any]): The function to call.
+            retry (bool): Retry the call once after reconnecting.  Inserts are not retried, since
+                a failed insert may have been applied.
+        """
+        try:
+            return function(self._get_collection())
+        except MilvusException as err:
+            print(f"Milvus call failed ({err}), reconnecting", flush=True)
+            self._reset()
+            if not retry:
+                raise
+            return function(self._get_collection())
+
+    def _open(self):
+        self._get_collection()
+
+    def _close(self):
+        self._reset()
+
+    def _search(self, embedding: List[float], limit: int, output_fields: List[str]) -> List[dict]:
+        results = self._call(lambda collection: collection.search(
+            data=[embedding],
+            anns_field=EMBEDDING_FIELD_NAME,
+            limit=limit,
+            param=search_params(limit, self._index_type),
+            output_fields=output_fields))
+        return [{'distance': hit.distance,
+                 **{field: hit.entity.get(field) for field in output_fields}}
+                for hit in results[0]]
+
+    def _delete_file(self, file_id: str):
+        self._call(lambda collection: collection.delete(expr=f'file_id in {[file_id]}'))
+
+    def insert(self,
+               file_ids: List[str],
+               chunk_locations: List[int],
+               chunk_embeddings: np.ndarray,
+               chunk_txts: List[str]):
+        # The columns are in schema order, without the auto-generated chunk_id primary key
+        self._call(lambda collection: collection.insert(
+            [file_ids, chunk_locations, chunk_embeddings, chunk_txts]), retry=False)
+
+    def delete_chunks(self, file_id: str, chunk_locations: List[int]):
+        locations = [int(chunk_location) for chunk_location in chunk_locations]
+        self._call(lambda collection: collection.delete(
+            expr=f'file_id == "{file_id}" and chunk_location in {locations}'))
+
+    def flush(self):
+        self._call(lambda collection: collection.flush())
+
+    def iter_file_chunks(self, file_id: str, batch_size: int) -> Iterator[List[dict]]:
+        iterator = self._call(lambda collection: collection.query_iterator(
+            batch_size=batch_size,
+            expr=f'file_id == "{file_id}"',
+            output_fields=['chunk_location', 'chunk_embedding', 'chunk_txt']))
+        try:
+            while rows := iterator.next():
+                yield rows
+        finally:
+            iterator.close()
+
+class LocalVectorStore(VectorStore): # pylint: disable=too-many-instance-attributes
+    """ An exact-search vector store in a local directory.
+
+    The directory holds two append-only files:
+        - embeddings.f32, the float32 embeddings, one row per chunk, memory-mapped for searching
+        - chunks.jsonl, the file_id, chunk_location and chunk_txt of each row, in row order, and a
+          tombstone record for each deleted file or set of deleted chunks
+
+    A row exists once its record is in chunks.jsonl, so a writer appends the embeddings first and
+    the records second, and a writer that died in between leaves only embeddings that the next
+    writer truncates.  Writers hold an exclusive lock on the directory, so the API and the file
+    processing stages can share a store.  Every process replays new records before it reads, so it
+    sees the rows and deletions of the others.
+
+    Searches are exact: the L2 distance to every live row, computed in one vectorized pass, with the
+    top k selected by `np.argpartition`.  Distances are squared, as milvus reports them.  Deleted
+    rows stay on disk, masked out of searches.
+
+    Args:
+        path (str): The directory of the store, created if it does not exist.
+        dim (int): The dimension of the embeddings.
+    """
+    EMBEDDINGS_FILE_NAME = "embeddings.f32"
+    CHUNKS_FILE_NAME = "chunks.jsonl"
+    LOCK_FILE_NAME = "lock"
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._opened = False
+        # The rows replayed from chunks.jsonl so far
+        self._chunks_offset = 0
+        self._file_ids: List[str] = []
+        self._chunk_locations: List[int] = []
+        self._chunk_txts: List[str] = []
+        self._rows_by_file_id: Dict[str, List[int]] = {}
+        self._live = np.zeros(0, dtype=bool)
+        self._embeddings = np.zeros((0, self.dim), dtype=np.float32)
+        self._squared_norms = np.zeros(0, dtype=np.float32)
+
+    def _file_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        with self._lock:
+            if not self._opened:
+                os.makedirs(self.path, exist_ok=True)
+                for name in (self.EMBEDDINGS_FILE_NAME, self.CHUNKS_FILE_NAME, self.LOCK_FILE_NAME):
+                    with open(self._file_path(name), 'ab'):
+                        pass
+                self._opened = True
+
+    def _close(self):
+        with self._lock:
+            self._opened = False
+
+    def _refresh(self):
+        """ Replays the records appended since the last refresh.  Call with the lock held. """
+        with open(self._file_path(self.CHUNKS_FILE_NAME), 'rb') as chunks_file:
+            chunks_file.seek(self._chunks_offset)
+            data = chunks_file.read()
+        # Only complete lines are replayed; a writer may be appending the rest
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return
+        self._chunks_offset += len(data)
+        num_rows = len(self._file_ids)
+        deleted_rows = []
+        for line in data.splitlines():
+            record = json.loads(line)
+            if 'deleted_file_id' in record:
+                rows = self._rows_by_file_id.pop(record['deleted_file_id'], [])
+                if 'deleted_chunk_locations' in record:
+                    locations = set(record['deleted_chunk_locations'])
+                    deleted = [row for row in rows if self._chunk_locations[row] in locations]
+                    rows = [row for row in rows if self._chunk_locations[row] not in locations]
+                    if rows:
+                        self._rows_by_file_id[record['deleted_file_id']] = rows
+                    rows = deleted
+                deleted_rows.extend(rows)
+                continue
+            self._rows_by_file_id.setdefault(record['file_id'], []).append(len(self._file_ids))
+            self._file_ids.append(record['file_id'])
+            self._chunk_locations.append(record['chunk_location'])
+            self._chunk_txts.append(record['chunk_txt'])
+        if len(self._file_ids) > num_rows:
+            self._live = np.concatenate(
+                [self._live, np.ones(len(self._file_ids) - num_rows, dtype=bool)])
+            self._embeddings = np.memmap(self._file_path(self.EMBEDDINGS_FILE_NAME),
+                                         dtype=np.float32, mode='r',
+                                         shape=(len(self._file_ids), self.dim))
+            new_embeddings = self._embeddings[num_rows:]
+            self._squared_norms = np.concatenate(
+                [self._squared_norms, np.einsum('ij,ij->i', new_embeddings, new_embeddings)])
+        self._live[deleted_rows] = False
+
+    def _write(self, embeddings: np.ndarray|None, records: List[dict]):
+        """ Appends embeddings and their records while holding the directory lock. """
+        self._open()
+        with open(self._file_path(self.LOCK_FILE_NAME), 'rb') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    self._refresh()
+                    num_rows = len(self._file_ids)
+                if embeddings is not None:
+                    with open(self._file_path(self.EMBEDDINGS_FILE_NAME), 'r+b') as embeddings_file:
+                        # Drop the embeddings of a writer that died before adding their records
+                        embeddings_file.truncate(num_rows * self.dim * 4)
+                        embeddings_file.seek(0, os.SEEK_END)
+                        embeddings_file.write(
+                            np.ascontiguousarray(embeddings, np.float32).tobytes())
+                with open(self._file_path(self.CHUNKS_FILE_NAME), 'ab') as chunks_file:
+                    chunks_file.write(b''.join(json.dumps(record).encode('utf-8') + b'\n'
+                                               for record in records))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _search(self, embedding: List[float], limit: int, output_fields: List[str]) -> List[dict]:
+        self._open()
+        with self._lock:
+            self._refresh()
+            query = np.asarray(embedding, dtype=np.float32)
+            # |x - q|^2 = |x|^2 - 2 x.q + |q|^2
+            distances = self._squared_norms - 2 * (self._embeddings @ query) + query @ query
+            distances[~self._live] = np.inf
+            limit = min(limit, int(self._live.sum()))
+            if limit <= 0:
+                return []
+            nearest = np.argpartition(distances, limit - 1)[:limit]
+            nearest = nearest[np.argsort(distances[nearest])]
+            columns = {'file_id': self._file_ids,
+                       'chunk_location': self._chunk_locations,
+                       'chunk_txt': self._chunk_txts}
+            return [{'distance': float(distances[row]),
+                     **{field: (self._embeddings[row].tolist() if field == 'chunk_embedding' else
+                                columns[field][row])
+                        for field in output_fields}}
+                    for row in nearest]
+
+    def _delete_file(self, file_id: str):
+        self._write(None, [{'deleted_file_id': file_id}])
+
+    def insert(self,
+               file_ids: List[str],
+               chunk_locations: List[int],
+               chunk_embeddings: np.ndarray,
+               chunk_txts: List[str]):
+        self._write(np.asarray(chunk_embeddings, dtype=np.float32).reshape(-1, self.dim),
+                    [{'file_id': file_id, 'chunk_location': int(chunk_location),
+                      'chunk_txt': chunk_txt}
+                     for file_id, chunk_location, chunk_txt
+                     in zip(file_ids, chunk_locations, chunk_txts)])
+
+    def delete_chunks(self, file_id: str, chunk_locations: List[int]):
+        self._write(None, [{'deleted_file_id': file_id,
+                            'deleted_chunk_locations': [int(chunk_location)
+                                                        for chunk_location in chunk_locations]}])
+
+    def flush(self):
+        """ Does nothing; chunks are written as they are inserted. """
+
+    def iter_file_chunks(self, file_id: str, batch_size: int) -> Iterator[List[dict]]:
+        self._open()
+        with self._lock:
+            self._refresh()
+            rows = [row for row in self._rows_by_file_id.get(file_id, []) if self._live[row]]
+            chunks = [{'chunk_location': self._chunk_locations[row],
+                       'chunk_embedding': self._embeddings[row].tolist(),
+                       'chunk_txt': self._chunk_txts[row]}
+                      for row in rows]
+        for start in range(0, len(chunks), batch_size):
+            yield chunks[start:start + batch_size]
+
+@describe(
+""" Creates the vector store configured by the vector_store_backend setting.
+
+Returns:
+    VectorStore: A MilvusVectorStore for "milvus", or a LocalVectorStore for "local".
+""")
+def create_vector_store() -> VectorStore: # pylint: disable=missing-function-docstring
+    if settings.vector_store_backend == "milvus":
+        return MilvusVectorStore(host=settings.milvus_host,
+                                 port=settings.milvus_port,
+                                 collection_name=settings.milvus_collection_name)
+    if settings.vector_store_backend == "local":
+        return LocalVectorStore(path=settings.vector_store_local_path,
+                                dim=settings.app_text_embedding_model_dim)
+    raise ValueError(f"Unsupported vector store backend '{settings.vector_store_backend}'.")
+
+# The vector store of this process
+vector_store = create_vector_store()
@@ -0,0 +1,170 @@
+""" Tests for the chat's tool calls.
+
+The tools and the OpenAI completion stream are replaced with stand-ins, so these run without the
+vector store or network access.
+"""
+
+# Disable pylint flags for test fixtures:
+# pylint: disable=unused-argument
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+from unittest.mock import patch
+import asyncio
+import json
+import time
+
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk,
+    Choice,
+    ChoiceDelta,
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction)
+from prometheus_client import REGISTRY
+
+from sean_gpt import ai
+from sean_gpt.config import settings
+from sean_gpt.routers.generate import chat_ws
+from sean_gpt.util.describe import describe
+
+def tool_sample_count(tool: str, outcome: str) -> float:
+    """ Returns the number of tool calls recorded by the latency histogram. """
+    return REGISTRY.get_sample_value('sean_gpt_tool_latency_seconds_count',
+                                     {'tool': tool, 'outcome': outcome}) or 0
+
+@describe(
+""" Test that the tool calls of a turn run concurrently, and that their results keep their order.
+""")
+def test_run_tools_concurrently():
+    async def run_tool(name, arguments):
+        await asyncio.sleep(0.1)
+        return f"{name} {json.loads(arguments)['prompt']}"
+
+    tool_calls = [("tool", json.dumps({'prompt': str(index)})) for index in range(5)]
+    with patch.object(ai, 'run_tool', new=run_tool):
+        start = time.perf_counter()
+        results = asyncio.run(ai.run_tools(tool_calls))
+        elapsed = time.perf_counter() - start
+    assert results == [f"tool {index}" for index in range(5)], (
+        f"Expected the results in call order.  Received {results}"
+    )
+    assert elapsed < 0.3, f"Expected the calls to overlap.  Received {elapsed:.2f} seconds"
+
+@describe(
+""" Test that a tool that times out or fails returns an error message instead of raising.
+""")
+def test_run_tools_timeout_and_error():
+    async def run_tool(name, arguments):
+        if name == "slow tool":
+            await asyncio.sleep(10)
+        if name == "broken tool":
+            raise RuntimeError("broken")
+        return arguments
+
+    timeouts = tool_sample_count("slow tool", 'timeout')
+    errors = tool_sample_count("broken tool", 'error')
+    with patch.object(ai, 'run_tool', new=run_tool), \
+         patch.object(settings, 'app_tool_timeout_seconds', 0.05):
+        results = asyncio.run(ai.run_tools([("slow tool", "{}"),
+                                            ("broken tool", "{}"),
+                                            ("tool", "result")]))
+    assert results == ["The tool 'slow tool' did not respond in time.",
+                       "The tool 'broken tool' failed.",
+                       "result"], f"Expected an error message for each failure.  Received {results}"
+    assert tool_sample_count("slow tool", 'timeout') == timeouts + 1, (
+        "Expected the timeout to be recorded."
+    )
+    assert tool_sample_count("broken tool", 'error') == errors + 1, (
+        "Expected the error to be recorded."
+    )
+
+def chunk(content=None, tool_calls=None, finish_reason=None) -> ChatCompletionChunk:
+    """ Returns a streamed completion chunk. """
+    return ChatCompletionChunk(
+        id="chunk", created=0, model="model", object="chat.completion.chunk",
+        choices=[Choice(index=0, finish_reason=finish_reason,
+                        delta=ChoiceDelta(content=content, tool_calls=tool_calls))])
+
+def tool_call_fragment(index, call_id=None, name=None, arguments=None) -> ChoiceDeltaToolCall:
+    """ Returns a fragment of a streamed tool call. """
+    return ChoiceDeltaToolCall(index=index, id=call_id, type="function" if call_id else None,
+                               function=ChoiceDeltaToolCallFunction(name=name,
+                                                                    arguments=arguments))
+
+async def stream(chunks):
+    for streamed_chunk in chunks:
+        yield streamed_chunk
+
+class FakeRedis: # pylint: disable=too-few-public-methods
+    """ Accepts any websocket token. """
+    async def exists(self, key):
+        return True
+
+    async def delete(self, key):
+        return 1
+
+class FakeWebSocket:
+    """ Sends a single chat completion request and records the replies. """
+    def __init__(self, conversation):
+        self.conversation = conversation
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def receive_json(self):
+        return {'action': 'chat_completion', 'payload': {'conversation': self.conversation}}
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def close(self):
+        pass
+
+@describe(
+""" Test that tool calls streamed as interleaved fragments are assembled by index.
+""")
+def test_chat_assembles_interleaved_tool_calls():
+    turns = [
+        # Two tool calls, whose fragments arrive interleaved
+        [chunk(tool_calls=[tool_call_fragment(0, "call_a", "get_molten_salt_documents", "")]),
+         chunk(tool_calls=[tool_call_fragment(1, "call_b", "get_molten_salt_documents", "")]),
+         chunk(tool_calls=[tool_call_fragment(0, arguments='{"prompt": '),
+                           tool_call_fragment(1, arguments='{"prompt": "fuel')]),
+         chunk(tool_calls=[tool_call_fragment(1, arguments=' salts"}')]),
+         chunk(tool_calls=[tool_call_fragment(0, arguments='"reactors"}')]),
+         chunk(finish_reason="tool_calls")],
+        [chunk(content="Here are the documents."), chunk(finish_reason="stop")],
+    ]
+    requests, tool_runs = [], []
+
+    async def get_chat_completion_stream(conversation, include_tools):
+        requests.append((list(conversation), include_tools))
+        return stream(turns[len(requests) - 1])
+
+    async def run_tools(tool_calls):
+        tool_runs.append(tool_calls)
+        return [f"result {index}" for index in range(len(tool_calls))]
+
+    websocket = FakeWebSocket([{"role": "user", "content": "Tell me about molten salt."}])
+    with patch.object(chat_ws, 'get_chat_completion_stream', new=get_chat_completion_stream), \
+         patch.object(chat_ws, 'run_tools', new=run_tools):
+        asyncio.run(chat_ws.generate_chat_stream(token="token",
+                                                 redis_conn=FakeRedis(),
+                                                 websocket=websocket))
+    assert tool_runs == [[("get_molten_salt_documents", '{"prompt": "reactors"}'),
+                          ("get_molten_salt_documents", '{"prompt": "fuel salts"}')]], (
+        f"Expected both tool calls, assembled in index order.  Received {tool_runs}"
+    )
+    conversation, include_tools = requests[1]
+    assert not include_tools, "Expected the tools to only be offered once."
+    assert [call['id'] for call in conversation[1]['tool_calls']] == ["call_a", "call_b"], (
+        f"Expected the assistant's tool calls.  Received {conversation[1]}"
+    )
+    assert [(message['tool_call_id'], message['content']) for message in conversation[2:4]] == [
+        ("call_a", "result 0"), ("call_b", "result 1")], (
+        f"Expected a tool message for each call.  Received {conversation[2:4]}"
+    )
+    assert websocket.sent == ["Here are the documents."], (
+        f"Expected the final answer to be streamed.  Received {websocket.sent}"
+    )
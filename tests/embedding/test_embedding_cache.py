@@ -0,0 +1,85 @@
+""" Tests for the redis cache of chunk embeddings.
+
+Redis is replaced by an in-memory stand-in, so these run without a redis server.
+"""
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+import asyncio
+
+from sean_gpt.util.describe import describe
+from sean_gpt.util.embedding import EmbeddingCache
+
+from ..util.fake_redis import FakeRedis
+
+MODEL = "text-embedding-3-small"
+
+@describe(
+""" Test that cached embeddings are returned, and that misses are None.
+""")
+def test_embedding_cache_get_and_set():
+    cache = EmbeddingCache(FakeRedis(), max_entries=10)
+
+    async def run():
+        await cache.set_many(MODEL, ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+        return await cache.get_many(MODEL, ["b", "c", "a"])
+
+    assert asyncio.run(run()) == [[3.0, 4.0], None, [1.0, 2.0]], (
+        "Expected the cached embeddings of a and b, and a miss for c."
+    )
+
+@describe(
+""" Test that the least recently used embeddings are evicted once the cache is full.
+""")
+def test_embedding_cache_evicts_least_recently_used():
+    redis_conn = FakeRedis()
+    cache = EmbeddingCache(redis_conn, max_entries=2)
+
+    async def run():
+        await cache.set_many(MODEL, ["a"], [[1.0]])
+        await asyncio.sleep(0.01)
+        await cache.set_many(MODEL, ["b"], [[2.0]])
+        await asyncio.sleep(0.01)
+        # Using a makes b the least recently used
+        await cache.get_many(MODEL, ["a"])
+        await asyncio.sleep(0.01)
+        await cache.set_many(MODEL, ["c"], [[3.0]])
+        return await cache.get_many(MODEL, ["a", "b", "c"])
+
+    assert asyncio.run(run()) == [[1.0], None, [3.0]], "Expected b to be evicted."
+    assert len(redis_conn.values) == 2, (
+        f"Expected the evicted entry to be deleted.  Received {len(redis_conn.values)} entries"
+    )
+
+@describe(
+""" Test that embeddings are cached per model.
+""")
+def test_embedding_cache_keys_by_model():
+    cache = EmbeddingCache(FakeRedis(), max_entries=10)
+
+    async def run():
+        await cache.set_many(MODEL, ["a"], [[1.0]])
+        return await cache.get_many("another model", ["a"])
+
+    assert asyncio.run(run()) == [None], "Expected a miss for another model."
+
+@describe(
+""" Test that cached embeddings expire after the time to live.
+""")
+def test_embedding_cache_expires_entries():
+    redis_conn = FakeRedis()
+    cache = EmbeddingCache(redis_conn, max_entries=10, ttl_seconds=0.05)
+
+    async def run():
+        await cache.set_many(MODEL, ["a"], [[1.0]])
+        fresh = await cache.get_many(MODEL, ["a"])
+        await asyncio.sleep(0.1)
+        expired = await cache.get_many(MODEL, ["a"])
+        # Caching another entry drops the expired one from the index
+        await cache.set_many(MODEL, ["b"], [[2.0]])
+        return fresh, expired
+
+    assert asyncio.run(run()) == ([[1.0]], [None]), "Expected a to expire after 0.05 seconds."
+    assert len(redis_conn.sorted_sets[cache._index_key]) == 1, ( # pylint: disable=protected-access
+        "Expected the expired entry to be removed from the index."
+    )
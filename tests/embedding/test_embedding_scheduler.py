@@ -0,0 +1,130 @@
+""" Tests for the embedding request scheduler.
+
+The OpenAI embeddings endpoint is replaced by the mock in `sean_gpt.routers.mock.openai`, so these
+run without network access.
+"""
+
+# Disable pylint flags for test fixtures:
+# pylint: disable=unused-argument
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+from unittest.mock import patch
+import asyncio
+
+from openai import RateLimitError
+import httpx
+import pytest
+
+from sean_gpt.config import settings
+from sean_gpt.routers.mock.openai import get_random_embedding_async
+from sean_gpt.util.describe import describe
+from sean_gpt.util.embedding import EmbeddingScheduler, _retry_delay
+
+# Limits high enough that the token buckets never throttle a test
+UNLIMITED = {'tokens_per_minute': 10**9, 'requests_per_minute': 10**9}
+
+def rate_limit_error(retry_after: str|None = None) -> RateLimitError:
+    """ Returns a 429 error, as raised by the OpenAI client. """
+    headers = {'retry-after': retry_after} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers,
+                              request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+@describe(
+""" Test that texts are split into consecutive batches by estimated tokens and number of inputs.
+""")
+def test_split_batches_by_token_budget():
+    # About 3 characters per token, so each of these texts is estimated at 10 tokens
+    scheduler = EmbeddingScheduler(max_batch_tokens=25, max_batch_inputs=100, **UNLIMITED)
+    texts = [f"{index:030d}" for index in range(5)]
+    assert scheduler.split_batches(texts) == [texts[0:2], texts[2:4], texts[4:5]], (
+        "Expected batches of at most 25 estimated tokens."
+    )
+    scheduler = EmbeddingScheduler(max_batch_tokens=1000, max_batch_inputs=2, **UNLIMITED)
+    assert scheduler.split_batches(texts) == [texts[0:2], texts[2:4], texts[4:5]], (
+        "Expected batches of at most 2 inputs."
+    )
+    # A text larger than the budget is still sent, on its own
+    scheduler = EmbeddingScheduler(max_batch_tokens=5, max_batch_inputs=100, **UNLIMITED)
+    assert scheduler.split_batches(texts[:2]) == [texts[0:1], texts[1:2]], (
+        "Expected each oversized text in a batch of its own."
+    )
+
+@describe(
+""" Test that batches are requested concurrently, up to the limit, and returned in order.
+""")
+def test_embed_limits_concurrent_requests():
+    in_flight, peak_in_flight, inputs = 0, 0, []
+
+    async def create(*args, **kwargs):
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        inputs.append(kwargs['input'])
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return await get_random_embedding_async(*args, **kwargs)
+
+    scheduler = EmbeddingScheduler(max_concurrent_requests=2, max_batch_tokens=1000,
+                                   max_batch_inputs=1, **UNLIMITED)
+    texts = [f"text {index}" for index in range(6)]
+    with patch('openai.resources.AsyncEmbeddings.create', new=create):
+        embeddings = asyncio.run(scheduler.embed(texts))
+    assert len(inputs) == 6, f"Expected one request per text.  Received {inputs}"
+    assert peak_in_flight == 2, f"Expected 2 requests in flight at once.  Received {peak_in_flight}"
+    assert len(embeddings) == 6 and all(
+        len(embedding) == settings.app_text_embedding_model_dim for embedding in embeddings), (
+        "Expected an embedding of the model's dimension for each text."
+    )
+
+@describe(
+""" Test that rate-limited requests are retried after the server's Retry-After delay.
+""")
+def test_embed_retries_rate_limited_requests():
+    attempts = 0
+
+    async def create(*args, **kwargs):
+        nonlocal attempts
+        attempts += 1
+        if attempts <= 2:
+            raise rate_limit_error(retry_after="0.01")
+        return await get_random_embedding_async(*args, **kwargs)
+
+    scheduler = EmbeddingScheduler(max_retries=2, **UNLIMITED)
+    with patch('openai.resources.AsyncEmbeddings.create', new=create):
+        embeddings = asyncio.run(scheduler.embed(["text"]))
+    assert attempts == 3, f"Expected two retries.  Received {attempts - 1}"
+    assert len(embeddings) == 1, f"Expected one embedding.  Received {len(embeddings)}"
+
+@describe(
+""" Test that the rate limit error is raised once the retries are exhausted.
+""")
+def test_embed_gives_up_after_max_retries():
+    attempts = 0
+
+    async def create(*args, **kwargs):
+        nonlocal attempts
+        attempts += 1
+        raise rate_limit_error(retry_after="0")
+
+    scheduler = EmbeddingScheduler(max_retries=1, **UNLIMITED)
+    with patch('openai.resources.AsyncEmbeddings.create', new=create):
+        with pytest.raises(RateLimitError):
+            asyncio.run(scheduler.embed(["text"]))
+    assert attempts == 2, f"Expected one retry.  Received {attempts - 1}"
+
+@describe(
+""" Test that the retry delay defers to Retry-After, and otherwise backs off exponentially.
+""")
+def test_retry_delay():
+    assert _retry_delay(rate_limit_error(retry_after="7"), attempt=0) == 7, (
+        "Expected the Retry-After delay."
+    )
+    for attempt in range(8):
+        delay = _retry_delay(rate_limit_error(), attempt)
+        backoff = min(60, 2 ** attempt)
+        assert backoff / 2 <= delay <= backoff, (
+            f"Expected a delay between {backoff / 2} and {backoff} seconds on attempt {attempt}.  "
+            f"Received {delay}"
+        )
@@ -0,0 +1,86 @@
+""" Tests for the embedding of search queries and their redis cache.
+
+Redis is replaced by an in-memory stand-in, and the OpenAI embeddings endpoint by the mock in
+`sean_gpt.routers.mock.openai`, so these run without either service.
+"""
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+from unittest.mock import patch
+import asyncio
+
+import aioredis
+
+from sean_gpt.config import settings
+from sean_gpt.routers.mock.openai import get_random_embedding_async
+from sean_gpt.util import embedding
+from sean_gpt.util.describe import describe
+from sean_gpt.util.embedding import EmbeddingCache, embed_query
+
+from ..util.fake_redis import FakeRedis
+
+def query_cache(redis_conn) -> EmbeddingCache:
+    """ Returns a query embedding cache, configured as in `get_query_embedding_cache`. """
+    return EmbeddingCache(redis_conn,
+                          max_entries=settings.app_query_embedding_cache_max_entries,
+                          ttl_seconds=settings.app_query_embedding_cache_ttl_seconds,
+                          namespace='query embedding cache')
+
+def embed_queries(cache: EmbeddingCache, queries: list) -> tuple:
+    """ Embeds queries in turn, with the given query cache.
+
+    Returns:
+        tuple: The embeddings, and the inputs sent to the embeddings endpoint.
+    """
+    inputs = []
+
+    async def create(*args, **kwargs):
+        inputs.append((kwargs['model'], kwargs['input']))
+        return await get_random_embedding_async(*args, **kwargs)
+
+    async def run():
+        return [await embed_query(query, **kwargs) for query, kwargs in queries]
+
+    with patch('openai.resources.AsyncEmbeddings.create', new=create), \
+         patch.object(embedding, '_QUERY_EMBEDDING_CACHE', cache), \
+         patch.object(embedding, '_QUERY_EMBEDDING_CLIENT', None):
+        return asyncio.run(run()), inputs
+
+@describe(
+""" Test that a repeated query, differing only in spacing, is served from the cache.
+""")
+def test_repeated_query_hits_cache():
+    embeddings, inputs = embed_queries(query_cache(FakeRedis()),
+                                       [("What is  SeanGPT?", {}), (" What is SeanGPT? ", {})])
+    assert inputs == [(settings.app_text_embedding_model, "What is SeanGPT?")], (
+        f"Expected one request for the normalized query.  Received {inputs}"
+    )
+    assert embeddings[0] == embeddings[1], "Expected the cached embedding for the repeated query."
+
+@describe(
+""" Test that the query cache is kept apart from the chunk cache, and keyed by model.
+""")
+def test_query_cache_is_namespaced():
+    redis_conn = FakeRedis()
+    _, inputs = embed_queries(query_cache(redis_conn),
+                              [("query", {}), ("query", {'model': "another model"})])
+    assert inputs == [(settings.app_text_embedding_model, "query"), ("another model", "query")], (
+        f"Expected a request for each model.  Received {inputs}"
+    )
+    chunk_cache = EmbeddingCache(redis_conn, max_entries=10)
+    cached = asyncio.run(chunk_cache.get_many(settings.app_text_embedding_model, ["query"]))
+    assert cached == [None], "Expected the chunk cache not to see the query cache's entries."
+    assert all(key.startswith('query embedding cache') for key in redis_conn.values), (
+        f"Expected only query cache keys.  Received {list(redis_conn.values)}"
+    )
+
+@describe(
+""" Test that queries are still embedded, by OpenAI, when redis is unreachable.
+""")
+def test_query_falls_back_to_openai_without_redis():
+    # Nothing listens on port 1, so every redis command fails to connect
+    unreachable = aioredis.from_url("redis://127.0.0.1:1")
+    embeddings, inputs = embed_queries(query_cache(unreachable), [("query", {}), ("query", {})])
+    assert len(inputs) == 2, f"Expected a request for each query.  Received {inputs}"
+    assert all(len(embedding) == settings.app_text_embedding_model_dim
+               for embedding in embeddings), "Expected an embedding for each query."
@@ -0,0 +1,156 @@
+""" Tests that redelivered chunks are stored and counted only once.
+
+Postgres is replaced by sqlite and milvus by a local vector store, so these run without servers.
+"""
+
+# Disable pylint flags for test fixtures:
+# pylint: disable=redefined-outer-name
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+import asyncio
+import json
+import uuid
+
+from sqlmodel import Session, select
+import numpy as np
+import pytest
+
+from sean_gpt.config import settings
+from sean_gpt.file_processing import stage_chunk2embedding
+from sean_gpt.model.file import (File, FILE_STATUS_COMPLETE, FILE_STATUS_PROCESSING,
+                                 TextFileChunkingStatus)
+from sean_gpt.util.describe import describe
+from sean_gpt.util.vector_store import LocalVectorStore
+
+from ..util.standins import StandInBroker, make_sqlite_engine
+
+@describe(
+""" Test fixture that stands in for postgres, milvus, OpenAI and the file status announcements.
+
+Yields:
+    dict: The sqlite engine, the vector store, the mock of `announce_file_status`, and the ID of a
+        file of 3 chunks whose chunking status is recorded.
+""")
+@pytest.fixture
+def pipeline(tmp_path: Path):
+    engine = make_sqlite_engine(str(tmp_path / "database.sqlite"))
+    store = LocalVectorStore(path=str(tmp_path / "vector_store"), dim=2)
+    announce_file_status = AsyncMock()
+
+    async def calculate_vector_embedding(chunks):
+        return [[float(index), 0.0] for index, _ in enumerate(chunks)]
+
+    with Session(engine) as session:
+        file_record = File(owner_id=uuid.uuid4(), default_share_set_id=uuid.uuid4(),
+                           status=FILE_STATUS_PROCESSING, name="file.txt", type="txt",
+                           hash="hash", size=100)
+        session.add(file_record)
+        session.add(TextFileChunkingStatus(file_id=file_record.id, total_chunks=3))
+        session.commit()
+        file_id = str(file_record.id)
+    with patch.object(stage_chunk2embedding, 'get_db_engine', return_value=engine), \
+         patch.object(stage_chunk2embedding, 'vector_store', store), \
+         patch.object(stage_chunk2embedding, 'calculate_vector_embedding',
+                      calculate_vector_embedding), \
+         patch.object(stage_chunk2embedding.util, 'announce_file_status', announce_file_status):
+        yield {'engine': engine, 'store': store, 'announce_file_status': announce_file_status,
+               'file_id': file_id}
+
+def make_chunks(file_id: str, chunk_locations: list, redelivered: bool = False) -> list:
+    """ Returns chunk messages, as consumed by stage 2. """
+    return [{'file_id': file_id, 'chunk_location': chunk_location,
+             'chunk_txt': f"chunk {chunk_location}", 'redelivered': redelivered}
+            for chunk_location in chunk_locations]
+
+def stored_chunk_locations(store: LocalVectorStore, file_id: str) -> list:
+    """ Returns the locations of the stored chunks of a file, with repeats. """
+    return sorted(chunk['chunk_location'] for batch in store.iter_file_chunks(file_id, 100)
+                  for chunk in batch)
+
+def chunks_processed(engine, file_id: str) -> int:
+    """ Returns the count of chunks processed of a file. """
+    with Session(engine) as session:
+        return session.exec(select(TextFileChunkingStatus.chunks_processed)
+                            .where(TextFileChunkingStatus.file_id == uuid.UUID(file_id))).one()
+
+@describe(
+""" Test that a batch redelivered after it was processed is neither stored nor counted again.
+""")
+def test_redelivered_batch_is_processed_once(pipeline: dict):
+    file_id = pipeline['file_id']
+    asyncio.run(stage_chunk2embedding.process_batch(make_chunks(file_id, [0, 400, 800])))
+    asyncio.run(stage_chunk2embedding.process_batch(
+        make_chunks(file_id, [0, 400, 800], redelivered=True)))
+
+    assert stored_chunk_locations(pipeline['store'], file_id) == [0, 400, 800], (
+        "Expected each chunk to be stored once."
+    )
+    assert chunks_processed(pipeline['engine'], file_id) == 3, "Expected each chunk counted once."
+    pipeline['announce_file_status'].assert_awaited_once_with(file_id, FILE_STATUS_COMPLETE)
+
+@describe(
+""" Test that chunks stored by a delivery that died before recording them are replaced.
+""")
+def test_redelivered_unrecorded_chunks_are_replaced(pipeline: dict):
+    file_id = pipeline['file_id']
+    asyncio.run(stage_chunk2embedding.process_batch(make_chunks(file_id, [0])))
+    # A delivery of the other chunks stored them, then died before recording them
+    pipeline['store'].insert([file_id] * 2, [400, 800],
+                             np.zeros((2, 2), dtype=np.float32), ["chunk 400", "chunk 800"])
+    asyncio.run(stage_chunk2embedding.process_batch(
+        make_chunks(file_id, [0, 400, 800], redelivered=True)))
+
+    assert stored_chunk_locations(pipeline['store'], file_id) == [0, 400, 800], (
+        "Expected each chunk to be stored once."
+    )
+    assert chunks_processed(pipeline['engine'], file_id) == 3, "Expected each chunk counted once."
+    pipeline['announce_file_status'].assert_awaited_once_with(file_id, FILE_STATUS_COMPLETE)
+
+@describe(
+""" Test that a chunk published twice in one batch is processed once.
+""")
+def test_repeated_chunk_in_batch_is_processed_once(pipeline: dict):
+    file_id = pipeline['file_id']
+    asyncio.run(stage_chunk2embedding.process_batch(make_chunks(file_id, [0, 0, 400])))
+
+    assert stored_chunk_locations(pipeline['store'], file_id) == [0, 400], (
+        "Expected each chunk to be stored once."
+    )
+    assert chunks_processed(pipeline['engine'], file_id) == 2, "Expected each chunk counted once."
+    pipeline['announce_file_status'].assert_not_awaited()
+
+@describe(
+""" Test that a batch that fails is requeued, and that its consumer carries on consuming.
+""")
+def test_failed_batch_is_requeued(pipeline: dict):
+    file_id = pipeline['file_id']
+    broker = StandInBroker()
+    attempts = 0
+
+    async def calculate_vector_embedding(chunks):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise RuntimeError("Embedding failed")
+        return [[float(index), 0.0] for index, _ in enumerate(chunks)]
+
+    async def run():
+        for chunk in make_chunks(file_id, [0, 400, 800]):
+            await broker.publish(settings.app_file_processing_stage_chunk2embedding_topic_name,
+                                 json.dumps(chunk).encode('utf-8'))
+        await stage_chunk2embedding.main(idle_timeout_sec=2, num_consumers=1)
+
+    with patch.object(stage_chunk2embedding, 'calculate_vector_embedding',
+                      calculate_vector_embedding), \
+         patch.object(stage_chunk2embedding.util, 'get_rabbitmq_channel', broker.channel):
+        asyncio.run(run())
+
+    assert attempts >= 2, f"Expected the failed batch to be retried.  Received {attempts} attempts"
+    assert stored_chunk_locations(pipeline['store'], file_id) == [0, 400, 800], (
+        "Expected each chunk to be stored once."
+    )
+    assert chunks_processed(pipeline['engine'], file_id) == 3, "Expected each chunk counted once."
+    pipeline['announce_file_status'].assert_awaited_once_with(file_id, FILE_STATUS_COMPLETE)
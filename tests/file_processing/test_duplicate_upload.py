@@ -0,0 +1,138 @@
+""" Tests for reusing the chunks of an identical, already processed upload.
+
+Postgres is replaced by sqlite and milvus by a local vector store, so these run without servers.
+"""
+
+# Disable pylint flags for test fixtures:
+# pylint: disable=redefined-outer-name
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+import asyncio
+import uuid
+
+from sqlmodel import Session, select
+import numpy as np
+import pytest
+
+from sean_gpt.file_processing import stage_txtfile2chunk
+from sean_gpt.model.file import File, FILE_STATUS_COMPLETE, TextFileChunkingStatus
+from sean_gpt.util.describe import describe
+from sean_gpt.util.vector_store import LocalVectorStore
+
+from ..util.standins import make_sqlite_engine
+
+@describe(
+""" Test fixture that stands in for postgres, milvus and the file status announcements.
+
+Yields:
+    dict: The sqlite engine, the vector store, and the mocks of `announce_file_status` and
+        `chunk_txt_file`.
+""")
+@pytest.fixture
+def pipeline(tmp_path: Path):
+    engine = make_sqlite_engine(str(tmp_path / "database.sqlite"))
+    store = LocalVectorStore(path=str(tmp_path / "vector_store"), dim=2)
+    announce_file_status = AsyncMock()
+    chunk_txt_file = AsyncMock()
+    with patch.object(stage_txtfile2chunk, 'get_db_engine', return_value=engine), \
+         patch.object(stage_txtfile2chunk, 'vector_store', store), \
+         patch.object(stage_txtfile2chunk, 'chunk_txt_file', chunk_txt_file), \
+         patch.object(stage_txtfile2chunk.util, 'announce_file_status', announce_file_status):
+        yield {'engine': engine, 'store': store, 'announce_file_status': announce_file_status,
+               'chunk_txt_file': chunk_txt_file}
+
+def add_file(engine, file_hash: str, total_chunks: int|None = None) -> File:
+    """ Adds a txt file, and its chunking status if it was processed. """
+    with Session(engine) as session:
+        file_record = File(owner_id=uuid.uuid4(), default_share_set_id=uuid.uuid4(),
+                           status=FILE_STATUS_COMPLETE, name="file.txt", type="txt",
+                           hash=file_hash, size=100)
+        session.add(file_record)
+        if total_chunks is not None:
+            session.add(TextFileChunkingStatus(file_id=file_record.id, total_chunks=total_chunks,
+                                               chunks_processed=total_chunks))
+        session.commit()
+        session.refresh(file_record)
+        return file_record
+
+@describe(
+""" Test that a re-upload copies the chunks of the processed file instead of chunking it.
+""")
+def test_duplicate_upload_clones_chunks(pipeline: dict):
+    source = add_file(pipeline['engine'], "same hash", total_chunks=2)
+    pipeline['store'].insert([str(source.id)] * 2, [0, 400],
+                             np.asarray([[0, 1], [1, 0]], dtype=np.float32), ["first", "second"])
+    duplicate = add_file(pipeline['engine'], "same hash")
+
+    asyncio.run(stage_txtfile2chunk.chunk_file(str(duplicate.id), duplicate))
+
+    pipeline['chunk_txt_file'].assert_not_awaited()
+    pipeline['announce_file_status'].assert_awaited_once_with(str(duplicate.id),
+                                                              FILE_STATUS_COMPLETE)
+    chunks = [chunk for batch in pipeline['store'].iter_file_chunks(str(duplicate.id), 10)
+              for chunk in batch]
+    assert sorted(chunk['chunk_txt'] for chunk in chunks) == ["first", "second"], (
+        f"Expected the chunks of the source file.  Received {chunks}"
+    )
+    with Session(pipeline['engine']) as session:
+        status = session.exec(select(TextFileChunkingStatus)
+                              .where(TextFileChunkingStatus.file_id == duplicate.id)).one()
+    assert status.total_chunks == status.chunks_processed == 2, (
+        f"Expected the copy to be recorded as fully processed.  Received {status}"
+    )
+
+@describe(
+""" Test that a file is chunked when the processed duplicate has no rows to copy.
+""")
+def test_duplicate_upload_without_rows_is_chunked(pipeline: dict):
+    add_file(pipeline['engine'], "same hash", total_chunks=2)
+    duplicate = add_file(pipeline['engine'], "same hash")
+
+    asyncio.run(stage_txtfile2chunk.chunk_file(str(duplicate.id), duplicate))
+
+    pipeline['chunk_txt_file'].assert_awaited_once_with(str(duplicate.id))
+    pipeline['announce_file_status'].assert_not_awaited()
+
+@describe(
+""" Test that a file with different contents is chunked.
+""")
+def test_unique_upload_is_chunked(pipeline: dict):
+    source = add_file(pipeline['engine'], "one hash", total_chunks=1)
+    pipeline['store'].insert([str(source.id)], [0], np.asarray([[0, 1]], dtype=np.float32),
+                             ["first"])
+    unique = add_file(pipeline['engine'], "another hash")
+
+    asyncio.run(stage_txtfile2chunk.chunk_file(str(unique.id), unique))
+
+    pipeline['chunk_txt_file'].assert_awaited_once_with(str(unique.id))
+
+@describe(
+""" Test that a redelivered re-upload is copied once, whether or not its earlier copy finished.
+""")
+def test_redelivered_duplicate_upload_is_cloned_once(pipeline: dict):
+    source = add_file(pipeline['engine'], "same hash", total_chunks=2)
+    pipeline['store'].insert([str(source.id)] * 2, [0, 400],
+                             np.asarray([[0, 1], [1, 0]], dtype=np.float32), ["first", "second"])
+    duplicate = add_file(pipeline['engine'], "same hash")
+    # An earlier delivery copied the first row, then died
+    pipeline['store'].insert([str(duplicate.id)], [0], np.asarray([[0, 1]], dtype=np.float32),
+                             ["first"])
+
+    for _ in range(2):
+        asyncio.run(stage_txtfile2chunk.chunk_file(str(duplicate.id), duplicate))
+
+    chunks = [chunk for batch in pipeline['store'].iter_file_chunks(str(duplicate.id), 10)
+              for chunk in batch]
+    assert sorted(chunk['chunk_txt'] for chunk in chunks) == ["first", "second"], (
+        f"Expected each chunk of the source file once.  Received {chunks}"
+    )
+    with Session(pipeline['engine']) as session:
+        statuses = session.exec(select(TextFileChunkingStatus)
+                                .where(TextFileChunkingStatus.file_id == duplicate.id)).all()
+    assert len(statuses) == 1, f"Expected the copy to be recorded once.  Received {statuses}"
+    assert pipeline['announce_file_status'].await_count == 2, (
+        "Expected the file to be announced complete on each delivery."
+    )
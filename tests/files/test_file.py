@@ -449,6 +449,76 @@ def test_file_download(sean_gpt_host: str, verified_new_user: dict, tmp_path: Pa
         f"Expected response to be 'Hello, World!'. Received response {download_response.text}"
     )
 
+@describe(
+""" Test that a file download supports byte ranges and revalidation by ETag.
+
+Args:
+    sean_gpt_host (str): The host of the SeanGPT server.
+    verified_new_user (dict): A verified new user.
+    tmp_path (Path): A temporary path.
+""")
+def test_file_download_range_and_etag(sean_gpt_host: str, verified_new_user: dict, tmp_path: Path):
+    temp_file = tmp_path / "temp.txt"
+    temp_file.write_text("Hello, World!")
+    upload_response = httpx.post(
+        f"{sean_gpt_host}/file",
+        headers={
+            "Authorization": f"Bearer {verified_new_user['access_token']}"
+        },
+        files={"file": temp_file.open("rb")}
+    ).json()
+    # Download the last 6 bytes of the file
+    range_response = httpx.get(
+        f"{sean_gpt_host}/file/download/{upload_response['id']}",
+        headers={
+            "Authorization": f"Bearer {verified_new_user['access_token']}",
+            "Range": "bytes=-6"
+        }
+    )
+    # The response should be:
+    # HTTP/1.1 206 Partial Content
+    # Content-Range: bytes 7-12/13
+    # ETag: "<file hash>"
+    # "World!"
+    assert range_response.status_code == 206, (
+        f"Expected status code 206. Received status code {range_response.status_code}"
+    )
+    assert range_response.headers['content-range'] == "bytes 7-12/13", (
+        f"Expected Content-Range 'bytes 7-12/13'. Received {range_response.headers}"
+    )
+    assert range_response.text == "World!", (
+        f"Expected response to be 'World!'. Received response {range_response.text}"
+    )
+    assert range_response.headers['etag'] == f'"{upload_response["hash"]}"', (
+        f"Expected the ETag to be the file hash. Received {range_response.headers}"
+    )
+    # Revalidate the file with its ETag
+    not_modified_response = httpx.get(
+        f"{sean_gpt_host}/file/download/{upload_response['id']}",
+        headers={
+            "Authorization": f"Bearer {verified_new_user['access_token']}",
+            "If-None-Match": range_response.headers['etag']
+        }
+    )
+    # The response should be:
+    # HTTP/1.1 304 Not Modified
+    assert not_modified_response.status_code == 304, (
+        f"Expected status code 304. Received status code {not_modified_response.status_code}"
+    )
+    # Request a range beyond the end of the file
+    unsatisfiable_response = httpx.get(
+        f"{sean_gpt_host}/file/download/{upload_response['id']}",
+        headers={
+            "Authorization": f"Bearer {verified_new_user['access_token']}",
+            "Range": "bytes=13-"
+        }
+    )
+    # The response should be:
+    # HTTP/1.1 416 Range Not Satisfiable
+    assert unsatisfiable_response.status_code == 416, (
+        f"Expected status code 416. Received status code {unsatisfiable_response.status_code}"
+    )
+
 @describe(""" Test the verified and authorized routes. """)
 def test_verified_and_authorized(verified_new_user, sean_gpt_host, tmp_path):
     # Create and upload a file
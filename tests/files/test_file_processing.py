@@ -132,6 +132,65 @@ def test_file_processing_ws( # pylint: disable=missing-function-docstring
             'status':FILE_STATUS_COMPLETE}
     ]
 
+def monitor_rejected(sean_gpt_host: str, access_token: str, file_id: str) -> bool:
+    """ Asks to monitor a file, returning whether the server closed the connection as a policy
+    violation before sending any status.
+    """
+    token = httpx.get(
+        f"{sean_gpt_host}/file/processing/token",
+        headers={"Authorization": f"Bearer {access_token}"}).json()['token']
+    with connect_ws(f"{sean_gpt_host}/file/processing/ws?token={token}".replace('http',
+                                                                                'ws')) as ws:
+        ws.send(json.dumps({
+            'action': 'monitor_file_processing',
+            'payload': {
+                'file_id': file_id
+            }
+        }))
+        try:
+            ws.recv(timeout=30)
+        except ConnectionClosed as closed:
+            return closed.rcvd is not None and closed.rcvd.code == 1008
+    return False
+
+@describe(
+""" Tests that a file ID that is not a UUID, such as a routing key wildcard, is rejected.
+
+Args:
+    sean_gpt_host (str): The host of the API.
+    verified_new_user (dict): A verified new user.
+""")
+def test_file_processing_ws_rejects_wildcards( # pylint: disable=missing-function-docstring
+        sean_gpt_host: str, verified_new_user: dict):
+    for file_id in ["#", "*", "not a uuid"]:
+        assert monitor_rejected(sean_gpt_host, verified_new_user['access_token'], file_id), (
+            f"Expected the file ID {file_id!r} to be rejected."
+        )
+
+@describe(
+""" Tests that a user cannot monitor the processing of another user's file.
+
+Args:
+    sean_gpt_host (str): The host of the API.
+    verified_new_user (dict): A verified new user, who uploads the file.
+    admin_user (dict): Another verified user.
+    tmp_path (Path): A temporary path (pytest fixture).
+""")
+def test_file_processing_ws_rejects_other_users( # pylint: disable=missing-function-docstring
+        sean_gpt_host: str, verified_new_user: dict, admin_user: dict, tmp_path: Path):
+    temp_file = tmp_path / 'test_file.txt'
+    temp_file.write_text('This is a test file.')
+    file_record = httpx.post(
+        f"{sean_gpt_host}/file",
+        headers={
+            "Authorization": f"Bearer {verified_new_user['access_token']}"
+        },
+        files={"file": temp_file.open("rb")}
+    ).json()
+    assert monitor_rejected(sean_gpt_host, admin_user['access_token'], file_record['id']), (
+        "Expected another user's file to be rejected."
+    )
+
 @describe(""" Test the verified and authorized routes. """)
 def test_verified_and_authorized(verified_new_user: dict, sean_gpt_host:str): # pylint: disable=missing-function-docstring
     check_authorized_route("GET",
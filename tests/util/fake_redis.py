@@ -0,0 +1,97 @@
+""" An in-memory stand-in for the aioredis commands used by the embedding caches.
+"""
+# The methods behave like the aioredis commands of the same names:
+# pylint: disable=missing-function-docstring
+
+from typing import Any, Dict, List
+import time
+
+class FakeRedisPipeline:
+    """ Queues commands and runs them in order on `execute`, like an aioredis pipeline. """
+    def __init__(self, redis_conn: "FakeRedis"):
+        self.redis_conn = redis_conn
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.redis_conn, name), args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> List[Any]:
+        """ Runs the queued commands and returns their results. """
+        results = [await command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+class FakeRedis:
+    """ Stores strings with optional expiry, and sorted sets, in process. """
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.expires_at: Dict[str, float] = {}
+        self.sorted_sets: Dict[str, Dict[str, float]] = {}
+
+    def _get(self, key: str) -> Any:
+        if key in self.expires_at and self.expires_at[key] <= time.monotonic():
+            del self.values[key], self.expires_at[key]
+        return self.values.get(key)
+
+    def pipeline(self, transaction: bool = True) -> FakeRedisPipeline:
+        del transaction # Commands run one at a time, so every pipeline is atomic
+        return FakeRedisPipeline(self)
+
+    async def get(self, key: str) -> Any:
+        return self._get(key)
+
+    async def mget(self, keys: List[str]) -> List[Any]:
+        return [self._get(key) for key in keys]
+
+    async def set(self, key: str, value: Any, px: int|None = None) -> bool:
+        self.values[key] = value
+        self.expires_at.pop(key, None)
+        if px is not None:
+            self.expires_at[key] = time.monotonic() + px / 1000
+        return True
+
+    async def mset(self, mapping: Dict[str, Any]) -> bool:
+        for key, value in mapping.items():
+            await self.set(key, value)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            deleted += self._get(key) is not None
+            self.values.pop(key, None)
+            self.expires_at.pop(key, None)
+        return deleted
+
+    async def zadd(self, key: str, mapping: Dict[str, float]) -> int:
+        members = self.sorted_sets.setdefault(key, {})
+        added = len(mapping.keys() - members.keys())
+        members.update(mapping)
+        return added
+
+    async def zcard(self, key: str) -> int:
+        return len(self.sorted_sets.get(key, {}))
+
+    async def zpopmin(self, key: str, count: int = 1) -> List[tuple]:
+        members = self.sorted_sets.get(key, {})
+        popped = sorted(members.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del members[member]
+        return popped
+
+    async def zremrangebyscore(self, key: str, minimum: Any, maximum: Any) -> int:
+        members = self.sorted_sets.get(key, {})
+        removed = [member for member, score in members.items()
+                   if float(minimum) <= score <= float(maximum)]
+        for member in removed:
+            del members[member]
+        return len(removed)
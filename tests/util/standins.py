@@ -0,0 +1,310 @@
+""" In-process stand-ins for the services used by the file processing pipeline.
+
+The stand-ins implement just enough of the aio_pika, minio and pymilvus interfaces for the
+pipeline stages to run unchanged, and sqlite stands in for postgres.  Each stand-in can add a fixed
+latency per call, to approximate the network round trip of the real service.  They are shared by
+the file processing tests and the pipeline benchmark.
+"""
+# Disable pylint flags for stand-ins of third-party interfaces:
+# pylint: disable=unused-argument
+# pylint: disable=too-few-public-methods
+from contextlib import asynccontextmanager
+from typing import Dict, Generator, List
+import asyncio
+import itertools
+import random
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, create_engine
+
+from sean_gpt.routers.mock.openai import get_random_embedding
+
+class StandInMessage:
+    """ A message delivered by the stand-in broker. """
+    def __init__(self, # pylint: disable=too-many-arguments
+                 channel: 'StandInChannel',
+                 body: bytes,
+                 delivery_tag: int,
+                 published_at: float,
+                 redelivered: bool = False):
+        self.channel = channel
+        self.body = body
+        self.delivery_tag = delivery_tag
+        self.published_at = published_at
+        self.redelivered = redelivered
+
+    @asynccontextmanager
+    async def process(self):
+        """ Acknowledges the message on success and requeues it on failure. """
+        try:
+            yield self
+        except BaseException:
+            await self.nack(requeue=True)
+            raise
+        await self.ack()
+
+    async def ack(self, multiple: bool = False):
+        """ Acknowledges the message, and every earlier one if `multiple`. """
+        self.channel.settle(self, multiple)
+
+    async def nack(self, requeue: bool = True):
+        """ Rejects the message, putting it back on its queue if `requeue`. """
+        # Settling forgets the queue the message came from, so look it up first
+        queue_name = self.channel.queue_names[self.delivery_tag]
+        self.channel.settle(self, False)
+        if requeue:
+            self.channel.broker.queue(queue_name).put_nowait((self.body, self.published_at, True))
+
+class StandInQueueIterator:
+    """ Delivers messages from a stand-in queue, respecting the channel's prefetch window. """
+    def __init__(self, channel: 'StandInChannel', queue_name: str):
+        self.channel = channel
+        self.queue_name = queue_name
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> StandInMessage:
+        await self.channel.wait_for_prefetch_window()
+        body, published_at, redelivered = await self.channel.broker.queue(self.queue_name).get()
+        return self.channel.deliver(self.queue_name, body, published_at, redelivered)
+
+class StandInQueue:
+    """ A queue declared on a stand-in channel. """
+    def __init__(self, channel: 'StandInChannel', name: str):
+        self.channel = channel
+        self.name = name
+
+    def iterator(self) -> StandInQueueIterator:
+        """ Returns an iterator over the messages of the queue. """
+        return StandInQueueIterator(self.channel, self.name)
+
+class StandInExchange:
+    """ The default exchange of a stand-in channel, which routes messages to the named queue. """
+    def __init__(self, broker: 'StandInBroker'):
+        self.broker = broker
+
+    async def publish(self, message, routing_key: str):
+        """ Publishes a message to the queue named by the routing key. """
+        await self.broker.publish(routing_key, message.body)
+
+class StandInChannel:
+    """ A stand-in for an aio_pika channel. """
+    def __init__(self, broker: 'StandInBroker'):
+        self.broker = broker
+        self.default_exchange = StandInExchange(broker)
+        self.prefetch_count = 0
+        self.queue_names = {}
+        self._unacked = {}
+        self._window_open = asyncio.Condition()
+        self._delivery_tags = itertools.count(1)
+
+    async def set_qos(self, prefetch_count: int):
+        """ Limits the number of unacknowledged messages delivered on the channel. """
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, name: str) -> StandInQueue:
+        """ Declares a queue on the broker. """
+        self.broker.queue(name)
+        return StandInQueue(self, name)
+
+    async def wait_for_prefetch_window(self):
+        """ Waits until another message may be delivered on the channel. """
+        async with self._window_open:
+            await self._window_open.wait_for(
+                lambda: not self.prefetch_count or len(self._unacked) < self.prefetch_count)
+
+    def deliver(self, queue_name: str, body: bytes, published_at: float,
+                redelivered: bool = False) -> StandInMessage:
+        """ Records the delivery of a message on the channel. """
+        delivery_tag = next(self._delivery_tags)
+        message = StandInMessage(self, body, delivery_tag, published_at, redelivered)
+        self._unacked[delivery_tag] = message
+        self.queue_names[delivery_tag] = queue_name
+        return message
+
+    def settle(self, message: StandInMessage, multiple: bool):
+        """ Removes a message, and every earlier one if `multiple`, from the unacked messages. """
+        tags = ([tag for tag in self._unacked if tag <= message.delivery_tag]
+                if multiple else [message.delivery_tag])
+        for tag in tags:
+            self._unacked.pop(tag, None)
+            self.queue_names.pop(tag, None)
+        asyncio.ensure_future(self._notify_window_open())
+
+    async def _notify_window_open(self):
+        async with self._window_open:
+            self._window_open.notify_all()
+
+class StandInBroker:
+    """ A stand-in for the RabbitMQ broker, holding its queues in memory.
+
+    Args:
+        latency_sec (float): The delay added to each publish.
+    """
+    def __init__(self, latency_sec: float = 0):
+        self.latency_sec = latency_sec
+        self.queues: Dict[str, asyncio.Queue] = {}
+
+    def queue(self, name: str) -> asyncio.Queue:
+        """ Returns the named queue, creating it if necessary. """
+        return self.queues.setdefault(name, asyncio.Queue())
+
+    async def publish(self, queue_name: str, body: bytes):
+        """ Puts a message on a queue. """
+        if self.latency_sec:
+            await asyncio.sleep(self.latency_sec)
+        self.queue(queue_name).put_nowait((body, time.perf_counter(), False))
+
+    @asynccontextmanager
+    async def channel(self):
+        """ Opens a channel, standing in for `file_processing.util.get_rabbitmq_channel`. """
+        yield StandInChannel(self)
+
+class StandInObject:
+    """ A synthetic text object in the stand-in object store. """
+    def __init__(self, pool: str, size: int, seed: int, latency_sec: float):
+        self.pool = pool
+        self.size = size
+        self.random = random.Random(seed)
+        self.latency_sec = latency_sec
+
+    def stream(self, amt: int) -> Generator[bytes, None, None]:
+        """ Yields the object in blocks of `amt` bytes.
+
+        Each block is a slice of the text pool at a random offset, so the chunks of a corpus are
+        almost never identical and the embedding requests are not deduplicated away.
+        """
+        remaining = self.size
+        while remaining > 0:
+            if self.latency_sec:
+                time.sleep(self.latency_sec)
+            length = min(amt, remaining)
+            offset = self.random.randrange(len(self.pool) - length)
+            yield self.pool[offset:offset + length].encode('ascii')
+            remaining -= length
+
+    def close(self):
+        """ Closes the response. """
+
+    def release_conn(self):
+        """ Releases the connection. """
+
+class StandInMinio:
+    """ A stand-in for the minio client, serving synthetic ASCII text objects.
+
+    Args:
+        latency_sec (float): The delay added to each block read.
+        pool_size (int): The size of the text pool from which the objects are sliced.
+    """
+    _WORDS = ("molten salt reactor fuel thorium uranium fluoride lithium beryllium graphite "
+              "moderator neutron flux fission product xenon decay heat loop pump vessel").split()
+
+    def __init__(self, latency_sec: float = 0, pool_size: int = 4 * 1024 * 1024):
+        self.latency_sec = latency_sec
+        self.objects: Dict[str, int] = {}
+        words = random.Random(0).choices(self._WORDS, k=pool_size // 5)
+        self.pool = ' '.join(words)[:pool_size]
+
+    def put_synthetic_object(self, object_name: str, size: int):
+        """ Adds an object of `size` bytes of synthetic text. """
+        self.objects[object_name] = size
+
+    def get_object(self, bucket_name: str, object_name: str) -> StandInObject:
+        """ Opens an object for streaming. """
+        return StandInObject(self.pool, self.objects[object_name], hash(object_name),
+                             self.latency_sec)
+
+class StandInQueryIterator:
+    """ A query iterator over no rows; stand-in collections are never queried for duplicates. """
+    def next(self) -> List[dict]:
+        """ Returns the next page of rows. """
+        return []
+
+    def close(self):
+        """ Closes the iterator. """
+
+class StandInCollection:
+    """ A stand-in for a milvus collection that counts the rows inserted into it.
+
+    Args:
+        latency_sec (float): The delay added to each insert and flush.
+    """
+    latency_sec = 0.0
+    num_rows = 0
+    num_inserts = 0
+    num_flushes = 0
+    # No index, so searches use the configured index type's parameters
+    indexes = []
+
+    def __init__(self, name: str = '', schema=None, using: str = 'default'):
+        self.name = name
+
+    def insert(self, data: list):
+        """ Inserts column-wise data. """
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        StandInCollection.num_rows += len(data[0])
+        StandInCollection.num_inserts += 1
+
+    def delete(self, expr: str):
+        """ Deletes the rows matching an expression.  The rows are not tracked, so does nothing. """
+
+    def flush(self):
+        """ Seals the growing segments. """
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        StandInCollection.num_flushes += 1
+
+    def load(self):
+        """ Loads the collection into memory. """
+
+    def query_iterator(self, **kwargs) -> StandInQueryIterator:
+        """ Iterates over the rows matching a query. """
+        return StandInQueryIterator()
+
+def standin_connect(*args, **kwargs):
+    """ Stands in for `pymilvus.connections.connect`. """
+
+def make_standin_embeddings_create(latency_sec: float = 0):
+    """ Returns a stand-in for `openai.resources.AsyncEmbeddings.create`.
+
+    The embeddings come from the mock OpenAI router, after a fixed delay per request.
+    """
+    async def create(*args, **kwargs):
+        if latency_sec:
+            await asyncio.sleep(latency_sec)
+        return get_random_embedding(*args, **kwargs)
+    return create
+
+def make_sqlite_engine(database_path: str):
+    """ Creates a sqlite engine with the application's tables, standing in for postgres.
+
+    sqlmodel stores UUIDs in sqlite as 32-character hex strings, while the pipeline's raw SQL
+    binds them as hyphenated strings, so the file_id parameters are normalized on the way in.
+    """
+    engine = create_engine(f"sqlite:///{database_path}",
+                           paramstyle="named",
+                           connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(engine, "connect")
+    def enable_wal(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def normalize_file_id( # pylint: disable=too-many-arguments
+        conn, cursor, statement, parameters, context, executemany):
+        if isinstance(parameters, dict) and isinstance(parameters.get('file_id'), str):
+            parameters = {**parameters, 'file_id': uuid.UUID(parameters['file_id']).hex}
+        return statement, parameters
+
+    SQLModel.metadata.create_all(engine)
+    return engine
@@ -0,0 +1,60 @@
+""" Tests for the local vector store backend.
+
+These run without a milvus server.
+"""
+
+# Disable pylint flags for new type of docstring:
+# pylint: disable=missing-function-docstring
+from pathlib import Path
+import asyncio
+
+import numpy as np
+
+from sean_gpt.util.describe import describe
+from sean_gpt.util.vector_store import LocalVectorStore
+
+@describe(
+""" Test that the local vector store finds the nearest chunks, and forgets deleted files.
+
+Args:
+    tmp_path (Path): A temporary path.
+""")
+def test_local_vector_store_search_and_delete(tmp_path: Path):
+    store = LocalVectorStore(path=str(tmp_path), dim=2)
+    store.insert(["file a", "file a", "file b"],
+                 [0, 1, 0],
+                 np.asarray([[0, 0], [1, 0], [0, 3]], dtype=np.float32),
+                 ["a0", "a1", "b0"])
+    hits = asyncio.run(store.search([0.9, 0], limit=2, output_fields=['file_id', 'chunk_txt']))
+    assert [hit['chunk_txt'] for hit in hits] == ["a1", "a0"], (
+        f"Expected the two chunks of file a, nearest first.  Received {hits}"
+    )
+    assert np.isclose(hits[0]['distance'], 0.01), (
+        f"Expected the squared L2 distance 0.01.  Received {hits[0]['distance']}"
+    )
+    # Another store on the same directory, such as another process, sees the rows and deletion
+    asyncio.run(LocalVectorStore(path=str(tmp_path), dim=2).delete_file("file a"))
+    hits = asyncio.run(store.search([0.9, 0], limit=2, output_fields=['file_id']))
+    assert [hit['file_id'] for hit in hits] == ["file b"], (
+        f"Expected only the chunk of file b.  Received {hits}"
+    )
+
+@describe(
+""" Test that the chunks of a file can be read back in batches, to clone them.
+
+Args:
+    tmp_path (Path): A temporary path.
+""")
+def test_local_vector_store_iter_file_chunks(tmp_path: Path):
+    store = LocalVectorStore(path=str(tmp_path), dim=2)
+    embeddings = np.arange(10, dtype=np.float32).reshape(5, 2)
+    store.insert(["file a"] * 5, list(range(5)), embeddings, [f"a{index}" for index in range(5)])
+    batches = list(store.iter_file_chunks("file a", batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1], (
+        f"Expected batches of 2, 2 and 1 chunks.  Received {batches}"
+    )
+    assert batches[2][0] == {'chunk_location': 4,
+                             'chunk_embedding': [8.0, 9.0],
+                             'chunk_txt': "a4"}, (
+        f"Expected the last chunk of file a.  Received {batches[2][0]}"
+    )